@@ -1,5 +1,7 @@
 #!/usr/bin/env python3.4
 import sys
+import collections
+import heapq
 import python_midi as midi
 
 notes = ['C  /C  ','Cis/Des','D  /D  ','Dis/Ees','E  /E  ','F  /F  ',
@@ -81,26 +83,35 @@ def calculate_scales():
         curr.insert(0,curr.pop())   # Rotate one half-tone
 
 def calculate(tracks):
+    # The notes of every track are sorted already, so merge them
+    notes = heapq.merge(*[mt.notes for mt in tracks],key=lambda n:n.at_tick)
+    return calculate_notes((n.at_tick,n.pitch,n.duration) for n in notes)
+
+def calculate_table(table):
+    # Same for a note table with tick, pitch and duration_t columns, as
+    # lib.midipack gives them. Notes are sorted by tick, ties keep the
+    # table order like the merge above.
+    tick,pitch,duration = [[int(x) for x in table[c]] for c in ('tick','pitch','duration_t')]
+    order = sorted(range(len(tick)),key=tick.__getitem__)
+    return calculate_notes((tick[i],pitch[i],duration[i]) for i in order)
+
+def calculate_notes(notes):
     global ref
 
-    # Guess the key
+    # Guess the key of (tick, pitch, duration) notes in tick order
     keys = list(ref.keys())
 
     stats = [0]*len(ref)
 
     key_ticks = []
 
-    notes = []
-    for mt in tracks:
-        notes += mt.notes
-    notes = sorted(notes,key=lambda n:n.at_tick)
-
-    fifo = []
+    fifo = collections.deque()
     for n in notes:
+        at_tick,pitch,duration = n
         if len(key_ticks) > 0:
-            key_ticks[-1][1] = n.at_tick+n.duration
+            key_ticks[-1][1] = at_tick+duration
         fifo.append(n)
-        note = n.pitch % 12
+        note = pitch % 12
         for i in range(len(ref)):
             stats[i] += ref[keys[i]][note]-1
         sm = max(stats)
@@ -109,15 +120,15 @@ def calculate(tracks):
         #if stats.count(sm) == 1:
             key = keys[stats.index(sm)]
             if len(key_ticks) == 0:
-                key_ticks.append( [0,n.at_tick,key,stats.copy()] )
+                key_ticks.append( [0,at_tick,key,stats.copy()] )
             elif key_ticks[-1][2] == key:
-                key_ticks[-1][1] = n.at_tick
+                key_ticks[-1][1] = at_tick
             else:
-                key_ticks.append( [fifo[0].at_tick,n.at_tick,key,stats.copy()] )
+                key_ticks.append( [fifo[0][0],at_tick,key,stats.copy()] )
 
             while stats.count(sm) == 1:
-                n = fifo.pop(0)
-                note = n.pitch % 12
+                n = fifo.popleft()
+                note = n[1] % 12
                 for i in range(len(ref)):
                     stats[i] -= ref[keys[i]][note]-1
                 sm = max(stats)
@@ -126,5 +137,14 @@ def calculate(tracks):
 calculate_scales()
 
 if __name__ == '__main__':
-    for c in ref:
-        print(c,ref[c])
+    if len(sys.argv) > 1:
+        # python3 -m lib.key_guess PACK...: guess the keys of every song
+        from lib.midipack import MidiPack
+        for fn in sys.argv[1:]:
+            with MidiPack(fn) as pack:
+                for song in range(len(pack)):
+                    key_ticks = calculate_table(pack.notes(song))
+                    print(pack.name(song),':',' '.join('%d-%d:%s' % (k[0],k[1],k[2].strip()) for k in key_ticks))
+    else:
+        for c in ref:
+            print(c,ref[c])
@@ -0,0 +1,135 @@
+# Latency and jitter of the software sequencer: synthetic patterns are
+# played by python_midi's Player into a sink that notes when each event
+# was handed over, and the lateness against the time every event was
+# due at its own tick is summed up.  Runs without any MIDI hardware.
+
+import time
+import math
+import asyncio
+import random
+import python_midi as midi
+
+BENCH_RESOLUTION = 480
+BENCH_BPM = 120.0
+# tempos picked for tempo changes, in bpm
+BENCH_TEMPO_RANGE = (60.0, 240.0)
+SUMMARY_KEYS = ('count', 'mean', 'p50', 'p99', 'max', 'min', 'stddev')
+
+def synthetic_pattern(density, tempo_changes=0.0, seconds=10.0, tracks=1,
+                      resolution=BENCH_RESOLUTION, seed=0):
+    # A pattern of about density notes (on and off) per second per track,
+    # at random times, and about tempo_changes changes of tempo per second
+    # in the first track.  Times are drawn in seconds and put on the
+    # tick grid by the tempo in force, so the density holds at any tempo.
+    rng = random.Random(seed)
+    tempos = [(0.0, midi.SetTempoEvent(tick=0, bpm=BENCH_BPM))]
+    if tempo_changes > 0:
+        when = rng.expovariate(tempo_changes)
+        while when < seconds:
+            tempos.append((when, midi.SetTempoEvent(bpm=rng.uniform(*BENCH_TEMPO_RANGE))))
+            when += rng.expovariate(tempo_changes)
+
+    def to_tick(when):
+        # tick of when, in seconds, under tempos
+        tick, start, mpqn = 0.0, 0.0, tempos[0][1].mpqn
+        for change, event in tempos[1:]:
+            if change > when:
+                break
+            tick += (change - start) * 1e6 / mpqn * resolution
+            start, mpqn = change, event.mpqn
+        return int(round(tick + (when - start) * 1e6 / mpqn * resolution))
+
+    pattern = midi.Pattern(resolution=resolution, tick_relative=False)
+    for index in range(tracks):
+        events = []
+        if index == 0:
+            events.extend(event.with_tick(to_tick(when)) for when, event in tempos)
+        if density > 0:
+            channel = index % 16
+            when = rng.expovariate(density / 2.0)
+            while when < seconds:
+                pitch = rng.randrange(36, 96)
+                length = rng.uniform(0.05, 0.5)
+                events.append(midi.NoteOnEvent(tick=to_tick(when), channel=channel,
+                                               pitch=pitch, velocity=rng.randrange(1, 128)))
+                events.append(midi.NoteOffEvent(tick=to_tick(when + length), channel=channel,
+                                                pitch=pitch))
+                when += rng.expovariate(density / 2.0)
+        events.sort(key=lambda event: event.tick)
+        track = midi.Track(events, tick_relative=False)
+        track.append(midi.EndOfTrackEvent(tick=events[-1].tick if events else 0))
+        pattern.append(track)
+    return pattern
+
+class ProbeSink(midi.Sink):
+    """
+    Notes the time every batch was handed over, after passing it on to
+    sink (if any), so a slow sink shows up as latency as well.
+    """
+
+    def __init__(self, sink=None, clock=time.monotonic):
+        self.sink = sink
+        self.clock = clock
+        self.records = []
+
+    def write(self, batch, due):
+        if self.sink is not None:
+            self.sink.write(batch, due)
+        self.records.append((due, self.clock(), [tick for tick, index, event in batch]))
+
+    def flush(self):
+        if self.sink is not None:
+            self.sink.flush()
+
+def percentile(values, fraction):
+    # nearest rank percentile of sorted values
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(math.ceil(fraction * len(values))) - 1))]
+
+def summary(values, scale=1e6):
+    # count, mean, p50/p99/max and standard deviation of values, in
+    # microseconds; all but the count are None without values
+    values = sorted(values)
+    if not values:
+        return {key: 0 if key == 'count' else None for key in SUMMARY_KEYS}
+    mean = sum(values) / len(values)
+    variance = sum((value - mean) ** 2 for value in values) / len(values)
+    return {'count': len(values),
+            'mean': mean * scale,
+            'p50': percentile(values, 0.5) * scale,
+            'p99': percentile(values, 0.99) * scale,
+            'max': values[-1] * scale,
+            'min': values[0] * scale,
+            'stddev': math.sqrt(variance) * scale}
+
+def measure(pattern, quantum=midi.PLAYER_QUANTUM, sink=None):
+    # Play pattern and return the lateness of every event against the
+    # time its own tick was due, in seconds, and the player's stats
+    probe = ProbeSink(sink)
+    player = midi.Player(pattern, probe, quantum)
+    began = time.monotonic()
+    batches = asyncio.run(player.play())
+    took = time.monotonic() - began
+    tick2us = player.tempomap.tick2us
+    latency = []
+    for due, delivered, ticks in probe.records:
+        latency.extend(delivered - (player.start + tick2us(tick) / 1e6) for tick in ticks)
+    # jitter: how much the lateness changes from one batch to the next
+    lateness = [delivered - due for due, delivered, ticks in probe.records]
+    jitter = [abs(b - a) for a, b in zip(lateness, lateness[1:])]
+    return latency, jitter, {'batches': batches, 'elapsed': took,
+                             'correction_us': player.correction * 1e6}
+
+def benchmark(density, tempo_changes=0.0, seconds=10.0, tracks=1, quantum=midi.PLAYER_QUANTUM,
+              seed=0, sink=None):
+    # One run, reported as a dict ready for json.dumps(); times are in
+    # microseconds
+    pattern = synthetic_pattern(density, tempo_changes, seconds, tracks, seed=seed)
+    latency, jitter, stats = measure(pattern, quantum, sink)
+    report = {'density': density, 'tempo_changes': tempo_changes, 'seconds': seconds,
+              'tracks': tracks, 'quantum_us': quantum * 1e6, 'seed': seed}
+    report.update(stats)
+    report['latency'] = summary(latency)
+    report['jitter'] = summary(jitter)
+    return report
@@ -0,0 +1,300 @@
+# A corpus pack holds many midifiles in one file: the notes MidiPiece
+# finds and the decoded events of every track, as concatenated columns
+# with an offset index per song, per track and per note track. A pack is
+# mmapped for reading, so a song's note table is sliced out in O(1)
+# without opening or parsing its midifile.
+
+import io
+import os
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+import numpy as np
+import python_midi as midi
+from lib.midipiece import MidiPiece, NOTE_COLUMNS
+
+PACK_MAGIC = b'MIDIPACK'
+# 2: duration_us follows tempo changes within a note
+PACK_VERSION = 2
+PACK_ALIGN = 64
+
+# name: dtype of every section; index sections hold one more entry than
+# there are songs / tracks / parts, with the start of each in the next
+# section and the end of the last
+PACK_SECTIONS = (
+    # per song
+    ('resolution',   '<i4'),
+    ('song_names',   '<i8'),  # index into names
+    ('song_tracks',  '<i8'),  # index into track_events
+    ('song_parts',   '<i8'),  # index into part_notes
+    ('song_tempos',  '<i8'),  # index into tempo_tick and mpqn
+    ('names',        'u1'),   # utf-8 song names, concatenated
+    # per midifile track
+    ('track_events', '<i8'),  # index into the event columns
+    # per MidiPiece track ("part"): a file track with notes
+    ('part_track',   '<i4'),  # the file track the part comes from
+    ('part_keys',    '<i8'),  # index into keys
+    ('part_notes',   '<i8'),  # index into the note columns
+    ('keys',         'u1'),   # utf-8 track keys, concatenated
+    # per note, ordered like the notes of each MidiTrack
+    ('tick',         '<i8'),
+    ('duration_t',   '<i8'),
+    ('us',           '<f8'),
+    ('duration_us',  '<f8'),
+    ('pitch',        'u1'),
+    ('velocity',     'u1'),
+    # per event, as ColumnarTrack has them; meta and sysex payloads are
+    # not packed
+    ('event_tick',   '<i8'),
+    ('status',       'u1'),
+    ('channel',      'u1'),
+    ('data1',        'u1'),
+    ('data2',        'u1'),
+    # per tempo change
+    ('tempo_tick',   '<i8'),
+    ('mpqn',         '<i4'),
+)
+
+INDEX_SECTIONS = ('song_names', 'song_tracks', 'song_parts', 'song_tempos',
+                  'track_events', 'part_keys', 'part_notes')
+# pack section and ColumnarTrack column of the event columns
+EVENT_COLUMNS = (('event_tick', 'tick'), ('status', 'status'), ('channel', 'channel'),
+                 ('data1', 'data1'), ('data2', 'data2'))
+
+def is_pack(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(PACK_MAGIC)) == PACK_MAGIC
+
+def iter_corpus(paths):
+    # (name, bytes) for every midifile in paths, which may be midifiles,
+    # zip/tar archives of them, or directories searched for both
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    name = os.path.join(root, name)
+                    if midi.is_midi_name(name) or midi.is_archive(name):
+                        yield from iter_corpus([name])
+        elif midi.is_archive(path):
+            with midi.MidiArchive(path) as archive:
+                for member, data in archive:
+                    yield path + '/' + member, data
+        else:
+            with midi.open_midifile(path) as midifile:
+                yield path, midifile.read()
+
+class PackWriter(object):
+    """
+    Writes a corpus pack one song at a time.  Each section is spooled to
+    its own temporary file next to the pack, so memory use does not grow
+    with the corpus; close() writes the header and joins the sections.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmpdir = tempfile.mkdtemp(prefix='.midipack-', dir=os.path.dirname(os.path.abspath(path)))
+        self.sections = {}
+        for name, dtype in PACK_SECTIONS:
+            self.sections[name] = [dtype, open(os.path.join(self.tmpdir, name), 'w+b'), 0]
+        for name in INDEX_SECTIONS:
+            self.write(name, [0])
+        self.songs = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, name, values):
+        section = self.sections[name]
+        values = np.asarray(values, dtype=section[0])
+        section[1].write(values.tobytes())
+        section[2] += len(values)
+
+    def count(self, name):
+        return self.sections[name][2]
+
+    def add(self, name, data, verbose=False):
+        # Add the midifile image data as song name; raises whatever
+        # reading it raises, before anything is written
+        piece = MidiPiece(io.BytesIO(data), verbose)
+        pattern = midi.read_columnar(data)
+        self.write('resolution', [piece.resolution])
+        self.write('names', bytearray(name.encode('utf-8')))
+        self.write('song_names', [self.count('names')])
+        for track in pattern:
+            for section, column in EVENT_COLUMNS:
+                self.write(section, getattr(track, column))
+            self.write('track_events', [self.count('event_tick')])
+        self.write('song_tracks', [self.count('track_events') - 1])
+        for track in piece.tracks.values():
+            for column in NOTE_COLUMNS:
+                self.write(column, [getattr(note, column) for note in track.notes])
+            self.write('part_track', [track.index])
+            self.write('keys', bytearray(track.key.encode('utf-8')))
+            self.write('part_keys', [self.count('keys')])
+            self.write('part_notes', [self.count('tick')])
+        self.write('song_parts', [self.count('part_track')])
+        tempos = sorted(piece.tempos.items())
+        self.write('tempo_tick', [tick for tick, mpqn in tempos])
+        self.write('mpqn', [mpqn for tick, mpqn in tempos])
+        self.write('song_tempos', [self.count('tempo_tick')])
+        self.songs += 1
+
+    def close(self):
+        header = {}
+        offset = 0
+        for name, dtype in PACK_SECTIONS:
+            dtype, f, count = self.sections[name]
+            header[name] = [dtype, offset, count]
+            offset += -(-f.tell() // PACK_ALIGN) * PACK_ALIGN
+        header = json.dumps(header).encode('utf-8')
+        tmp = os.path.join(self.tmpdir, 'pack')
+        with open(tmp, 'wb') as pack:
+            pack.write(PACK_MAGIC + struct.pack('<II', PACK_VERSION, len(header)) + header)
+            for name, dtype in PACK_SECTIONS:
+                pack.write(bytes(-pack.tell() % PACK_ALIGN))
+                f = self.sections[name][1]
+                f.seek(0)
+                shutil.copyfileobj(f, pack)
+        os.replace(tmp, self.path)
+        self.discard()
+
+    def discard(self):
+        for dtype, f, count in self.sections.values():
+            f.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+class MidiPack(object):
+    """
+    A corpus pack opened for reading.  Every section is a NumPy array on
+    the mmapped file, so opening is O(1) in the size of the corpus and
+    notes(), events() and piece() only slice the columns.  Songs are
+    numbered in the order they were packed; index() maps names back.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise TypeError("Not a midi pack: %s" % path)
+        if self.map[:len(PACK_MAGIC)] != PACK_MAGIC:
+            self.close()
+            raise TypeError("Not a midi pack: %s" % path)
+        version, size = struct.unpack_from('<II', self.map, len(PACK_MAGIC))
+        if version != PACK_VERSION:
+            self.close()
+            raise TypeError("Unsupported midi pack version %d: %s" % (version, path))
+        start = len(PACK_MAGIC) + 8
+        header = json.loads(self.map[start:start+size].decode('utf-8'))
+        base = -(-(start + size) // PACK_ALIGN) * PACK_ALIGN
+        self.columns = {}
+        for name, (dtype, offset, count) in header.items():
+            self.columns[name] = np.frombuffer(self.map, dtype=dtype, count=count,
+                                               offset=base + offset)
+        self.names = None
+
+    def __repr__(self):
+        return "MidiPack(%r, %d songs)" % (self.path, len(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.columns = {}
+        try:
+            self.map.close()
+        except BufferError:
+            # arrays handed out are still alive; the map goes with them
+            pass
+        self.file.close()
+
+    def __len__(self):
+        return len(self.columns['resolution'])
+
+    def span(self, name, index):
+        column = self.columns[name]
+        return int(column[index]), int(column[index + 1])
+
+    def name(self, song):
+        start, end = self.span('song_names', song)
+        return self.columns['names'][start:end].tobytes().decode('utf-8')
+
+    def index(self, name):
+        if self.names is None:
+            self.names = {self.name(song): song for song in range(len(self))}
+        return self.names[name]
+
+    def notes(self, song):
+        # the note columns of all parts of song, part after part
+        first, last = self.span('song_parts', song)
+        start, end = int(self.columns['part_notes'][first]), int(self.columns['part_notes'][last])
+        return {name: self.columns[name][start:end] for name in NOTE_COLUMNS}
+
+    def events(self, song, track):
+        # the event columns of track of song, with absolute ticks
+        first = int(self.columns['song_tracks'][song])
+        if not 0 <= track < self.span('song_tracks', song)[1] - first:
+            raise IndexError("track index out of range")
+        start, end = self.span('track_events', first + track)
+        return {column: self.columns[section][start:end]
+                for section, column in EVENT_COLUMNS}
+
+    def piece(self, song):
+        return PackedPiece(self, song)
+
+    def __iter__(self):
+        for song in range(len(self)):
+            yield self.piece(song)
+
+class PackedPart(object):
+    """The notes of one MidiTrack in a pack, as columns instead of MidiNotes."""
+
+    def __init__(self, pack, part):
+        self.index = int(pack.columns['part_track'][part])
+        start, end = pack.span('part_keys', part)
+        self.key = pack.columns['keys'][start:end].tobytes().decode('utf-8')
+        start, end = pack.span('part_notes', part)
+        self.table = {name: pack.columns[name][start:end] for name in NOTE_COLUMNS}
+
+    @property
+    def note_ct_128(self):
+        return np.bincount(self.table['pitch'], minlength=128).tolist()
+
+    @property
+    def note_ct_12(self):
+        return np.bincount(self.table['pitch'] % 12, minlength=12).tolist()
+
+class PackedPiece(object):
+    """The MidiPiece of one song in a pack; tracks holds PackedParts."""
+
+    def __init__(self, pack, song):
+        self.pack = pack
+        self.song = song
+        self.midi_fn = pack.name(song)
+        self.resolution = int(pack.columns['resolution'][song])
+        start, end = pack.span('song_tempos', song)
+        self.tempos = dict(zip(pack.columns['tempo_tick'][start:end].tolist(),
+                               pack.columns['mpqn'][start:end].tolist()))
+        self.tracks = {}
+        for part in range(*pack.span('song_parts', song)):
+            track = PackedPart(pack, part)
+            self.tracks[track.key] = track
+
+    def note_table(self):
+        return self.pack.notes(self.song)
@@ -9,6 +9,14 @@ from pprint import pprint
 # Any other messages are interpreted with musical meaning in mind,
 # so tempo info will calculate the clock-time marks for things
 
+# The events MidiTrack works with; all others are skipped by the reader
+USED_EVENTS = {midi.NoteOnEvent, midi.NoteOffEvent, midi.SetTempoEvent,
+               midi.TimeSignatureEvent, midi.TrackNameEvent,
+               midi.InstrumentNameEvent, midi.LyricsEvent}
+
+# The MidiNote attributes note_table() returns, one column each
+NOTE_COLUMNS = ('tick', 'duration_t', 'us', 'duration_us', 'pitch', 'velocity')
+
 class MidiNote(object):
     """docstring for MidiNote"""
     def __init__(self, index, track, pitch, velocity, tick, duration_t, extended=False):
@@ -28,7 +36,7 @@ class MidiNote(object):
     # add a function to change us and duration_us
     def set_us(self, tick2us):
         self.us          = tick2us(self.tick)
-        self.duration_us = tick2us(self.duration_t)
+        self.duration_us = tick2us(self.tick + self.duration_t) - self.us
 
 class MidiTrack(object):
     """docstring for MidiTrack"""
@@ -45,43 +53,36 @@ class MidiTrack(object):
         self.note_ct_12     = [0]*12
         self.tempos         = dict()
 
+        # pattern may be a Track or any iterable of events with relative
+        # ticks, e.g. one track of midi.iter_midifile(), so everything is
+        # collected in a single pass without rewriting the event ticks
+        relative = getattr(pattern, 'tick_relative', True)
+        tick = 0
+        transient = {}
+        note_i = 0
         for e in pattern:
-            if type(e) is midi.events.TrackNameEvent:
-                self.trackname = e.text
-                break
+            tick = tick + e.tick if relative else e.tick
+            if verbose:
+                print('%% Event: ',e)
 
-        for e in pattern:
-            if type(e) is midi.events.InstrumentNameEvent:
+            if type(e) is midi.events.TrackNameEvent and self.trackname is None:
+                self.trackname = e.text
+            if type(e) is midi.events.InstrumentNameEvent and self.instrument is None:
                 self.instrument = e.text
-                break
-
-        self.key = '%s_%s' % (self.trackname, self.instrument)
-        self.key = self.key.replace(' ','_')
-        
-        pattern.make_ticks_abs()
-
-        for e in pattern:
             if type(e) is midi.events.TimeSignatureEvent:
                 s = '\\numericTimeSignature\\time %d/%d' \
                             % (e.numerator,e.denominator)
-                self.time_signature[e.tick] = s
-            if type(e) is midi.events.NoteOnEvent and e.velocity > 0:
-                self.ticks_set.add(e.tick)
+                self.time_signature[tick] = s
             if type(e) is midi.events.SetTempoEvent:
-                # print("Found tempo change at tick %d to %d microseconds per quarter note" % (e.tick, e.mpqn))
-                self.tempos[e.tick] = e.mpqn
-
-        transient = {}
-        note_i = 0
-        for e in pattern:
-            if verbose:
-                print('%% Event: ',e)
+                # print("Found tempo change at tick %d to %d microseconds per quarter note" % (tick, e.mpqn))
+                self.tempos[tick] = e.mpqn
 
             if type(e) is midi.events.NoteOnEvent and e.velocity > 0:
+                self.ticks_set.add(tick)
                 if e.pitch in transient:
-                    transient[e.pitch].append(e)
+                    transient[e.pitch].append((tick, e))
                 else:
-                    transient[e.pitch] = [e]
+                    transient[e.pitch] = [(tick, e)]
 
                 self.note_ct_128[e.pitch     ] += 1
                 self.note_ct_12 [e.pitch % 12] += 1
@@ -91,17 +92,20 @@ class MidiTrack(object):
                 if e.pitch not in transient:
                     print('%% NoteOff without NoteOn: ',e)
                 else:
-                    se = transient[e.pitch].pop(0)
+                    st, se = transient[e.pitch].pop(0)
                     if len(transient[e.pitch]) == 0:
                         del transient[e.pitch]
 
-                    note = MidiNote(note_i,self,se.pitch,se.velocity,se.tick,e.tick-se.tick)
+                    note = MidiNote(note_i,self,se.pitch,se.velocity,st,tick-st)
                     self.notes.append(note)
                     note_i += 1
                     if verbose:
                         print('%% => ',note)
         if len(transient) > 0:
-            raise Exception('MIDI-File damaged: Stuck Notes detected')
+            raise TypeError('MIDI-File damaged: Stuck Notes detected')
+
+        self.key = '%s_%s' % (self.trackname, self.instrument)
+        self.key = self.key.replace(' ','_')
 
         self.notes = self.sort_notes(self.notes)
 
@@ -110,28 +114,28 @@ class MidiTrack(object):
 
 class MidiPiece(object):
     """docstring for MidiPiece"""
-    def __init__(self, midi_fn, verbose):
+    def __init__(self, midi_fn, verbose, cache=None):
         super(MidiPiece, self).__init__()
         self.midi_fn    = midi_fn
         self.tempos     = dict()
-        self.tempo2us   = dict()
         self.tracks     = {}
         self.ticks_s    = set()
         self.ticks_l    = []
 
-        # read the file into the pattern and get the resolution
-        try:
-            pattern = midi.read_midifile(midi_fn)
-        except TypeError as e:
-            print('Cannot read "%s" as midifile' % midi_fn)
-            print('Exception says: %s' % e)
-            sys.exit(2)
-        self.resolution = pattern.resolution
+        # stream the file track by track and get the resolution, or take
+        # the decoded tracks from a midi.PatternCache if one is given;
+        # a file that is no midifile raises TypeError
+        if cache is None:
+            stream = midi.iter_midifile(midi_fn, keep=USED_EVENTS)
+            tracks = stream.tracks()
+        else:
+            stream = cache.read_midifile(midi_fn, keep=USED_EVENTS)
+            tracks = enumerate(stream)
+        self.resolution = stream.resolution
         
-        # read each track of the pattern and try to get all the notes and tempos
-        index = 0
-        for p in pattern:
-            track = MidiTrack(index, p, verbose)
+        # read each track of the stream and try to get all the notes and tempos
+        for index, events in tracks:
+            track = MidiTrack(index, events, verbose)
             if (track.key not in self.tracks) and track.notes:
                 # print("Found %d notes in track %d" % (len(track.notes), index))
                 # put all ticks into ticks set
@@ -143,36 +147,25 @@ class MidiPiece(object):
                 self.tempos.update(track.tempos)
             # else:
             #     print("No notes found in track %d" % index)
-            index += 1
         self.ticks_l = sorted(list(self.ticks_s))
         
-        # populate the tempo conversion dictionary
-        if self.tempos:
-            tempoticks = sorted(list(self.tempos.keys()))
-            tempoticks.append(self.ticks_l[-1])
-            
-            # up to the tick, add microseconds together
-            us_ct = 0
-            pr_tick = tempoticks[0]
-            for i in range(1, len(tempoticks)):
-                tick = tempoticks[i]
-                self.tempo2us[pr_tick] = us_ct
-                us_ct += (tick - pr_tick)*self.tempos[pr_tick]
-                pr_tick = tick
-
-        # convert all notes to microseconds
-        for t in self.tracks:
-            # print("Track %s" % t)
-            # print("at tick %d is " % self.tracks[t].notes[200].tick)
-            # print(self.tick2us(self.tracks[t].notes[200].tick))
-            for n in self.tracks[t].notes:
-                n.set_us(self.tick2us)
+        # the tempo changes with the time each one starts at, and the
+        # times of all notes converted at once
+        self.tempomap = midi.TempoMap(self, [midi.SetTempoEvent(tick=tick, mpqn=self.tempos[tick])
+                                             for tick in sorted(self.tempos)])
+        # a duration is the time from start to end of the note, so a
+        # tempo change while it sounds is taken into account
+        notes = [n for t in self.tracks for n in self.tracks[t].notes]
+        times = self.tempomap.ticks2us([n.tick for n in notes] +
+                                       [n.tick + n.duration_t for n in notes])
+        for n, n_us, n_end_us in zip(notes, times[:len(notes)], times[len(notes):]):
+            n.us          = float(n_us)
+            n.duration_us = float(n_end_us) - n.us
+
+    def note_table(self):
+        # the notes of all tracks as columns, track after track
+        notes = [n for t in self.tracks for n in self.tracks[t].notes]
+        return {name: [getattr(n, name) for n in notes] for name in NOTE_COLUMNS}
 
     def tick2us(self, tick):
-        default_MIDI_tempo = 500000
-        tempoticks = sorted([t for t in self.tempos.keys() if t < tick])
-        last = 0
-        if tempoticks:
-            last = tempoticks[-1]    
-            return (self.tempo2us[last] + (tick - last)*self.tempos[last])/float(self.resolution)
-        return tick*default_MIDI_tempo/float(self.resolution)
+        return self.tempomap.tick2us(tick)
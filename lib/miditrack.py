@@ -1,4 +1,26 @@
+import bisect
+import collections
+import heapq
+import itertools
 import python_midi   as midi
+import lib.lilypond  as lilypond
+
+# The events MidiTrack works with. Reading with keep=USED_EVENTS lets the
+# reader skip controllers, pitch wheel, sysex etc. without decoding them.
+USED_EVENTS = {midi.NoteOnEvent, midi.NoteOffEvent, midi.TimeSignatureEvent,
+               midi.TrackNameEvent, midi.InstrumentNameEvent, midi.LyricsEvent}
+
+def split_head(events):
+    # Split events into a list up to and including the first note and an
+    # iterator over the rest. Track and instrument names come before the
+    # notes, so the head is all that is needed to identify a track.
+    events = iter(events)
+    head = []
+    for e in events:
+        head.append(e)
+        if isinstance(e,midi.events.NoteEvent):
+            break
+    return head,events
 
 class MidiNote(object):
     count = 0
@@ -28,6 +50,7 @@ class MidiTrack(object):
     ticks_set      = set()
     ticks          = []
     bars           = []     # List of tuples (start tick,end tick)
+    bar_starts     = []     # Start tick of every bar, for bisect
     resolution     = None   # Ticks per quarter note
     time_signature = {}
     repeats        = []     # Tuples: bar list, delta, skip, repeat, type
@@ -43,6 +66,16 @@ class MidiTrack(object):
         while st < max_tick:
             cls.bars.append( (st,st+4*cls.resolution-1) )
             st += 4*cls.resolution
+        cls.bar_starts = [bs for bs,be in cls.bars]
+
+    @classmethod
+    def bar_at(cls,tick):
+        # Index of the bar tick falls into, or -1. The bars follow each
+        # other in order, so a bisect on the start ticks finds it in
+        # O(log n) instead of scanning all bars.
+        if len(cls.bar_starts) != len(cls.bars):
+            cls.bar_starts = [bs for bs,be in cls.bars]
+        return bisect.bisect_right(cls.bar_starts,tick)-1
 
     @classmethod
     def get_bar_decorators_with_repeat(cls,key_list):
@@ -118,39 +151,46 @@ class MidiTrack(object):
 
         # Add time signatures
         for tick in cls.time_signature:
-            for i in range(len(cls.bars)):
-                bs,be = cls.bars[i]
-                if bs <= tick and tick < be:
-                    deco = bar_deco[i]
-                    deco['timesig'] = cls.time_signature[tick]
-                    break
+            i = cls.bar_at(tick)
+            if i >= 0 and tick < cls.bars[i][1]:
+                deco = bar_deco[i]
+                deco['timesig'] = cls.time_signature[tick]
 
         # Tuples with (starttick,endtick,key,stats)
         for stick,etick,key,stats in key_list:
-            for i in range(len(cls.bars)):
-                bs,be = cls.bars[i]
-                if bs <= stick and stick < be:
-                    deco = bar_deco[i]
-                    deco['key'] = '\\key ' + key.lower()
-                    break
+            i = cls.bar_at(stick)
+            if i >= 0 and stick < cls.bars[i][1]:
+                deco = bar_deco[i]
+                deco['key'] = '\\key ' + key.lower()
 
         return bar_deco
 
+    @staticmethod
+    def track_key(trackname,instrument):
+        key = '%s_%s' % (trackname,instrument)
+        return key.replace(' ','_')
+
     def __new__(self,pattern,verbose):
+        # pattern may be a Track or any iterable of events with relative
+        # ticks, e.g. one track of midi.iter_midifile(). Only the events
+        # up to the first note are looked at for the names.
+        head,rest = split_head(pattern)
         trackname = None
-        for e in pattern:
-            if type(e) is midi.events.TrackNameEvent:
-                trackname = e.text
-                break
-
         instrument = None
-        for e in pattern:
-            if type(e) is midi.events.InstrumentNameEvent:
+        for e in head:
+            if trackname is None and type(e) is midi.events.TrackNameEvent:
+                trackname = e.text
+            if instrument is None and type(e) is midi.events.InstrumentNameEvent:
                 instrument = e.text
-                break
 
-        key = '%s_%s' % (trackname,instrument)
-        key = key.replace(' ','_')
+        instance = MidiTrack.instance_for(trackname,instrument,verbose)
+        instance.pending = itertools.chain(head,rest)
+        return instance
+
+    @classmethod
+    def instance_for(cls,trackname,instrument,verbose):
+        # The track with these names, created on first use
+        key = MidiTrack.track_key(trackname,instrument)
         if key in MidiTrack.tracks:
             return MidiTrack.tracks[key]
 
@@ -164,10 +204,15 @@ class MidiTrack(object):
         instance.notecount_128  = [0]*128
         instance.notecount_12   = [0]*12
         instance.notes          = []
+        instance.note_index     = None
         instance.output         = False
         instance.output_piano   = False
         instance.output_drums   = False
         instance.output_voice   = False
+        instance.output_lyrics  = False
+        instance.lyrics         = []     # lyric events are not collected
+        instance.pending        = None
+        instance.cache_keys     = []
         MidiTrack.tracks[key]   = instance
         MidiTrack.tracklist.append(instance)
         return instance
@@ -177,57 +222,142 @@ class MidiTrack(object):
         # with same track and instrument name.
         # Reason:
         #    Logic Pro X puts regions in a track into separate midi patterns
-        pattern.make_ticks_abs()
-
-        # Get time signature from track
-        for e in pattern:
-            if type(e) is midi.events.TimeSignatureEvent:
-                s = '\\numericTimeSignature\\time %d/%d' \
-                            % (e.numerator,e.denominator)
-                MidiTrack.time_signature[e.tick] = s
-
-        # Collect all ticks in class variable ticks for all tracks
-        for e in pattern:
-            if type(e) is midi.events.NoteOnEvent and e.velocity > 0:
-                MidiTrack.ticks_set.add(e.tick)
-        MidiTrack.ticks=sorted(list(MidiTrack.ticks_set))
+        events,self.pending = self.pending,None
+        relative = getattr(pattern,'tick_relative',True)
 
+        # Single pass over the events, so a streamed track is never held
+        # in memory. Absolute ticks are summed up here instead of
+        # rewriting the events.
         # Logic Pro X seldom uses NoteOff but NoteOn with velocity zero instead
         transient = {}
-        for e in pattern:
+        notes = []
+        time_signature = {}
+        tick = 0
+        for e in events:
+            tick = tick + e.tick if relative else e.tick
             if verbose:
                 print('%% Event: ',e)
 
+            # Get time signature from track
+            if type(e) is midi.events.TimeSignatureEvent:
+                s = '\\numericTimeSignature\\time %d/%d' \
+                            % (e.numerator,e.denominator)
+                time_signature[tick] = s
+
             if type(e) is midi.events.NoteOnEvent and e.velocity > 0:
                 if e.pitch in transient:
-                    transient[e.pitch].append(e)
+                    transient[e.pitch].append((tick,e))
                 else:
-                    transient[e.pitch] = [e]
-
-                self.notecount_128[e.pitch     ] += 1
-                self.notecount_12 [e.pitch % 12] += 1
+                    transient[e.pitch] = [(tick,e)]
 
             if type(e) is midi.events.NoteOnEvent and e.velocity == 0 \
                     or type(e) is midi.events.NoteOffEvent:
                 if e.pitch not in transient:
                     print('%% NoteOff without NoteOn: ',e)
                 else:
-                    se = transient[e.pitch].pop(0)
+                    st,se = transient[e.pitch].pop(0)
                     if len(transient[e.pitch]) == 0:
                         del transient[e.pitch]
 
-                    note = MidiNote(self,se.pitch,se.velocity,se.tick,e.tick-se.tick)
-                    self.notes.append(note)
+                    note = MidiNote(self,se.pitch,se.velocity,st,tick-st)
+                    notes.append(note)
                     if verbose:
                         print('%% => ',note)
         if len(transient) > 0:
             raise Exception('MIDI-File damaged: Stuck Notes detected')
+        self.add_notes(notes,time_signature)
+
+    def add_notes(self,notes,time_signature):
+        # Add the paired notes and time signatures of one midi track.
+        # They are kept in last_added, e.g. for a midi2ly track cache.
+        self.last_added = (notes,time_signature)
+        MidiTrack.time_signature.update(time_signature)
+        ticks = sorted(n.at_tick for n in notes)
+        for n in notes:
+            self.notecount_128[n.pitch     ] += 1
+            self.notecount_12 [n.pitch % 12] += 1
+        # Collect all ticks in class variable ticks for all tracks
+        MidiTrack.ticks_set.update(ticks)
+        # The note ticks of a track come in time order: merge them into
+        # the sorted ticks of all tracks instead of sorting them again
+        merged = heapq.merge(MidiTrack.ticks,ticks)
+        MidiTrack.ticks=[t for t,_ in itertools.groupby(merged)]
+        self.notes = self.sort_notes(self.notes+notes)
+
+    @classmethod
+    def restore(cls,trackname,instrument,notes,time_signature,verbose):
+        # Track with the notes of one midi track added without decoding
+        # it, from (pitch,velocity,at_tick,duration) tuples
+        mt = cls.instance_for(trackname,instrument,verbose)
+        mt.add_notes([MidiNote(mt,*n) for n in notes],time_signature)
+        return mt
 
-        self.notes = self.sort_notes(self.notes)
+    def note_state(self):
+        return [(n.pitch,n.velocity,n.at_tick,n.duration,n.extended) for n in self.notes]
+
+    def set_note_state(self,state):
+        # Replace the notes by note_state() tuples from an earlier run
+        self.notes = [MidiNote(self,*n) for n in state]
+        self.note_index = None
 
     def sort_notes(self,notes):
         return sorted(notes,key=lambda n:n.at_tick+n.pitch/1000)
 
+    def slice_ticks(self,start,end):
+        # Notes with start <= at_tick < end in O(log n + k). The notes are
+        # sorted by at_tick; the index of their ticks is rebuilt whenever
+        # self.notes is replaced or changes length.
+        index = self.note_index
+        if index is None or index[0] is not self.notes or len(index[1]) != len(self.notes):
+            index = self.note_index = (self.notes,[n.at_tick for n in self.notes])
+        lo = bisect.bisect_left(index[1],start)
+        hi = bisect.bisect_left(index[1],end,lo)
+        return self.notes[lo:hi]
+
+    def create_bar_lily_notes(self):
+        # One lilypond string per bar in bar_lily_notes, from the notes
+        # after trim_notes(), split_same_time_notes_to_same_length() and
+        # split_notes_at_bar(). Each bar only looks at its own notes. A
+        # staff holds one voice, so a note still sounding when the next
+        # one starts is cut short.
+        fulltick = 4*MidiTrack.resolution
+        names = lilypond.PERC if self.output_drums else None
+        self.bar_lily_notes = []
+        for bs,be in MidiTrack.bars:
+            chords = [list(g) for _,g in itertools.groupby(self.slice_ticks(bs,be+1),
+                                                          key=lambda n:n.at_tick)]
+            lily = []
+            tick = bs
+            for i,chord in enumerate(chords):
+                start = chord[0].at_tick
+                end = min(start+chord[0].duration,be+1)
+                if i+1 < len(chords):
+                    end = min(end,chords[i+1][0].at_tick)
+                if start > tick:
+                    lily.append(self.lily_duration('r',tick,be,start-tick,fulltick,False))
+                pitches = [self.lily_pitch(n.pitch,names) for n in chord]
+                name = pitches[0] if len(pitches) == 1 else '<%s>' % ' '.join(pitches)
+                tie = chord[0].extended and end == start+chord[0].duration
+                lily.append(self.lily_duration(name,start,be,end-start,fulltick,True,tie))
+                tick = end
+            if tick <= be:
+                lily.append(self.lily_duration('r',tick,be,be+1-tick,fulltick,False))
+            self.bar_lily_notes.append(' '.join(lily))
+
+    @staticmethod
+    def lily_pitch(pitch,names=None):
+        if names is not None:
+            return names.get(pitch,'sn')
+        while pitch >= len(lilypond.NOTE):
+            pitch -= 12
+        return lilypond.NOTE[pitch]
+
+    @staticmethod
+    def lily_duration(name,tick,be,dt,fulltick,tied,tie=False):
+        durations,_ = lilypond.select_duration(tick,be+1,dt,fulltick)
+        join = '~ ' if tied else ' '
+        return join.join(name+d for d in durations) + ('~' if tie else '')
+
     def advise_treble(self): # useful for piano to select bass or treble
         s_bass   = sum(self.notecount_128[:60])
         s_treble = sum(self.notecount_128[60:])
@@ -248,6 +378,8 @@ class MidiTrack(object):
                 n.duration += dt
             if n.duration == 0:
                 n.duration = res
+        # at_tick has changed in place
+        self.note_index = None
 
     def split_same_time_notes_to_same_length(self):
         active   = []
@@ -272,19 +404,20 @@ class MidiTrack(object):
 
     def split_notes_at_bar(self):
         newnotes = []
-        while(len(self.notes)) > 0:
-            n = self.notes.pop(0)
+        notes = collections.deque(self.notes)
+        while(len(notes)) > 0:
+            n = notes.popleft()
             newnotes.append(n)
-            for bs,be in MidiTrack.bars:
-                if bs <= n.at_tick and be > n.at_tick:
-                    if n.at_tick+n.duration-1 > be:
-                        dt = n.at_tick + n.duration - (be + 1)
-                        np = MidiNote(n.track,n.pitch,n.velocity,be+1,dt,False)
-                        print('%% split note %s by %d ticks at bar %d-%d ticks: %s' % (n,dt,bs,be,np))
-                        self.notes.append(np)
-                        n.duration -= dt
-                        n.extended = True
-                    break
+            i = MidiTrack.bar_at(n.at_tick)
+            if i >= 0 and MidiTrack.bars[i][1] > n.at_tick:
+                bs,be = MidiTrack.bars[i]
+                if n.at_tick+n.duration-1 > be:
+                    dt = n.at_tick + n.duration - (be + 1)
+                    np = MidiNote(n.track,n.pitch,n.velocity,be+1,dt,False)
+                    print('%% split note %s by %d ticks at bar %d-%d ticks: %s' % (n,dt,bs,be,np))
+                    notes.append(np)
+                    n.duration -= dt
+                    n.extended = True
         self.notes = self.sort_notes(newnotes)
 
     def __str__(self):
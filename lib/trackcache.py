@@ -0,0 +1,99 @@
+import io
+import os
+import sys
+import json
+import hashlib
+import contextlib
+import python_midi   as midi
+from   lib.miditrack import MidiTrack
+
+# bump whenever MidiTrack changes what a step computes
+TRACK_CACHE_VERSION = 1
+
+class TrackCache(midi.FileCache):
+    """
+    Per track results of midi2ly, keyed on the SHA-256 of the MTrk chunks
+    they come from.  When a song is exported again with only some tracks
+    changed, the notes of the unchanged ones are restored without
+    decoding their chunks, and the trim, split and LilyPond steps are
+    not run for them again; only the steps over all tracks are.  What a step printed
+    is stored with it and printed again on a hit, so the output does not
+    change.  Entries are small JSON files in the tracks subdirectory of
+    a PatternCache directory, evicted the same way.
+    """
+
+    suffix = '.json'
+
+    def __init__(self, directory=None, max_size=midi.DEFAULT_CACHE_SIZE):
+        super(TrackCache, self).__init__(directory, max_size)
+        self.directory = os.path.join(self.directory, 'tracks')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return "TrackCache(%r, max_size=%r)" % (self.directory, self.max_size)
+
+    def key(self, *parts):
+        digest = hashlib.sha256(b'midi2ly tracks %d\0' % TRACK_CACHE_VERSION)
+        for part in parts:
+            part = part if isinstance(part, bytes) else repr(part).encode('utf-8')
+            digest.update(b'%d\0' % len(part))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def load(self, key):
+        return self.read(key, json.load, ValueError, 'r')
+
+    def store(self, key, entry):
+        self.write(key, lambda f: json.dump(entry, f), 'w')
+
+    @contextlib.contextmanager
+    def capture(self):
+        # collect what is printed, to be stored and printed again on a hit
+        log = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(log):
+                yield log
+        finally:
+            sys.stdout.write(log.getvalue())
+
+    def add_track(self, pattern, index, verbose):
+        # MidiTrack(pattern[index]) for a LazyPattern, with the paired
+        # notes of the chunk taken from the cache when it is unchanged
+        key = self.key('pair', verbose, pattern.chunk(index))
+        entry = self.load(key)
+        if entry is None:
+            with self.capture() as log:
+                mt = MidiTrack(pattern[index], verbose)
+            notes, time_signature = mt.last_added
+            self.store(key, {'log': log.getvalue(),
+                             'trackname': mt.trackname,
+                             'instrument': mt.instrument,
+                             'notes': [(n.pitch, n.velocity, n.at_tick, n.duration) for n in notes],
+                             'time_signature': sorted(time_signature.items())})
+        else:
+            sys.stdout.write(entry['log'])
+            mt = MidiTrack.restore(entry['trackname'], entry['instrument'],
+                                   entry['notes'], dict(entry['time_signature']), verbose)
+        mt.cache_keys.append(key)
+        return mt
+
+    def run(self, mt, step, *methods, depends=(), attrs=()):
+        # Call methods of mt in order, or restore the notes and the
+        # attributes named in attrs they left the last time they ran on
+        # the same chunks.  depends is whatever else the result depends
+        # on, e.g. the bars.
+        key = self.key(step, MidiTrack.resolution, mt.cache_keys, *depends)
+        entry = self.load(key)
+        if entry is not None:
+            sys.stdout.write(entry['log'])
+            mt.set_note_state(entry['notes'])
+            for name, value in entry.get('attrs', {}).items():
+                setattr(mt, name, value)
+        else:
+            with self.capture() as log:
+                for method in methods:
+                    method()
+            self.store(key, {'log': log.getvalue(), 'notes': mt.note_state(),
+                             'attrs': {name: getattr(mt, name) for name in attrs}})
+        # later steps depend on this one
+        mt.cache_keys.append(key)
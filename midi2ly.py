@@ -13,32 +13,57 @@ import python_midi   as midi
 import lib.lilypond  as lilypond
 import lib.key_guess as key_guess
 from   lib.miditrack import *
+from   lib.trackcache import TrackCache
 
 parser = argparse.ArgumentParser(description= \
         'Read MIDI file and output some spectrograms')
 parser.add_argument('-t', nargs=1, dest='title',    help='Title of the song')
 parser.add_argument('-c', nargs=1, dest='composer', help='Composer of the song')
 parser.add_argument('-v', action='store_true', dest='verbose', help='Include verbose information in output')
+parser.add_argument('-l', action='store_true', dest='list', help='List tracks in the midifile')
+parser.add_argument('-D', nargs='*', dest='drum_list',   default=[], metavar='N', help='Tracks (numbers as listed by -l) to output as drums')
+parser.add_argument('-V', nargs='*', dest='voice_list',  default=[], metavar='N', help='Tracks to output as voice')
+parser.add_argument('-P', nargs='*', dest='piano_list',  default=[], metavar='N', help='Tracks to output as piano')
+parser.add_argument('-C', dest='cache', metavar='DIR', help='Cache the results of every track in DIR, so only changed tracks are processed again')
 parser.add_argument('midifile', help='Midifile to be processed')
 args = parser.parse_args()
 
 midifile = args.midifile
+title    = args.title[0]    if args.title    else ''
+composer = args.composer[0] if args.composer else ''
 try:
-    pattern = midi.read_midifile(midifile)
+    # tracks are only decoded when they are first used
+    pattern = midi.read_midifile(midifile, lazy=True, keep=USED_EVENTS)
 except TypeError as e:
     print('Cannot read "%s" as midifile' % args.midifile)
     print('Exception says: %s' % e)
     sys.exit(2)
 
-MidiTrack.resolution = pattern.resolution
-for p in pattern:
-    mt = MidiTrack(p,args.verbose)
-
 if args.list:
-    for mt in MidiTrack.tracklist:
-        print(mt.index,':',mt)
+    # Names are read from the start of each track chunk, so listing
+    # never decodes any events. Tracks with the same name and instrument
+    # are merged like MidiTrack does.
+    keys = []
+    for i in range(len(pattern)):
+        trackname,instrument = pattern.track_names(i)
+        key = MidiTrack.track_key(trackname,instrument)
+        if key not in keys:
+            keys.append(key)
+            print(len(keys),':','Track(%s,%s)' % (trackname,instrument))
     sys.exit(0)
 
+# Stream the tracks into MidiTrack instead of decoding the whole pattern.
+# With a cache directory, only the tracks whose chunk has changed since
+# the last run are decoded and processed.
+MidiTrack.resolution = pattern.resolution
+trackcache = TrackCache(args.cache) if args.cache else None
+if trackcache is not None:
+    for index in range(len(pattern)):
+        mt = trackcache.add_track(pattern,index,args.verbose)
+else:
+    for index,events in midi.iter_midifile(midifile,keep=USED_EVENTS).tracks():
+        mt = MidiTrack(events,args.verbose)
+
 for mt in MidiTrack.tracklist:
     n = '%d' % mt.index
     if n in args.drum_list:
@@ -50,23 +75,26 @@ for mt in MidiTrack.tracklist:
     if n in args.piano_list:
         mt.output        = True
         mt.output_piano  = True
-    if n in args.lyrics_list:
-        mt.output        = True
-        mt.output_lyrics = True
-    mt.trim_notes()
-    mt.trim_lyrics()
-    mt.split_same_time_notes_to_same_length()
+    if trackcache is not None:
+        trackcache.run(mt,'trim',mt.trim_notes,mt.split_same_time_notes_to_same_length)
+    else:
+        mt.trim_notes()
+        mt.split_same_time_notes_to_same_length()
 
 MidiTrack.fill_bars()
 print('%% ',MidiTrack.bars)
 print('%% ',len(MidiTrack.bars))
 for mt in MidiTrack.tracklist:
-    mt.split_notes_at_bar()
+    if trackcache is not None:
+        trackcache.run(mt,'bars',mt.split_notes_at_bar,depends=(MidiTrack.bars,))
+    else:
+        mt.split_notes_at_bar()
 
 key_tracks = [ mt for mt in MidiTrack.tracklist if mt.output_piano or mt.output_voice]
 # Tuples with (starttick,endtick,key,stats)
 key_list = key_guess.calculate(key_tracks)
 print('%% KEYS: ',key_list)
+bar_deco = MidiTrack.get_bar_decorators_with_repeat(key_list)
 
 if False:
     del_silence = True
@@ -80,6 +108,14 @@ if False:
                 bars[k].pop(0)
 
 
+for mt in MidiTrack.tracklist:
+    if mt.output:
+        if trackcache is not None:
+            trackcache.run(mt,'lily',mt.create_bar_lily_notes,
+                           depends=(MidiTrack.bars,mt.output_drums),attrs=('bar_lily_notes',))
+        else:
+            mt.create_bar_lily_notes()
+
 # RECREATE in lilypond format
 print('\\version "2.18.2"')
 print('\\header {')
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3.5
+
+# Measure how late the software sequencer delivers events: synthetic
+# patterns are played into a loopback sink (or an ALSA port) and the
+# latency and jitter are printed as JSON, in microseconds
+
+import sys
+sys.path.append('python_midi')
+import json
+import argparse
+import python_midi   as midi
+from   lib.latency  import benchmark
+
+parser = argparse.ArgumentParser(description= \
+        'Benchmark the latency and jitter of the midi player')
+parser.add_argument('-d', type=float, nargs='+', dest='density', default=[100.0], metavar='N', help='Notes (on and off events) per second and track; several values for a sweep')
+parser.add_argument('-T', type=float, nargs='+', dest='tempo_changes', default=[0.0], metavar='N', help='Tempo changes per second; several values for a sweep')
+parser.add_argument('-s', type=float, dest='seconds', default=10.0, help='Length of every pattern in seconds')
+parser.add_argument('-n', type=int, dest='tracks', default=1, help='Number of tracks')
+parser.add_argument('-q', type=float, dest='quantum', default=midi.PLAYER_QUANTUM*1000, help='Batching quantum of the player in milliseconds')
+parser.add_argument('-r', type=int, dest='seed', default=0, help='Seed of the random patterns')
+parser.add_argument('-a', nargs=2, type=int, dest='alsa', metavar=('CLIENT', 'PORT'), help='Also send the events to this ALSA sequencer port (to the stand-in binding with PYTHON_MIDI_ALSA_STUB=1)')
+parser.add_argument('-o', dest='output', help='Write the JSON report to this file')
+args = parser.parse_args()
+
+sink = None
+if args.alsa:
+    from python_midi.sequencer_alsa.sequencer import SequencerWrite
+    seq = SequencerWrite()
+    seq.subscribe_port(*args.alsa)
+    sink = midi.AlsaSink(seq)
+
+runs = []
+for density in args.density:
+    for tempo_changes in args.tempo_changes:
+        runs.append(benchmark(density, tempo_changes, args.seconds, args.tracks,
+                              args.quantum / 1000.0, args.seed, sink))
+        latency = runs[-1]['latency']
+        if latency['count']:
+            print('%g notes/s, %g tempo changes/s: p50 %.0fus p99 %.0fus max %.0fus' % \
+                    (density, tempo_changes, latency['p50'], latency['p99'], latency['max']),
+                  file=sys.stderr)
+        else:
+            print('%g notes/s, %g tempo changes/s: no events played' % (density, tempo_changes),
+                  file=sys.stderr)
+
+report = json.dumps(runs, indent=2)
+if args.output:
+    with open(args.output, 'w') as f:
+        f.write(report + '\n')
+else:
+    print(report)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3.5
+
+# Pack a corpus of midifiles into one file, which midiplot.py and
+# lib/key_guess.py read without parsing any midifile again
+
+import sys
+sys.path.append('python_midi')
+import argparse
+import python_midi   as midi
+from   lib.midipack import PackWriter, MidiPack, iter_corpus
+
+parser = argparse.ArgumentParser(description= \
+        'Pack midifiles into a corpus pack for batch jobs')
+parser.add_argument('-v', action='store_true', dest='verbose', help='Include verbose information in output')
+parser.add_argument('-l', action='store_true', dest='list', help='List the songs in the pack instead')
+parser.add_argument('pack', help='Pack file to be written (or listed)')
+parser.add_argument('sources', nargs='*', help='Midifiles, zip/tar archives or directories of them')
+args = parser.parse_args()
+
+if args.list:
+    with MidiPack(args.pack) as pack:
+        for song in range(len(pack)):
+            piece = pack.piece(song)
+            print(song, ':', piece.midi_fn, '(%d notes in %d tracks)' \
+                    % (len(piece.note_table()['tick']), len(piece.tracks)))
+    sys.exit(0)
+
+skipped = 0
+with PackWriter(args.pack) as writer:
+    for name, data in iter_corpus(args.sources):
+        if args.verbose:
+            print('packing ' + name)
+        try:
+            writer.add(name, data)
+        except TypeError as e:
+            # no midifile at all, or a damaged one
+            print('Skipping "%s": %s' % (name, e))
+            skipped += 1
+print('%d songs packed into %s, %d skipped' % (writer.songs, args.pack, skipped))
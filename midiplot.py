@@ -5,7 +5,7 @@
 # from https://github.com/gin66/midi2ly/
 
 
-import sys, os
+import sys, os, io
 sys.path.append('python_midi')
 import argparse
 import re
@@ -15,6 +15,7 @@ import matplotlib
 import matplotlib.pyplot as plt
 from   lib.midipiece import *
 from   lib.key_guess import notes as notenames
+from   lib.midipack  import MidiPack, is_pack
 
 font = {'family' : 'normal',
         'weight' : 'bold',
@@ -26,23 +27,47 @@ matplotlib.rc('font', **font)
 parser = argparse.ArgumentParser(description= \
         'Read MIDI file and output some spectrograms')
 parser.add_argument('-v', action='store_true', dest='verbose', help='Include verbose information in output')
-parser.add_argument('-d', action='store_true', dest='duplicates', help='Argument is text file containing filenames')
+parser.add_argument('-d', action='store_true', dest='duplicates', help='Argument is text file containing filenames (or archive/member paths), a zip/tar archive of midifiles, or a pack made by midipack.py')
+parser.add_argument('-C', dest='cache', metavar='DIR', help='Cache decoded midifiles in DIR')
 parser.add_argument('filename', help='File to be processed')
 args = parser.parse_args()
 
+cache = midi.PatternCache(args.cache) if args.cache else None
+
+def read_piece(midifile, name):
+    try:
+        return MidiPiece(midifile, args.verbose, cache)
+    except TypeError as e:
+        print('Cannot read "%s" as midifile' % name)
+        print('Exception says: %s' % e)
+        sys.exit(2)
+
 pieces = []
 names  = []
 if args.duplicates:
-    if os.path.isfile(args.filename):
+    if is_pack(args.filename):
+        # the notes come straight off the mmapped pack
+        pack = MidiPack(args.filename)
+        for piece in pack:
+            names.append(piece.midi_fn)
+            pieces.append(piece)
+    elif midi.is_archive(args.filename):
+        # every midifile in the archive, read ahead through one handle
+        with midi.MidiArchive(args.filename) as archive:
+            for name, data in archive:
+                names.append(name)
+                pieces.append(read_piece(io.BytesIO(data), name))
+    elif os.path.isfile(args.filename):
         with open(args.filename) as f:
             for line in f:
                 names.append(line.strip())
-        for i in range(len(names)):
-            # print("importing from " + names[i])
-            pieces.append(MidiPiece(names[i], args.verbose))
+        # members of the same archive share one open archive
+        for name, midifile in midi.iter_midifiles(names):
+            # print("importing from " + name)
+            pieces.append(read_piece(midifile, name))
 else:
-    if os.path.isfile(args.filename):
-        pieces.append(MidiPiece(args.filename, args.verbose))
+    if os.path.isfile(args.filename) or midi.split_member(args.filename)[1]:
+        pieces.append(read_piece(args.filename, args.filename))
 
 # print(pieces[0].resolution)
 colors = ["r", "b", "g"]
@@ -52,8 +77,12 @@ def get_x_t_p_v_d(p, n):
 
     for piece, name in zip(p, n):
         # find the seconds, ticks, pitches, velocities, durations and make separate lists for each
-        s_tick_pitch_vel_dur = [[float(n.us)/1000000, n.tick, n.pitch, n.velocity, float(n.duration_us)/1000000] for track in piece.tracks for n in piece.tracks[track].notes]
-        el = list(map(list,zip(*s_tick_pitch_vel_dur)))
+        table = piece.note_table()
+        el = [(np.asarray(table['us'], dtype=float)/1000000).tolist(),
+              np.asarray(table['tick']).tolist(),
+              np.asarray(table['pitch']).tolist(),
+              np.asarray(table['velocity']).tolist(),
+              (np.asarray(table['duration_us'], dtype=float)/1000000).tolist()]
         xtpvd.append(el)
     return xtpvd
 
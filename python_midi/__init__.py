@@ -1,5 +1,26 @@
+import importlib
 from .containers import *
 from .events import *
 from struct import unpack, pack
 from .util import *
 from .fileio import *
+from .decimate import *
+from .sequencer import *
+
+# Modules that pull in NumPy, asyncio or the archive formats are imported
+# on first use of one of their names, so importing python_midi stays cheap.
+# A name is looked up in them in this order, the ones without NumPy first.
+LAZY_MODULES = ('archive', 'player', 'columnar', 'cache')
+
+def __getattr__(name):
+    if name in LAZY_MODULES:
+        return importlib.import_module('.' + name, __name__)
+    for module in LAZY_MODULES:
+        module = importlib.import_module('.' + module, __name__)
+        if hasattr(module, name) and not name.startswith('_'):
+            # as from .module import * would have
+            for key, value in vars(module).items():
+                if not key.startswith('_'):
+                    globals().setdefault(key, value)
+            return getattr(module, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
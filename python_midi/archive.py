@@ -0,0 +1,169 @@
+import io
+import os
+import gzip
+import tarfile
+import zipfile
+import threading
+from queue import Queue, Empty
+from .constants import *
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+def is_midi_name(name):
+    return name.lower().endswith(MIDI_SUFFIXES)
+
+def is_archive(path):
+    # A zip or tar (plain or compressed) file
+    if not os.path.isfile(path):
+        return False
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+def split_member(path):
+    # Split archive/member into (archive, member), or (path, None) when
+    # no leading part of path is an existing file
+    parts = path.replace(os.sep, '/').split('/')
+    for i in range(len(parts) - 1, 0, -1):
+        archive = '/'.join(parts[:i])
+        if archive and os.path.isfile(archive):
+            return archive, '/'.join(parts[i:])
+    return path, None
+
+def open_midifile(path):
+    # Open path for reading: a MIDI file, a gzipped one, or a member of
+    # a zip or tar archive written as archive/member
+    if not os.path.isfile(path):
+        archive, member = split_member(path)
+        if member is not None:
+            with MidiArchive(archive) as midiarchive:
+                return io.BytesIO(midiarchive.read(member))
+    midifile = open(path, 'rb')
+    if midifile.read(2) == GZIP_MAGIC:
+        with midifile:
+            midifile.seek(0)
+            return io.BytesIO(gzip.GzipFile(fileobj=midifile).read())
+    midifile.seek(0)
+    return midifile
+
+def iter_midifiles(paths):
+    # (path, file object) for each path in order.  Members of the same
+    # archive are read through one open handle for all of them.
+    archives = {}
+    try:
+        for path in paths:
+            archive, member = (path, None) if os.path.isfile(path) else split_member(path)
+            if member is None:
+                yield path, open_midifile(path)
+                continue
+            if archive not in archives:
+                archives[archive] = MidiArchive(archive)
+            yield path, io.BytesIO(archives[archive].read(member))
+    finally:
+        for midiarchive in archives.values():
+            midiarchive.close()
+
+class ReadError(object):
+    # an exception raised by the read-ahead thread, passed on to the reader
+    def __init__(self, error):
+        self.error = error
+
+class MidiArchive(object):
+    """
+    One open zip or tar archive of MIDI files.
+
+    The archive is read through a single buffered handle.  Iterating
+    yields (member name, bytes) for every MIDI member in archive order;
+    a thread reads and decompresses up to readahead members ahead while
+    the caller decodes the current one.  read(member) picks out one
+    member; don't call it while an iteration is running.
+    """
+
+    def __init__(self, path, readahead=ARCHIVE_READAHEAD):
+        self.path = path
+        self.readahead = readahead
+        self.file = open(path, 'rb', buffering=ARCHIVE_BUFFER)
+        try:
+            if zipfile.is_zipfile(self.file):
+                self.zip = zipfile.ZipFile(self.file)
+                self.tar = None
+            else:
+                self.file.seek(0)
+                self.zip = None
+                self.tar = tarfile.open(fileobj=self.file, mode='r:*')
+        except (tarfile.TarError, zipfile.BadZipFile) as e:
+            self.file.close()
+            raise TypeError("Not a zip or tar archive: %s (%s)" % (path, e))
+
+    def __repr__(self):
+        return "midi.MidiArchive(%r)" % (self.path, )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+        if self.tar is not None:
+            self.tar.close()
+        self.file.close()
+
+    def names(self):
+        if self.zip is not None:
+            return [name for name in self.zip.namelist() if is_midi_name(name)]
+        return [member.name for member in self.tar.getmembers()
+                if member.isfile() and is_midi_name(member.name)]
+
+    def read(self, member):
+        if self.zip is not None:
+            return self.zip.read(member)
+        midifile = self.tar.extractfile(member)
+        if midifile is None:
+            raise KeyError("%s is not a file in %s" % (member, self.path))
+        return midifile.read()
+
+    def members(self):
+        # (name, bytes) in archive order, read in the calling thread
+        if self.zip is not None:
+            for info in self.zip.infolist():
+                if not info.is_dir() and is_midi_name(info.filename):
+                    yield info.filename, self.zip.read(info)
+        else:
+            for member in self.tar:
+                if member.isfile() and is_midi_name(member.name):
+                    yield member.name, self.tar.extractfile(member).read()
+
+    def __iter__(self):
+        queue = Queue(max(1, self.readahead))
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for item in self.members():
+                    queue.put(item)
+                    if stop.is_set():
+                        return
+                queue.put(done)
+            except BaseException as e:
+                queue.put(ReadError(e))
+
+        thread = threading.Thread(target=produce, name='midi-readahead', daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = queue.get()
+                if item is done:
+                    return
+                if isinstance(item, ReadError):
+                    raise item.error
+                yield item
+        finally:
+            # unblock the thread if the caller stopped early
+            stop.set()
+            while thread.is_alive():
+                try:
+                    queue.get(timeout=0.01)
+                except Empty:
+                    pass
@@ -0,0 +1,170 @@
+import os
+import zipfile
+import hashlib
+import tempfile
+from .constants import *
+from .columnar import *
+from .archive import *
+
+class FileCache(object):
+    """
+    A directory of cache entries, one file per key.  Entries are written
+    to a temporary name and moved into place, so readers in other
+    processes never see a half written one, and the least recently used
+    are removed when the directory grows past max_size bytes.  Subclasses
+    choose the suffix and what an entry holds, through read() and write().
+    """
+
+    suffix = ''
+
+    def __init__(self, directory=None, max_size=DEFAULT_CACHE_SIZE):
+        if directory is None:
+            directory = os.environ.get('PYTHON_MIDI_CACHE') or \
+                os.path.join(os.path.expanduser('~'), '.cache', 'python_midi')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+        # bytes in the directory, counted once and then kept up to date by
+        # write(), so a write only lists the directory when over max_size
+        self.total = None
+
+    def __repr__(self):
+        return "midi.%s(%r, max_size=%r)" % (type(self).__name__, self.directory, self.max_size)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def read(self, key, load, errors, mode='rb'):
+        # load(f) of the entry, or None when there is none; an entry load
+        # fails on with one of errors was left damaged by a crash or a
+        # full disk, and is dropped
+        path = self.path(key)
+        try:
+            with open(path, mode) as f:
+                value = load(f)
+        except OSError:
+            return None
+        except errors:
+            self.discard(key)
+            return None
+        # the mtime is the last use, for eviction
+        os.utime(path)
+        return value
+
+    def write(self, key, save, mode='wb'):
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, mode) as f:
+                save(f)
+            self.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if self.total > self.max_size:
+            self.evict()
+
+    def replace(self, tmp, path):
+        # move a written entry into place and count it in self.total
+        if self.total is None:
+            os.replace(tmp, path)
+            self.total = self.size()
+        else:
+            size = os.stat(tmp).st_size
+            try:
+                size -= os.stat(path).st_size
+            except OSError:
+                pass
+            os.replace(tmp, path)
+            self.total += size
+
+    def discard(self, key):
+        path = self.path(key)
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+        except OSError:
+            return
+        if self.total is not None:
+            self.total -= size
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def size(self):
+        return sum(size for mtime, size, name in self.entries())
+
+    def evict(self):
+        # other processes may have added or removed entries, so the total
+        # is counted again from the listing
+        entries = sorted(self.entries())
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+        self.total = total
+
+    def clear(self):
+        for mtime, size, name in self.entries():
+            os.unlink(os.path.join(self.directory, name))
+        self.total = 0
+
+class PatternCache(FileCache):
+    """
+    On-disk cache of decoded MIDI files.
+
+    Entries are keyed on a SHA-256 of the file contents and PARSER_VERSION,
+    so a changed file or a new decoder never hits a stale entry.  Each one
+    holds the ColumnarPattern of the file as an .npz archive: a warm
+    read_midifile_columnar() only loads the arrays, and read_midifile()
+    builds its event objects from them without decoding any bytes.  When
+    the directory grows past max_size bytes, the least recently used
+    entries are removed.
+    """
+
+    suffix = '.npz'
+
+    def __init__(self, directory=None, max_size=DEFAULT_CACHE_SIZE):
+        if np is None:
+            raise ImportError("PatternCache requires numpy")
+        super(PatternCache, self).__init__(directory, max_size)
+
+    def key(self, data):
+        digest = hashlib.sha256(b'python_midi %d\0' % PARSER_VERSION)
+        digest.update(data)
+        return digest.hexdigest()
+
+    def load(self, key):
+        return self.read(key, load_columnar,
+                         (ValueError, KeyError, EOFError, zipfile.BadZipFile))
+
+    def store(self, key, pattern):
+        self.write(key, lambda f: save_columnar(pattern, f))
+
+    def read_midifile_columnar(self, midifile):
+        if type(midifile) in (str, str):
+            with open_midifile(midifile) as f:
+                data = f.read()
+        else:
+            data = midifile.read()
+        key = self.key(data)
+        pattern = self.load(key)
+        if pattern is None:
+            pattern = read_columnar(data)
+            self.store(key, pattern)
+        return pattern
+
+    def read_midifile(self, midifile, keep=None):
+        return self.read_midifile_columnar(midifile).to_pattern(keep)
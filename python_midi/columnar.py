@@ -0,0 +1,270 @@
+from array import array
+from struct import unpack_from
+from .containers import *
+from .events import *
+from .constants import *
+from .util import *
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class ColumnarTrack(object):
+    """
+    Structure-of-arrays view of one MTrk chunk.
+
+    Every event is a row across the NumPy columns tick (absolute),
+    status, channel, data1 and data2.  Channel events keep their status
+    nibble (0x80 .. 0xE0) and up to two data bytes; meta events have
+    status 0xFF and their metacommand in data1, sysex events status
+    0xF0.  Meta and sysex payloads are not copied: offset and length
+    point into data, the buffer the track was decoded from.  For channel
+    events length is the number of data bytes.
+    """
+
+    def __init__(self, tick, status, channel, data1, data2, offset, length, data):
+        self.tick = tick
+        self.status = status
+        self.channel = channel
+        self.data1 = data1
+        self.data2 = data2
+        self.offset = offset
+        self.length = length
+        self.data = data
+
+    def __len__(self):
+        return len(self.tick)
+
+    def __repr__(self):
+        return "midi.ColumnarTrack(%d events)" % len(self)
+
+    def payload(self, index):
+        start = int(self.offset[index])
+        return self.data[start:start+int(self.length[index])]
+
+    def note_on(self):
+        # NoteOn with velocity zero is a NoteOff, as Logic Pro X writes them
+        return (self.status == NoteOnEvent.statusmsg) & (self.data2 > 0)
+
+    def note_off(self):
+        return (self.status == NoteOffEvent.statusmsg) | \
+            ((self.status == NoteOnEvent.statusmsg) & (self.data2 == 0))
+
+    def keep_mask(self, keep):
+        # Boolean row mask for a keep= spec as FileReader takes it
+        keep_status, keep_meta = keep_tables(keep)
+        status = np.where(self.status < 0xF0, self.status | self.channel, self.status)
+        mask = np.array(keep_status)[status]
+        meta = self.status == 0xFF
+        mask[meta] = np.array(keep_meta)[self.data1[meta]]
+        return mask
+
+    def to_packed(self):
+        # PackedTrack sharing data, with relative ticks like to_track()
+        delta = np.diff(self.tick, prepend=0)
+        columns = (delta, self.status, self.channel, self.data1, self.data2,
+                   self.offset, self.length)
+        columns = [array(typecode, column.tobytes())
+                   for (name, typecode), column in zip(PackedTrack.columns, columns)]
+        return PackedTrack.from_arrays(*columns, data=self.data)
+
+    def to_track(self, keep=None):
+        # Build the same Track of event objects read_midifile returns;
+        # with keep, dropped events add their delta to the next one kept
+        columns = (self.tick, self.status, self.channel, self.data1,
+                   self.data2, self.offset, self.length)
+        if keep is not None:
+            mask = self.keep_mask(keep)
+            columns = [column[mask] for column in columns]
+        delta = np.diff(columns[0], prepend=0)
+        rows = zip(delta.tolist(), *[column.tolist() for column in columns[1:]])
+        track = Track()
+        append = list.append.__get__(track)
+        data = self.data
+        payloads = {}
+        for delta, status, channel, data1, data2, offset, length in rows:
+            if status == 0xFF:
+                cls = META_CLASS[data1]
+                event = cls.make(delta, tuple(data[offset:offset+length]))
+                if cls is UnknownMetaEvent:
+                    event.metacommand = data1
+                append(event)
+            elif status == 0xF0:
+                append(SysexEvent.make(delta, tuple(data[offset:offset+length])))
+            else:
+                cls = STATUS_CLASS[status]
+                key = status << 16 | data1 << 8 | data2
+                payload = payloads.get(key)
+                if payload is None:
+                    payload = payloads[key] = (data1, data2)[:cls.length]
+                append(cls.make(delta, payload, channel))
+        return track
+
+class ColumnarPattern(list):
+    def __init__(self, tracks=[], resolution=220, format=1):
+        self.format = format
+        self.resolution = resolution
+        super(ColumnarPattern, self).__init__(tracks)
+
+    def __repr__(self):
+        return "midi.ColumnarPattern(format=%r, resolution=%r, tracks=%r)" % \
+            (self.format, self.resolution, list(self))
+
+    def to_pattern(self, keep=None):
+        return Pattern(resolution=self.resolution, format=self.format,
+                        tracks=[track.to_track(keep) for track in self])
+
+def decode_arrays(data, pos, end):
+    # Decode the events in data[pos:end] straight into typed arrays of
+    # delta ticks, status, channel, data1, data2, offset and length.
+    # No event objects are created; the loop only touches ints.
+    ticks = array('q')
+    status = array('B')
+    channel = array('B')
+    data1 = array('B')
+    data2 = array('B')
+    offset = array('q')
+    length = array('q')
+    lengths = CHANNEL_EVENT_LENGTH
+    running = 0
+    first = pos
+    while pos < end:
+        start = pos
+        try:
+            delta, pos = read_varlen_at(data, pos)
+        except IndexError:
+            break
+        if pos >= end:
+            break
+        stsmsg = data[pos]
+        pos += 1
+        if stsmsg == 0xFF:
+            if pos >= end:
+                break
+            cmd = data[pos]
+            try:
+                datalen, pos = read_varlen_at(data, pos + 1)
+            except IndexError:
+                break
+            if pos + datalen > end:
+                break
+            d1, d2, evoff, evlen = cmd, 0, pos, datalen
+            pos += datalen
+        elif stsmsg == 0xF0:
+            try:
+                stop = data.index(0xF7, pos, end)
+            except ValueError:
+                break
+            d1, d2, evoff, evlen = 0, 0, pos, stop - pos
+            pos = stop + 1
+        elif stsmsg & 0x80:
+            if stsmsg > 0xF0:
+                raise TypeError("Unknown MIDI Event: " + repr(stsmsg))
+            running = stsmsg
+            need = lengths[stsmsg >> 4]
+            if pos + need > end:
+                break
+            d1 = data[pos]
+            d2 = data[pos+1] if need == 2 else 0
+            evoff, evlen = 0, need
+            pos += need
+            stsmsg = running & 0xF0
+        else:
+            # running status: the byte just read is data1
+            if not running:
+                raise TypeError("Bad byte value 0x%02X without running status" % stsmsg)
+            need = lengths[running >> 4] - 1
+            if pos + need > end:
+                break
+            d1 = stsmsg
+            d2 = data[pos] if need else 0
+            evoff, evlen = 0, need + 1
+            pos += need
+            stsmsg = running & 0xF0
+        ticks.append(delta)
+        status.append(stsmsg)
+        channel.append(running & 0x0F if stsmsg < 0xF0 else 0)
+        data1.append(d1)
+        data2.append(d2)
+        offset.append(evoff)
+        length.append(evlen)
+    else:
+        start = end
+    if start < end:
+        warn_truncated("incomplete event at byte %d of the track, %d byte(s) dropped"
+                        % (start - first, end - start))
+    return ticks, status, channel, data1, data2, offset, length, data
+
+def decode_columns(data, pos, end):
+    ticks, status, channel, data1, data2, offset, length, data = \
+        decode_arrays(data, pos, end)
+    return ColumnarTrack(np.cumsum(np.frombuffer(ticks, dtype=np.int64)),
+                         np.frombuffer(status, dtype=np.uint8),
+                         np.frombuffer(channel, dtype=np.uint8),
+                         np.frombuffer(data1, dtype=np.uint8),
+                         np.frombuffer(data2, dtype=np.uint8),
+                         np.frombuffer(offset, dtype=np.int64),
+                         np.frombuffer(length, dtype=np.int64),
+                         data)
+
+def parse_chunks(data):
+    # (format, resolution, [(start, end) of each track chunk])
+    if data[0:4] != b'MThd':
+        raise TypeError("Bad header in MIDI file." + str(data[0:4]))
+    hdrsz, format, ntracks, resolution = unpack_from(">LHHH", data, 4)
+    pos = 8 + max(hdrsz, DEFAULT_MIDI_HEADER_SIZE - 8)
+    chunks = []
+    for x in range(ntracks):
+        if data[pos:pos+4] != b'MTrk':
+            raise TypeError("Bad track header in MIDI file: " + str(data[pos:pos+4]))
+        trksz = unpack_from(">L", data, pos + 4)[0]
+        pos += 8
+        if pos + trksz > len(data):
+            warn_truncated("track chunk ends %d byte(s) early" % (pos + trksz - len(data)))
+        chunks.append((pos, min(pos + trksz, len(data))))
+        pos += trksz
+    return format, resolution, chunks
+
+def read_columnar(data):
+    if np is None:
+        raise ImportError("read_midifile_columnar() requires numpy")
+    format, resolution, chunks = parse_chunks(data)
+    return ColumnarPattern(resolution=resolution, format=format,
+                           tracks=[decode_columns(data, start, end) for start, end in chunks])
+
+def read_packed(data):
+    # Pattern of PackedTracks; works without numpy
+    format, resolution, chunks = parse_chunks(data)
+    return Pattern(resolution=resolution, format=format,
+                   tracks=[PackedTrack.from_arrays(*decode_arrays(data, start, end))
+                           for start, end in chunks])
+
+COLUMNS = ('tick', 'status', 'channel', 'data1', 'data2', 'offset', 'length')
+
+def save_columnar(pattern, f):
+    # Write a ColumnarPattern as an uncompressed .npz archive.  Tracks
+    # decoded from one file share its buffer, which is stored only once.
+    arrays = {'header': np.array([pattern.format, pattern.resolution, len(pattern)])}
+    buffers = {}
+    for index, track in enumerate(pattern):
+        for name in COLUMNS:
+            arrays['%s%d' % (name, index)] = getattr(track, name)
+        if id(track.data) not in buffers:
+            buffers[id(track.data)] = len(buffers)
+            arrays['data%d' % buffers[id(track.data)]] = np.frombuffer(track.data, dtype=np.uint8)
+        arrays['buffer%d' % index] = np.array(buffers[id(track.data)])
+    np.savez(f, **arrays)
+
+def load_columnar(f):
+    archive = np.load(f, allow_pickle=False)
+    format, resolution, ntracks = archive['header'].tolist()
+    pattern = ColumnarPattern(resolution=resolution, format=format)
+    buffers = {}
+    for index in range(ntracks):
+        buffer = int(archive['buffer%d' % index])
+        if buffer not in buffers:
+            buffers[buffer] = archive['data%d' % buffer].tobytes()
+        columns = [archive['%s%d' % (name, index)] for name in COLUMNS]
+        pattern.append(ColumnarTrack(*columns, data=buffers[buffer]))
+    return pattern
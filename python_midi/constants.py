@@ -46,4 +46,39 @@ THIRTYSECOND = 5
 SIXTYFOURTH = 6
 
 DEFAULT_MIDI_HEADER_SIZE = 14
+# microseconds per quarter note until the first SetTempoEvent (120 bpm)
+DEFAULT_MPQN = 500000
+STREAM_BLOCKSIZE = 65536
+# tracks for unseekable output are spooled to disk beyond this size
+STREAM_SPOOL_SIZE = 1024 * 1024
 
+# bump whenever decoding changes, so cached patterns are not reused
+PARSER_VERSION = 2
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# archive members taken for MIDI files, buffer size and number of members
+# read ahead while the current one is decoded
+MIDI_SUFFIXES = ('.mid', '.midi', '.kar', '.smf')
+ARCHIVE_BUFFER = 1024 * 1024
+ARCHIVE_READAHEAD = 8
+
+# controllers decimate_track thins by default: the continuous ones without
+# an LSB partner; switches, data entry, (N)RPN and mode messages are kept
+CONTINUOUS_CONTROLS = frozenset((1, 2, 4, 7, 8, 10, 11, 12, 13, 16, 17, 18, 19,
+                                 91, 92, 93, 94, 95))
+# pitch wheel values are 14 bit, so their tolerance is scaled from the
+# 7 bit controller one by default
+PITCH_TOLERANCE_SCALE = 128
+# most controller values a decimated curve holds back before one is kept,
+# and most events held back behind an undecided one
+DECIMATE_WINDOW = 256
+
+# seconds: events this close together are played in one batch, and the
+# most the player wakes up early to make up for late wakeups
+PLAYER_QUANTUM = 0.002
+# how fast the time the player wakes up early by decays when wakeups
+# are less late than planned for
+PLAYER_DRIFT_GAIN = 0.05
+# seconds before a batch is due the player stops sleeping and yields to
+# the event loop until it is; epoll sleeps in whole milliseconds
+PLAYER_SPIN = 0.001
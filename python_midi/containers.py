@@ -1,4 +1,58 @@
+import copy
+import heapq
+from bisect import bisect_left
+from array import array
+from collections.abc import MutableSequence
+from itertools import accumulate, chain, repeat
+from operator import itemgetter
 from pprint import pformat, pprint
+from .events import *
+from .util import *
+
+def tick_array(ticks, cumulative=False):
+    # ticks as a read-only int64 NumPy array, or array('q') without NumPy
+    np = load_numpy()
+    if np is None:
+        return array('q', accumulate(ticks) if cumulative else ticks)
+    ticks = np.array(ticks, dtype=np.int64)
+    if cumulative:
+        ticks = np.cumsum(ticks)
+    ticks.flags.writeable = False
+    return ticks
+
+def tick_deltas(ticks):
+    # relative ticks from absolute ones
+    np = load_numpy()
+    if np is None:
+        return array('q', [tick - last for last, tick in zip(chain((0, ), ticks), ticks)])
+    ticks = np.diff(ticks, prepend=0)
+    ticks.flags.writeable = False
+    return ticks
+
+def invalidating(method):
+    # list method that also drops the cached absolute ticks and raw chunk
+    def wrapper(self, *args, **kw):
+        self.abs_cache = None
+        self.raw = None
+        self.raw_state = None
+        return method(self, *args, **kw)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+def iter_abs(track, tick_relative=True):
+    # absolute ticks of track, lazily
+    ticks = (event.tick for event in track)
+    if getattr(track, 'tick_relative', tick_relative):
+        return accumulate(ticks)
+    return ticks
+
+def merge_tracks(tracks, tick_relative=True):
+    # Lazy k-way merge of tracks that are each in time order into
+    # (tick, track index, event) tuples in time order.  Events at the
+    # same tick come in track order.  O(n log k); nothing is copied.
+    timelines = [zip(iter_abs(track, tick_relative), repeat(index), track)
+                 for index, track in enumerate(tracks)]
+    return heapq.merge(*timelines, key=itemgetter(0))
 
 class Pattern(list):
     def __init__(self, tracks=[], resolution=220, format=1, tick_relative=True):
@@ -11,6 +65,16 @@ class Pattern(list):
         return "midi.Pattern(format=%r, resolution=%r, tracks=\\\n%s)" % \
             (self.format, self.resolution, pformat(list(self)))
 
+    def raw_track(self, index):
+        # MTrk chunk that can be written for track index as it is, or None
+        track = self[index]
+        return track.raw_chunk() if hasattr(track, 'raw_chunk') else None
+
+    def iter_merged(self):
+        # All events of the song as (tick, track index, event) in time
+        # order, with absolute ticks; see merge_tracks()
+        return merge_tracks(self, self.tick_relative)
+
     def make_ticks_abs(self):
         self.tick_relative = False
         for track in self:
@@ -25,7 +89,8 @@ class Pattern(list):
         if isinstance(item, slice):
             indices = item.indices(len(self))
             return Pattern(resolution=self.resolution, format=self.format,
-                            tracks=(super(Pattern, self).__getitem__(i) for i in range(*indices)))
+                            tracks=(super(Pattern, self).__getitem__(i) for i in range(*indices)),
+                            tick_relative=self.tick_relative)
         else:
             return super(Pattern, self).__getitem__(item)
 
@@ -37,28 +102,97 @@ class Pattern(list):
 class Track(list):
     def __init__(self, events=[], tick_relative=True):
         self.tick_relative = tick_relative
+        self.abs_cache = None
+        # the MTrk chunk the events were read from (only kept on request)
+        # and the state() of every event then; see raw_chunk()
+        self.raw = None
+        self.raw_state = None
         super(Track, self).__init__(events)
 
+    append = invalidating(list.append)
+    extend = invalidating(list.extend)
+    insert = invalidating(list.insert)
+    pop = invalidating(list.pop)
+    remove = invalidating(list.remove)
+    clear = invalidating(list.clear)
+    sort = invalidating(list.sort)
+    reverse = invalidating(list.reverse)
+    __setitem__ = invalidating(list.__setitem__)
+    __delitem__ = invalidating(list.__delitem__)
+    __iadd__ = invalidating(list.__iadd__)
+    __imul__ = invalidating(list.__imul__)
+
+    def invalidate(self):
+        # Changing events in place can't be seen by the track: call this
+        # afterwards, so the ticks are summed again
+        self.abs_cache = None
+        self.raw = None
+        self.raw_state = None
+
+    def set_raw(self, chunk):
+        # keep chunk, the MTrk chunk the events were just read from
+        self.raw = chunk
+        self.raw_state = [event.state() for event in self]
+
+    def raw_chunk(self):
+        # The chunk the events were read from, or None once they have
+        # changed: the list mutators drop it, and events changed in place
+        # are found by comparing them with their state when read
+        if self.raw is not None and any(event.state() != state
+                                        for event, state in zip(self, self.raw_state)):
+            self.raw = None
+            self.raw_state = None
+        return self.raw
+
+    def abs_ticks(self):
+        # Absolute tick of every event, computed once with a cumulative
+        # sum and kept until the track changes
+        if self.abs_cache is None:
+            ticks = [event.tick for event in self]
+            self.abs_cache = tick_array(ticks, self.tick_relative)
+        return self.abs_cache
+
+    def rel_ticks(self):
+        return tick_deltas(self.abs_ticks())
+
+    def tick_range(self, start, end):
+        # Index range of the events with start <= absolute tick < end
+        ticks = self.abs_ticks()
+        lo = bisect_left(ticks, start)
+        return lo, bisect_left(ticks, end, lo)
+
+    def slice_ticks(self, start, end):
+        # Events with start <= absolute tick < end, in O(log n + k).
+        # Ticks stay as they are, so with relative ticks the first one
+        # is relative to an event before start.
+        lo, hi = self.tick_range(start, end)
+        return self[lo:hi]
+
     def make_ticks_abs(self):
+        # The events are replaced by copies, never changed, so events
+        # shared with other tracks or patterns keep their ticks
         if (self.tick_relative):
+            ticks = self.abs_ticks().tolist()
             self.tick_relative = False
-            running_tick = 0
-            for event in self:
-                event.tick += running_tick
-                running_tick = event.tick
+            self.raw = None
+            self.raw_state = None
+            list.__setitem__(self, slice(None),
+                [event.with_tick(tick) for event, tick in zip(self, ticks)])
 
     def make_ticks_rel(self):
         if (not self.tick_relative):
+            ticks = self.rel_ticks().tolist()
             self.tick_relative = True
-            running_tick = 0
-            for event in self:
-                event.tick -= running_tick
-                running_tick += event.tick
+            self.raw = None
+            self.raw_state = None
+            list.__setitem__(self, slice(None),
+                [event.with_tick(tick) for event, tick in zip(self, ticks)])
 
     def __getitem__(self, item):
         if isinstance(item, slice):
             indices = item.indices(len(self))
-            return Track((super(Track, self).__getitem__(i) for i in range(*indices)))
+            return Track((super(Track, self).__getitem__(i) for i in range(*indices)),
+                         tick_relative=self.tick_relative)
         else:
             return super(Track, self).__getitem__(item)
 
@@ -69,3 +203,205 @@ class Track(list):
 
     def __repr__(self):
         return "midi.Track(\\\n  %s)" % (pformat(list(self)).replace('\n', '\n  '), )
+
+class PackedTrack(MutableSequence):
+    """
+    Track that keeps its events in parallel arrays instead of a list.
+
+    Every event is a row across the columns tick, status (the status
+    nibble of channel events, 0xFF for meta and 0xF0 for sysex events),
+    channel, data1, data2, offset and length.  Meta events keep their
+    metacommand in data1, and meta and sysex payloads are length bytes
+    at offset in data; for channel events length is the number of data
+    bytes.  Event objects are made on access, so changing one does not
+    change the track: assign it back with track[i] = event.  Slices are
+    views on the same arrays; the first change to either side copies.
+    """
+
+    columns = (('tick', 'q'), ('status', 'B'), ('channel', 'B'), ('data1', 'B'),
+               ('data2', 'B'), ('offset', 'q'), ('length', 'q'))
+
+    def __init__(self, events=[], tick_relative=True):
+        self.tick_relative = tick_relative
+        for name, typecode in self.columns:
+            setattr(self, name, array(typecode))
+        self.data = bytearray()
+        # rows is None, or the range of rows this track is a view of
+        self.rows = None
+        self.shared = False
+        self.abs_cache = None
+        self.extend(events)
+
+    @classmethod
+    def from_arrays(cls, tick, status, channel, data1, data2, offset, length, data,
+                    tick_relative=True):
+        # Wrap already filled columns, as decode_arrays() makes them
+        track = cls.__new__(cls)
+        track.tick_relative = tick_relative
+        track.tick, track.status, track.channel = tick, status, channel
+        track.data1, track.data2 = data1, data2
+        track.offset, track.length = offset, length
+        track.data = data
+        track.rows = None
+        track.shared = False
+        track.abs_cache = None
+        return track
+
+    def arrays(self):
+        return [getattr(self, name) for name, typecode in self.columns]
+
+    def all_rows(self):
+        return range(len(self.tick)) if self.rows is None else self.rows
+
+    def row(self, index):
+        try:
+            return self.all_rows()[index]
+        except IndexError:
+            raise IndexError("track index out of range")
+
+    def event(self, row):
+        status = self.status[row]
+        if status < 0xF0:
+            data = (self.data1[row], self.data2[row])[:self.length[row]]
+            return STATUS_CLASS[status].make(self.tick[row], data, self.channel[row])
+        start = self.offset[row]
+        data = tuple(self.data[start:start+self.length[row]])
+        if status == 0xF0:
+            return SysexEvent.make(self.tick[row], data)
+        cls = META_CLASS[self.data1[row]]
+        event = cls.make(self.tick[row], data)
+        if cls is UnknownMetaEvent:
+            event.metacommand = self.data1[row]
+        return event
+
+    def pack(self, event):
+        # Column values for event; meta and sysex payloads go into data
+        if isinstance(event, MetaEvent):
+            status, data1 = 0xFF, event.metacommand
+        elif isinstance(event, SysexEvent):
+            status, data1 = 0xF0, 0
+        elif isinstance(event, Event):
+            data = tuple(event.data) + (0, 0)
+            return (event.tick, event.statusmsg, event.channel, data[0], data[1],
+                    0, len(event.data))
+        else:
+            raise TypeError("Cannot pack %r into a PackedTrack" % (event, ))
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+        offset = len(self.data)
+        self.data.extend(event.data)
+        return (event.tick, status, 0, data1, 0, offset, len(event.data))
+
+    def row_slice(self):
+        rows = self.all_rows()
+        return slice(rows.start, rows.stop if rows.stop >= 0 else None, rows.step)
+
+    def own(self):
+        # Copy the arrays before a change if they are shared with a slice;
+        # every change comes through here, so the cached ticks go too
+        self.abs_cache = None
+        if self.shared or self.rows is not None:
+            rows = self.row_slice()
+            for name, typecode in self.columns:
+                setattr(self, name, getattr(self, name)[rows])
+            self.data = bytearray(self.data)
+            self.rows = None
+            self.shared = False
+
+    def __len__(self):
+        return len(self.all_rows())
+
+    def __iter__(self):
+        event = self.event
+        for row in self.all_rows():
+            yield event(row)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            view = copy.copy(self)
+            view.rows = self.all_rows()[item]
+            view.abs_cache = None
+            self.shared = view.shared = True
+            return view
+        return self.event(self.row(item))
+
+    def __setitem__(self, item, value):
+        if isinstance(item, slice):
+            rows = [self.pack(event) for event in value]
+            self.own()
+            columns = list(zip(*rows)) or [()] * len(self.columns)
+            for column, values in zip(self.arrays(), columns):
+                column[item] = array(column.typecode, values)
+        else:
+            self.own()
+            row = self.row(item)
+            for column, value in zip(self.arrays(), self.pack(value)):
+                column[row] = value
+
+    def __delitem__(self, item):
+        self.own()
+        row = item if isinstance(item, slice) else self.row(item)
+        for column in self.arrays():
+            del column[row]
+
+    def insert(self, index, event):
+        self.own()
+        for column, value in zip(self.arrays(), self.pack(event)):
+            column.insert(index, value)
+
+    def append(self, event):
+        self.own()
+        for column, value in zip(self.arrays(), self.pack(event)):
+            column.append(value)
+
+    def extend(self, events):
+        if events is self:
+            events = list(events)
+        self.own()
+        columns = self.arrays()
+        pack = self.pack
+        for event in events:
+            for column, value in zip(columns, pack(event)):
+                column.append(value)
+
+    def clear(self):
+        for name, typecode in self.columns:
+            setattr(self, name, array(typecode))
+        self.data = bytearray()
+        self.rows = None
+        self.shared = False
+        self.abs_cache = None
+
+    def copy(self):
+        return self[:]
+
+    def abs_ticks(self):
+        if self.abs_cache is None:
+            ticks = self.tick if self.rows is None else self.tick[self.row_slice()]
+            self.abs_cache = tick_array(ticks, self.tick_relative)
+        return self.abs_cache
+
+    def rel_ticks(self):
+        return tick_deltas(self.abs_ticks())
+
+    tick_range = Track.tick_range
+    slice_ticks = Track.slice_ticks
+
+    def make_ticks_abs(self):
+        if (self.tick_relative):
+            ticks = self.abs_ticks()
+            self.own()
+            self.tick_relative = False
+            self.tick = array('q', ticks.tolist())
+            self.abs_cache = ticks
+
+    def make_ticks_rel(self):
+        if (not self.tick_relative):
+            ticks = self.abs_ticks()
+            self.own()
+            self.tick_relative = True
+            self.tick = array('q', tick_deltas(ticks).tolist())
+            self.abs_cache = ticks
+
+    def __repr__(self):
+        return "midi.PackedTrack(\\\n  %s)" % (pformat(list(self)).replace('\n', '\n  '), )
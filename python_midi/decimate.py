@@ -0,0 +1,142 @@
+import collections
+from .containers import *
+from .events import *
+from .constants import *
+
+class CurveWindow(object):
+    # The values of one controller or pitch wheel curve held back since
+    # the last one kept (the anchor).  They can all be dropped as long as
+    # one line from the anchor passes within limit of each of them: lo
+    # and hi bound the slopes such a line can have.  Only the latest
+    # value held is undecided; the ones before it are on the line to it.
+    __slots__ = ('limit', 'window', 'tick', 'value', 'lo', 'hi', 'same', 'count', 'held', 'slot')
+
+    def __init__(self, tick, value, limit, window):
+        self.limit = limit
+        self.window = window
+        self.anchor(tick, value)
+
+    def anchor(self, tick, value):
+        self.tick = tick
+        self.value = value
+        self.lo = float('-inf')
+        self.hi = float('inf')
+        # (lowest, highest) value held at the anchor's tick
+        self.same = None
+        self.count = 0
+        self.held = None
+        self.slot = None
+
+    def fits(self, tick, value):
+        # whether the line from the anchor to (tick, value) passes within
+        # limit of every value held; at a single tick the last value is
+        # the one heard
+        span = tick - self.tick
+        if span == 0:
+            return self.same is None or \
+                (value - self.limit <= self.same[0] and self.same[1] <= value + self.limit)
+        return self.lo <= (value - self.value) / span <= self.hi
+
+    def add(self, tick, value, slot):
+        # slot is the [event, keep, curve] of the value in the output queue
+        if self.count and (self.count >= self.window or not self.fits(tick, value)):
+            self.settle()
+        elif self.slot is not None:
+            self.slot[1] = False
+        span = tick - self.tick
+        if span == 0:
+            self.same = (value, value) if self.same is None else \
+                (min(self.same[0], value), max(self.same[1], value))
+            if abs(value - self.value) > self.limit:
+                # no line leaving the anchor's tick passes near it
+                self.lo = float('inf')
+        else:
+            self.lo = max(self.lo, (value - self.value - self.limit) / span)
+            self.hi = min(self.hi, (value - self.value + self.limit) / span)
+        self.count += 1
+        self.held = (tick, value)
+        self.slot = slot
+        slot[1] = None
+
+    def settle(self):
+        # keep the latest value held and go on from it
+        self.slot[1] = True
+        self.anchor(*self.held)
+
+def iter_decimated(events, tolerance=1, pitch_tolerance=None, controls=CONTINUOUS_CONTROLS,
+                   tick_relative=True, window=DECIMATE_WINDOW):
+    # The events with dense ControlChangeEvent and PitchWheelEvent curves
+    # thinned, each channel and controller on its own, so that every
+    # dropped value is within tolerance of the line between the values
+    # kept around it.  controls is the set of controller numbers thinned;
+    # pitch_tolerance defaults to tolerance scaled to the 14 bit range.
+    # Everything else is kept, and with relative ticks the delta of a
+    # dropped event is added to the next one.
+    #
+    # A single pass with bounded memory, so it can sit between
+    # iter_midifile() and StreamWriter: a value is dropped as soon as a
+    # later one of its curve is on a line with it, and a curve keeps a
+    # value at the latest after window values.  Events wait while an
+    # earlier controller value is undecided, at most window of them.
+    # This keeps more values than a Ramer-Douglas-Peucker over the whole
+    # curve would, but never one more than window apart.
+    if pitch_tolerance is None:
+        pitch_tolerance = tolerance * PITCH_TOLERANCE_SCALE
+    queue = collections.deque()
+    curves = {}
+    carry = 0
+    tick = 0
+    for event in events:
+        tick = tick + event.tick if tick_relative else event.tick
+        slot = [event, True, None]
+        queue.append(slot)
+        if type(event) is ControlChangeEvent and event.data[0] in controls:
+            key, value, limit = (event.channel, event.data[0]), event.data[1], tolerance
+        elif type(event) is PitchWheelEvent:
+            key, value, limit = (event.channel, None), event.pitch, pitch_tolerance
+        else:
+            key = None
+        if key is not None:
+            curve = curves.get(key)
+            if curve is None:
+                curves[key] = CurveWindow(tick, value, limit, window)
+            else:
+                slot[2] = curve
+                curve.add(tick, value, slot)
+        if len(queue) > window and queue[0][1] is None:
+            queue[0][2].settle()
+        while queue and queue[0][1] is not None:
+            event, keep, curve = queue.popleft()
+            if not keep:
+                carry += event.tick
+            elif carry and tick_relative:
+                yield event.with_tick(event.tick + carry)
+                carry = 0
+            else:
+                yield event
+    for curve in curves.values():
+        if curve.slot is not None:
+            curve.settle()
+    for event, keep, curve in queue:
+        if not keep:
+            carry += event.tick
+        elif carry and tick_relative:
+            yield event.with_tick(event.tick + carry)
+            carry = 0
+        else:
+            yield event
+
+def decimate_track(track, tolerance=1, pitch_tolerance=None, controls=CONTINUOUS_CONTROLS):
+    # Copy of track thinned by iter_decimated(), e.g. after read_midifile
+    # or before write_midifile
+    tick_relative = getattr(track, 'tick_relative', True)
+    result = type(track)(tick_relative=tick_relative)
+    result.extend(iter_decimated(track, tolerance, pitch_tolerance, controls, tick_relative))
+    return result
+
+def decimate_pattern(pattern, tolerance=1, pitch_tolerance=None, controls=CONTINUOUS_CONTROLS):
+    # decimate_track on every track; after read_midifile or before write_midifile
+    return Pattern(resolution=pattern.resolution, format=pattern.format,
+                   tick_relative=getattr(pattern, 'tick_relative', True),
+                   tracks=[decimate_track(track, tolerance, pitch_tolerance, controls)
+                           for track in pattern])
@@ -5,9 +5,15 @@ class EventRegistry(type):
     MetaEvents = {}
 
     def __new__(mcs, name, bases, dict):
+        # Events carry no __dict__: subclasses that don't declare any
+        # slots of their own get an empty __slots__
+        dict.setdefault('__slots__', ())
         cls = type.__new__(mcs, name, bases, dict)
+        # every slot of the class and its bases, for with_tick()
+        cls.allslots = tuple(slot for base in reversed(cls.__mro__)
+                             for slot in vars(base).get('__slots__', ()))
         if name not in ['AbstractEvent', 'Event', 'MetaEvent', 'NoteEvent',
-                        'MetaEventWithText']:
+                        'MetaEventWithText', 'UnknownMetaEvent']:
             if 'statusmsg' in vars(cls):
                 assert bytes([cls.statusmsg]) not in EventRegistry.Events, \
                                 "Event %s already registered" % cls.name
@@ -23,20 +29,51 @@ class EventRegistry(type):
         return cls
 
 class AbstractEvent(object,metaclass=EventRegistry):
-    #__slots__ = ['tick', 'data']
+    # data is a tuple of byte values; msdelay is the scheduled time in
+    # milliseconds used by the sequencers
+    __slots__ = ['tick', 'data', 'msdelay']
     name = "Generic MIDI Event"
     length = 0
     statusmsg = 0x0
 
     def __init__(self, **kw):
         if type(self.length) == int:
-            defdata = [0] * self.length
+            defdata = (0,) * self.length
         else:
-            defdata = []
+            defdata = ()
         self.tick = 0
         self.data = defdata
         for key in kw:
             setattr(self, key, kw[key])
+        self.data = tuple(self.data)
+
+    @classmethod
+    def make(cls, tick, data):
+        # Positional constructor for the reader: data must be a tuple
+        event = cls.__new__(cls)
+        event.tick = tick
+        event.data = data
+        return event
+
+    def with_tick(self, tick):
+        # Copy of the event at another tick, sharing the data tuple
+        event = self.__class__.__new__(self.__class__)
+        for slot in self.allslots:
+            value = getattr(self, slot, event)
+            if value is not event:
+                setattr(event, slot, value)
+        event.tick = tick
+        return event
+
+    def state(self):
+        # everything the event is encoded from
+        return (self.tick, self.data, getattr(self, 'channel', None),
+                getattr(self, 'metacommand', None))
+
+    def set_datum(self, index, val):
+        data = list(self.data)
+        data[index] = val
+        self.data = tuple(data)
 
     def __cmp__(self, other):
         if self.tick < other.tick: return -1
@@ -58,7 +95,7 @@ class AbstractEvent(object,metaclass=EventRegistry):
 
 
 class Event(AbstractEvent):
-    #__slots__ = ['channel']
+    __slots__ = ['channel']
     name = 'Event'
 
     def __init__(self, **kw):
@@ -67,6 +104,14 @@ class Event(AbstractEvent):
             kw['channel'] = 0
         super(Event, self).__init__(**kw)
 
+    @classmethod
+    def make(cls, tick, data, channel=0):
+        event = cls.__new__(cls)
+        event.tick = tick
+        event.data = data
+        event.channel = channel
+        return event
+
     def copy(self, **kw):
         _kw = {'channel': self.channel, 'tick': self.tick, 'data': self.data}
         _kw.update(kw)
@@ -96,6 +141,11 @@ class MetaEvent(AbstractEvent):
     metacommand = 0x0
     name = 'Meta Event'
 
+    def __init__(self, **kw):
+        # metacommand is fixed by the class
+        kw.pop('metacommand', None)
+        super(MetaEvent, self).__init__(**kw)
+
     def is_event(cls, statusmsg):
         return (statusmsg == 0xFF)
     is_event = classmethod(is_event)
@@ -108,19 +158,18 @@ and NoteOff events.
 """
 
 class NoteEvent(Event):
-    #__slots__ = ['pitch', 'velocity']
     length = 2
 
     def get_pitch(self):
         return self.data[0]
     def set_pitch(self, val):
-        self.data[0] = val
+        self.set_datum(0, val)
     pitch = property(get_pitch, set_pitch)
 
     def get_velocity(self):
         return self.data[1]
     def set_velocity(self, val):
-        self.data[1] = val
+        self.set_datum(1, val)
     velocity = property(get_velocity, set_velocity)
 
 class NoteOnEvent(NoteEvent):
@@ -139,59 +188,55 @@ class AfterTouchEvent(Event):
     def get_pitch(self):
         return self.data[0]
     def set_pitch(self, val):
-        self.data[0] = val
+        self.set_datum(0, val)
     pitch = property(get_pitch, set_pitch)
 
     def get_value(self):
         return self.data[1]
     def set_value(self, val):
-        self.data[1] = val
+        self.set_datum(1, val)
     value = property(get_value, set_value)
 
 class ControlChangeEvent(Event):
-    #__slots__ = ['control', 'value']
     statusmsg = 0xB0
     length = 2
     name = 'Control Change'
 
     def set_control(self, val):
-        self.data[0] = val
+        self.set_datum(0, val)
     def get_control(self):
         return self.data[0]
     control = property(get_control, set_control)
 
     def set_value(self, val):
-        self.data[1] = val
+        self.set_datum(1, val)
     def get_value(self):
         return self.data[1]
     value = property(get_value, set_value)
 
 class ProgramChangeEvent(Event):
-    #__slots__ = ['value']
     statusmsg = 0xC0
     length = 1
     name = 'Program Change'
 
     def set_value(self, val):
-        self.data[0] = val
+        self.set_datum(0, val)
     def get_value(self):
         return self.data[0]
     value = property(get_value, set_value)
 
 class ChannelAfterTouchEvent(Event):
-    #__slots__ = ['value']
     statusmsg = 0xD0
     length = 1
     name = 'Channel After Touch'
 
     def set_value(self, val):
-        self.data[1] = val
+        self.set_datum(1, val)
     def get_value(self):
         return self.data[1]
     value = property(get_value, set_value)
 
 class PitchWheelEvent(Event):
-    #__slots__ = ['pitch']
     statusmsg = 0xE0
     length = 2
     name = 'Pitch Wheel'
@@ -200,8 +245,7 @@ class PitchWheelEvent(Event):
         return ((self.data[1] << 7) | self.data[0]) - 0x2000
     def set_pitch(self, pitch):
         value = pitch + 0x2000
-        self.data[0] = value & 0x7F
-        self.data[1] = (value >> 7) & 0x7F
+        self.data = (value & 0x7F, (value >> 7) & 0x7F)
     pitch = property(get_pitch, set_pitch)
 
 class SysexEvent(Event):
@@ -219,10 +263,18 @@ class SequenceNumberMetaEvent(MetaEvent):
     length = 2
 
 class MetaEventWithText(MetaEvent):
+    # text is decoded from data on access instead of stored per event
+    def get_text(self):
+        return ''.join(chr(datum) for datum in self.data)
+    def set_text(self, val):
+        self.data = tuple(ord(c) for c in val)
+    text = property(get_text, set_text)
+
     def __init__(self, **kw):
+        if 'text' in kw and 'data' in kw:
+            kw = kw.copy()
+            del kw['text']
         super(MetaEventWithText, self).__init__(**kw)
-        if 'text' not in kw:
-            self.text = ''.join(chr(datum) for datum in self.data)
 
     def __repr__(self):
         return self.__baserepr__(['text'])
@@ -269,9 +321,9 @@ class ProgramNameEvent(MetaEventWithText):
 
 class UnknownMetaEvent(MetaEvent):
     name = 'Unknown'
-    # This class variable must be overriden by code calling the constructor,
-    # which sets a local variable of the same name to shadow the class variable.
-    metacommand = None
+    # The metacommand is stored per instance and must be set by code
+    # calling the constructor.
+    __slots__ = ['metacommand']
 
     def __init__(self, **kw):
         super(MetaEvent, self).__init__(**kw)
@@ -299,7 +351,8 @@ class EndOfTrackEvent(MetaEvent):
     metacommand = 0x2F
 
 class SetTempoEvent(MetaEvent):
-    #__slots__ = ['bpm', 'mpqn']
+    # mpt (milliseconds per tick) is set by the sequencer's TempoMap
+    __slots__ = ['mpt']
     name = 'Set Tempo'
     metacommand = 0x51
     length = 3
@@ -315,7 +368,7 @@ class SetTempoEvent(MetaEvent):
         vals = [self.data[x] << (16 - (8 * x)) for x in range(3)]
         return sum(vals)
     def set_mpqn(self, val):
-        self.data = [(val >> (16 - (8 * x)) & 0xFF) for x in range(3)]
+        self.data = tuple((val >> (16 - (8 * x)) & 0xFF) for x in range(3))
     mpqn = property(get_mpqn, set_mpqn)
 
     def __repr__(self):
@@ -326,7 +379,6 @@ class SmpteOffsetEvent(MetaEvent):
     metacommand = 0x54
 
 class TimeSignatureEvent(MetaEvent):
-    #__slots__ = ['numerator', 'denominator', 'metronome', 'thirtyseconds']
     name = 'Time Signature'
     metacommand = 0x58
     length = 4
@@ -334,32 +386,31 @@ class TimeSignatureEvent(MetaEvent):
     def get_numerator(self):
         return self.data[0]
     def set_numerator(self, val):
-        self.data[0] = val
+        self.set_datum(0, val)
     numerator = property(get_numerator, set_numerator)
 
     def get_denominator(self):
         return 2 ** self.data[1]
     def set_denominator(self, val):
-        self.data[1] = int(math.log(val, 2))
+        self.set_datum(1, int(math.log(val, 2)))
     denominator = property(get_denominator, set_denominator)
 
     def get_metronome(self):
         return self.data[2]
     def set_metronome(self, val):
-        self.data[2] = val
+        self.set_datum(2, val)
     metronome = property(get_metronome, set_metronome)
 
     def get_thirtyseconds(self):
         return self.data[3]
     def set_thirtyseconds(self, val):
-        self.data[3] = val
+        self.set_datum(3, val)
     thirtyseconds = property(get_thirtyseconds, set_thirtyseconds)
 
     def __repr__(self):
         return self.__baserepr__(['numerator','denominator','metronome','thirtyseconds'])
 
 class KeySignatureEvent(MetaEvent):
-    #__slots__ = ['alternatives', 'minor']
     name = 'Key Signature'
     metacommand = 0x59
     length = 2
@@ -368,15 +419,53 @@ class KeySignatureEvent(MetaEvent):
         d = self.data[0]
         return d - 256 if d > 127 else d
     def set_alternatives(self, val):
-        self.data[0] = 256 + val if val < 0 else val
+        self.set_datum(0, 256 + val if val < 0 else val)
     alternatives = property(get_alternatives, set_alternatives)
 
     def get_minor(self):
         return self.data[1]
     def set_minor(self, val):
-        self.data[1] = val
+        self.set_datum(1, val)
     minor = property(get_minor, set_minor)
 
 class SequencerSpecificEvent(MetaEvent):
     name = 'Sequencer Specific'
     metacommand = 0x7F
+
+# number of data bytes following a channel status byte, by high nibble
+CHANNEL_EVENT_LENGTH = [0] * 16
+for _key, _cls in list(EventRegistry.Events.items()):
+    if type(_key) is int and type(_cls.length) is int and _key < 0xF0:
+        CHANNEL_EVENT_LENGTH[_key >> 4] = _cls.length
+
+# event class for every status byte and every meta command
+STATUS_CLASS = [None] * 256
+for _status in range(0x80, 0xF0):
+    STATUS_CLASS[_status] = EventRegistry.Events[_status & 0xF0]
+META_CLASS = [UnknownMetaEvent] * 256
+for _cmd in range(256):
+    META_CLASS[_cmd] = EventRegistry.MetaEvents.get(_cmd, UnknownMetaEvent)
+
+def keep_tables(keep):
+    # Turn a keep= collection of event classes, status bytes and ranges
+    # of status bytes into lookup tables by status byte and by meta
+    # command.  End of track is always kept, so the track length stays.
+    if keep is None:
+        return None
+    status = [False] * 256
+    meta = [False] * 256
+    for item in keep:
+        if isinstance(item, type):
+            for st in range(0x80, 0xF0):
+                status[st] = status[st] or issubclass(STATUS_CLASS[st], item)
+            status[0xF0] = status[0xF0] or issubclass(SysexEvent, item)
+            for cmd in range(256):
+                meta[cmd] = meta[cmd] or issubclass(META_CLASS[cmd], item)
+        else:
+            for st in ([item] if isinstance(item, int) else item):
+                status[st] = True
+                if st == 0xFF:
+                    meta = [True] * 256
+    meta[EndOfTrackEvent.metacommand] = True
+    status[0xFF] = True
+    return status, meta
@@ -1,12 +1,42 @@
 from warnings import *
 
+import mmap
+import shutil
+from tempfile import SpooledTemporaryFile
+from itertools import groupby
+from operator import itemgetter
 from .containers import *
 from .events import *
-from struct import unpack, pack
+from struct import unpack, unpack_from, pack
 from .constants import *
 from .util import *
 
+# Decoder dispatch on the status byte: data bytes continue the running
+# status, 0x80-0xEF are channel messages, 0xF0 starts a sysex and 0xFF a
+# meta event.  Anything else cannot appear in a track chunk.
+RUNNING_STATUS, CHANNEL_EVENT, META_EVENT, SYSEX_EVENT, BAD_STATUS = range(5)
+STATUS_KIND = [RUNNING_STATUS] * 0x80 + [CHANNEL_EVENT] * 0x70 + [BAD_STATUS] * 0x10
+STATUS_KIND[0xF0] = SYSEX_EVENT
+STATUS_KIND[0xFF] = META_EVENT
+STATUS_LENGTH = [0] * 256
+for _status in range(0x80, 0xF0):
+    STATUS_LENGTH[_status] = STATUS_CLASS[_status].length
+
+# Channel event payloads are immutable tuples, so all events with the same
+# data bytes share one; keyed by the data bytes (0x10000 set for two bytes)
+CHANNEL_PAYLOADS = {}
+
 class FileReader(object):
+    def __init__(self, keep=None, keep_raw=False):
+        # keep: optional set of event classes and/or status bytes (ints
+        # or ranges) to decode; every other event is skipped unparsed.
+        # keep_raw: store each complete MTrk chunk as track.raw, so an
+        # unchanged track is written back byte for byte without encoding
+        # (see Track.raw_chunk()).
+        self.keep = keep
+        self.keep_tables = keep_tables(keep)
+        self.keep_raw = keep_raw and keep is None
+
     def read(self, midifile):
         pattern = self.parse_file_header(midifile)
         for track in pattern:
@@ -43,67 +73,431 @@ class FileReader(object):
         trksz = unpack(">L", midifile.read(4))[0]
         return trksz
 
+    # The running status is passed through the parse methods rather than
+    # kept on the reader, so one FileReader can decode several tracks at
+    # the same time.
+
     def parse_track(self, midifile, track):
-        self.RunningStatus = None
         trksz = self.parse_track_header(midifile)
-        trackdata = iter(midifile.read(trksz))
-        while True:
-            try:
-                event = self.parse_midi_event(trackdata)
-                track.append(event)
-            except StopIteration:
-                break
-
-    def parse_midi_event(self, trackdata):
-        # first datum is varlen representing delta-time
-        tick = read_varlen(trackdata)
-        # next byte is status message
-        stsmsg = next(trackdata)
-        # is the event a MetaEvent?
-        if MetaEvent.is_event(stsmsg):
-            cmd = next(trackdata)
-            if cmd not in EventRegistry.MetaEvents:
-                warn("Unknown Meta MIDI Event: " + repr(cmd), Warning)
-                cls = UnknownMetaEvent
-            else:
-                cls = EventRegistry.MetaEvents[cmd]
-            datalen = read_varlen(trackdata)
-            data = [next(trackdata) for x in range(datalen)]
-            return cls(tick=tick, data=data, metacommand=cmd)
-        # is this event a Sysex Event?
-        elif SysexEvent.is_event(stsmsg):
-            data = []
-            while True:
-                datum = next(trackdata)
-                if datum == 0xF7:
+        trackdata = midifile.read(trksz)
+        if len(trackdata) < trksz:
+            warn_truncated("track chunk ends %d byte(s) early" % (trksz - len(trackdata)))
+        # the plain list append: a track being filled has no cached ticks
+        track.invalidate()
+        stop, status, carry = self.parse_events(trackdata, 0, len(trackdata), None,
+                                                list.append.__get__(track))
+        if stop < len(trackdata):
+            warn_truncated("incomplete event at byte %d of the track, %d byte(s) dropped"
+                            % (stop, len(trackdata) - stop))
+        elif self.keep_raw and len(trackdata) == trksz:
+            track.set_raw(b'MTrk' + pack(">L", trksz) + trackdata)
+
+    def iter_events(self, midifile, ntracks, blocksize=STREAM_BLOCKSIZE):
+        # Generator over (track_index, event).  Track data is pulled from
+        # the file blocksize bytes at a time, so memory use does not
+        # depend on the length of the file.  An event split by the end of
+        # a block is carried over and decoded with the next block.
+        for index in range(ntracks):
+            trksz = self.parse_track_header(midifile)
+            status = None
+            carry = 0
+            pending = b''
+            offset = 0
+            remaining = trksz
+            while remaining > 0:
+                block = midifile.read(min(remaining, blocksize))
+                if not block:
+                    warn_truncated("track %d ends %d byte(s) early" % (index, remaining))
                     break
-                data.append(datum)
-            return SysexEvent(tick=tick, data=data)
-        # not a Meta MIDI event or a Sysex event, must be a general message
+                remaining -= len(block)
+                data = pending + block
+                events = []
+                stop, status, carry = self.parse_events(data, 0, len(data), status,
+                                                        events.append, carry)
+                pending = data[stop:]
+                offset += stop
+                for event in events:
+                    yield index, event
+            if pending:
+                warn_truncated("incomplete event at byte %d of track %d, %d byte(s) dropped"
+                                % (offset, index, len(pending)))
+
+    def parse_events(self, data, pos, end, status, append, carry=0):
+        # Decode the events in data[pos:end] and append them.  Every read
+        # is checked against end, so running off the end of the data never
+        # raises; the decoder stops in front of the incomplete event and
+        # returns its position (end if everything was decoded) together
+        # with the running status and carry, the delta ticks of skipped
+        # events not yet added to a decoded one.
+        kinds = STATUS_KIND
+        classes = STATUS_CLASS
+        lengths = STATUS_LENGTH
+        payloads = CHANNEL_PAYLOADS
+        if self.keep_tables is None:
+            keep_status = keep_meta = None
         else:
-            key = stsmsg & 0xF0
-            if key not in EventRegistry.Events:
-                assert self.RunningStatus, "Bad byte value"
-                data = []
-                key = self.RunningStatus & 0xF0
-                cls = EventRegistry.Events[key]
-                channel = self.RunningStatus & 0x0F
-                data.append(stsmsg)
-                data += [next(trackdata) for x in range(cls.length - 1)]
-                return cls(tick=tick, channel=channel, data=data)
+            keep_status, keep_meta = self.keep_tables
+        while pos < end:
+            start = pos
+            # first datum is varlen representing delta-time
+            datum = data[pos]
+            pos += 1
+            tick = datum & 0x7F
+            while datum & 0x80:
+                if pos >= end:
+                    return start, status, carry
+                datum = data[pos]
+                pos += 1
+                tick = (tick << 7) | (datum & 0x7F)
+            if pos >= end:
+                return start, status, carry
+            # next byte is status message, or data under running status
+            stsmsg = data[pos]
+            kind = kinds[stsmsg]
+            if kind == CHANNEL_EVENT:
+                length = lengths[stsmsg]
+                if pos + 1 + length > end:
+                    return start, status, carry
+                status = stsmsg
+                if keep_status is None or keep_status[status]:
+                    key = (data[pos+1] << 8 | data[pos+2] | 0x10000) if length == 2 else data[pos+1]
+                    payload = payloads.get(key)
+                    if payload is None:
+                        payload = payloads[key] = tuple(data[pos+1:pos+1+length])
+                    append(classes[status].make(carry + tick, payload, status & 0x0F))
+                    carry = 0
+                else:
+                    carry += tick
+                pos += 1 + length
+            elif kind == RUNNING_STATUS:
+                if status is None:
+                    raise TypeError("Bad byte value 0x%02X without running status" % stsmsg)
+                length = lengths[status]
+                if pos + length > end:
+                    return start, status, carry
+                if keep_status is None or keep_status[status]:
+                    key = (stsmsg << 8 | data[pos+1] | 0x10000) if length == 2 else stsmsg
+                    payload = payloads.get(key)
+                    if payload is None:
+                        payload = payloads[key] = tuple(data[pos:pos+length])
+                    append(classes[status].make(carry + tick, payload, status & 0x0F))
+                    carry = 0
+                else:
+                    carry += tick
+                pos += length
+            elif kind == META_EVENT:
+                if pos + 2 >= end:
+                    return start, status, carry
+                cmd = data[pos+1]
+                pos += 2
+                datum = 0x80
+                datalen = 0
+                while datum & 0x80:
+                    if pos >= end:
+                        return start, status, carry
+                    datum = data[pos]
+                    pos += 1
+                    datalen = (datalen << 7) | (datum & 0x7F)
+                if pos + datalen > end:
+                    return start, status, carry
+                if keep_meta is None or keep_meta[cmd]:
+                    event = META_CLASS[cmd].make(carry + tick, tuple(data[pos:pos+datalen]))
+                    if type(event) is UnknownMetaEvent:
+                        warn("Unknown Meta MIDI Event: " + repr(cmd), Warning)
+                        event.metacommand = cmd
+                    append(event)
+                    carry = 0
+                else:
+                    carry += tick
+                pos += datalen
+            elif kind == SYSEX_EVENT:
+                stop = pos + 1
+                while stop < end and data[stop] != 0xF7:
+                    stop += 1
+                if stop >= end:
+                    return start, status, carry
+                if keep_status is None or keep_status[0xF0]:
+                    append(SysexEvent.make(carry + tick, tuple(data[pos+1:stop])))
+                    carry = 0
+                else:
+                    carry += tick
+                pos = stop + 1
             else:
-                self.RunningStatus = stsmsg
-                cls = EventRegistry.Events[key]
-                channel = self.RunningStatus & 0x0F
-                data = [next(trackdata) for x in range(cls.length)]
-                return cls(tick=tick, channel=channel, data=data)
-        raise Warning("Unknown MIDI Event: " + repr(stsmsg))
+                raise TypeError("Unknown MIDI Event: " + repr(stsmsg))
+        return pos, status, carry
+
+    def read_buffer(self, buf):
+        # Decode a complete MIDI file image held in bytes, a bytearray or
+        # an mmap.  Chunks are walked with an integer cursor through a
+        # memoryview, so neither the tracks nor the payloads get copied
+        # before they are turned into events.
+        data = memoryview(buf)
+        try:
+            pattern, pos = self.parse_buffer_header(data)
+            for track in pattern:
+                pos = self.parse_buffer_track(data, pos, track)
+        finally:
+            data.release()
+        return pattern
+
+    def read_index(self, buf):
+        # Only walk the chunk headers; tracks are decoded by the returned
+        # LazyPattern the first time they are accessed.
+        data = memoryview(buf)
+        try:
+            pattern, pos = self.parse_buffer_header(data)
+            chunks = []
+            for x in range(len(pattern)):
+                magic = data[pos:pos+4].tobytes()
+                if magic != b'MTrk':
+                    raise TypeError("Bad track header in MIDI file: " + str(magic))
+                chunks.append(pos)
+                pos += 8 + unpack_from(">L", data, pos + 4)[0]
+        finally:
+            data.release()
+        return LazyPattern(buf, chunks, resolution=pattern.resolution,
+                            format=pattern.format, reader=self)
+
+    def read_parallel(self, buf, parallel='thread', workers=None):
+        # Tracks are independent once their chunk offsets are known, so
+        # they are decoded by a pool of threads sharing this reader and
+        # the buffer, and put back in file order.  Decoding holds the
+        # GIL, so this only pays off on a free-threaded Python.  There is
+        # no process mode: the parent would have to build or unpickle
+        # every event object itself, which costs as much as decoding.
+        from concurrent.futures import ThreadPoolExecutor
+        if parallel != 'thread':
+            raise ValueError("Unknown parallel mode: " + repr(parallel))
+        index = self.read_index(buf)
+        with ThreadPoolExecutor(workers) as pool:
+            tracks = list(pool.map(index.decode_track, range(len(index))))
+        return Pattern(tracks=tracks, resolution=index.resolution,
+                        format=index.format)
+
+    def parse_buffer_header(self, data):
+        magic = data[0:4].tobytes()
+        if magic != b'MThd':
+            raise TypeError("Bad header in MIDI file." + str(magic))
+        hdrsz, format, ntracks, resolution = unpack_from(">LHHH", data, 4)
+        tracks = [Track() for x in range(ntracks)]
+        # skip any padding after the standard header fields
+        pos = 8 + max(hdrsz, DEFAULT_MIDI_HEADER_SIZE - 8)
+        return Pattern(tracks=tracks, resolution=resolution, format=format), pos
+
+    def parse_buffer_track(self, data, pos, track):
+        magic = data[pos:pos+4].tobytes()
+        if magic != b'MTrk':
+            raise TypeError("Bad track header in MIDI file: " + str(magic))
+        trksz = unpack_from(">L", data, pos + 4)[0]
+        start = pos + 8
+        end = min(start + trksz, len(data))
+        if end < start + trksz:
+            warn_truncated("track chunk at byte %d ends %d byte(s) early"
+                            % (pos, start + trksz - end))
+        track.invalidate()
+        stop, status, carry = self.parse_events(data, start, end, None,
+                                                list.append.__get__(track))
+        if stop < end:
+            warn_truncated("incomplete event at byte %d of the track chunk at byte %d, %d byte(s) dropped"
+                            % (stop - start, pos, end - stop))
+        elif self.keep_raw and end == start + trksz:
+            track.set_raw(bytes(data[pos:end]))
+        return start + trksz
+
+class EventStream(object):
+    """
+    Iterator over the (track_index, event) pairs of a MIDI file, read
+    incrementally.  The header is parsed up front, so format, resolution
+    and the number of tracks are known before the first event.  Ticks
+    are relative, as in a Track read by read_midifile.
+    """
+
+    def __init__(self, midifile, blocksize=STREAM_BLOCKSIZE, keep=None):
+        self.reader = FileReader(keep)
+        header = self.reader.parse_file_header(midifile)
+        self.midifile = midifile
+        self.format = header.format
+        self.resolution = header.resolution
+        self.ntracks = len(header)
+        self.events = self.reader.iter_events(midifile, self.ntracks, blocksize)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.events)
+
+    def tracks(self):
+        # Yield (track_index, events) with events an iterator over one
+        # track, without ever holding a whole track in memory.
+        for index, group in groupby(self, key=itemgetter(0)):
+            yield index, (event for i, event in group)
+
+class TrackChunk(object):
+    # A slot of a LazyPattern: where the MTrk chunk of a track starts in
+    # the buffer, and the track once it has been decoded.  The slot moves
+    # with the track when tracks are inserted, deleted or reordered.
+    __slots__ = ('pos', 'track')
+
+    def __init__(self, pos):
+        self.pos = pos
+        self.track = None
+
+class LazyPattern(Pattern):
+    """
+    Pattern backed by a chunk index into the raw file buffer.  A track is
+    decoded on first access and kept afterwards; track_names() reads the
+    name and instrument from the start of a chunk without decoding it.
+    Tracks can be added, removed and reordered like in any Pattern; the
+    ones put in that were not read from the buffer are plain tracks.
+    """
+
+    def __init__(self, data, chunks, resolution=220, format=1, reader=None):
+        self.data = data
+        self.reader = reader or FileReader()
+        super(LazyPattern, self).__init__(tracks=[TrackChunk(pos) for pos in chunks],
+                            resolution=resolution, format=format)
+
+    def slot(self, index):
+        # the TrackChunk of track index, or None for a plain track
+        slot = list.__getitem__(self, index)
+        return slot if type(slot) is TrackChunk else None
+
+    def chunk(self, index):
+        # raw bytes of the MTrk chunk, header included; a plain track is
+        # encoded
+        slot = self.slot(index)
+        if slot is None:
+            return bytes(FileWriter().encode_track(list.__getitem__(self, index)))
+        pos = slot.pos
+        return bytes(self.data[pos:pos + 8 + unpack_from(">L", self.data, pos + 4)[0]])
+
+    def is_decoded(self, index):
+        slot = self.slot(index)
+        return slot is None or slot.track is not None
+
+    def raw_track(self, index):
+        # A track that was never decoded can't have been changed: its
+        # chunk is written as it is, unless it is cut short in the file
+        # or the reader drops events with keep=
+        if self.is_decoded(index):
+            track = self.decode_track(index)
+            return track.raw_chunk() if hasattr(track, 'raw_chunk') else None
+        if self.reader.keep is not None:
+            return None
+        chunk = self.chunk(index)
+        if len(chunk) < 8 or len(chunk) < 8 + unpack_from(">L", chunk, 4)[0]:
+            return None
+        return chunk
+
+    def decode_track(self, index):
+        slot = list.__getitem__(self, index)
+        if type(slot) is not TrackChunk:
+            return slot
+        if slot.track is None:
+            track = Track()
+            data = memoryview(self.data)
+            try:
+                self.reader.parse_buffer_track(data, slot.pos, track)
+            finally:
+                data.release()
+            slot.track = track
+        return slot.track
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            indices = item.indices(len(self))
+            return Pattern(resolution=self.resolution, format=self.format,
+                            tracks=[self.decode_track(i) for i in range(*indices)])
+        return self.decode_track(item)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.decode_track(index)
+
+    def __contains__(self, track):
+        return any(item is track or item == track for item in self)
+
+    def pop(self, index=-1):
+        track = self.decode_track(index)
+        list.pop(self, index)
+        return track
+
+    def index(self, track, *args):
+        return list(self).index(track, *args)
+
+    def remove(self, track):
+        list.__delitem__(self, self.index(track))
+
+    def __repr__(self):
+        return "midi.LazyPattern(format=%r, resolution=%r, tracks=%d)" % \
+            (self.format, self.resolution, len(self))
+
+    def track_names(self, index):
+        # Scan the events up to the first note for the TrackNameEvent and
+        # InstrumentNameEvent, skipping everything else at byte level.
+        names = {TrackNameEvent.metacommand: None,
+                 InstrumentNameEvent.metacommand: None}
+        slot = self.slot(index)
+        if slot is None or slot.track is not None:
+            # decoded, and maybe changed since
+            for event in self.decode_track(index):
+                if type(event) in (NoteOnEvent, NoteOffEvent):
+                    break
+                if type(event) in (TrackNameEvent, InstrumentNameEvent) and \
+                        names[event.metacommand] is None:
+                    names[event.metacommand] = event.text
+            return (names[TrackNameEvent.metacommand],
+                    names[InstrumentNameEvent.metacommand])
+        data = self.data
+        pos = slot.pos
+        end = min(pos + 8 + unpack_from(">L", data, pos + 4)[0], len(data))
+        pos += 8
+        running = 0
+        try:
+            while pos < end:
+                tick, pos = read_varlen_at(data, pos)
+                stsmsg = data[pos]
+                if stsmsg == 0xFF:
+                    cmd = data[pos+1]
+                    datalen, pos = read_varlen_at(data, pos + 2)
+                    if cmd in names and names[cmd] is None:
+                        names[cmd] = bytes(data[pos:pos+datalen]).decode('latin-1')
+                    pos += datalen
+                elif stsmsg == 0xF0:
+                    while data[pos] != 0xF7:
+                        pos += 1
+                    pos += 1
+                else:
+                    if stsmsg & 0x80:
+                        running = stsmsg
+                        pos += 1
+                    elif not running:
+                        break
+                    if running & 0xE0 == 0x80:
+                        # NoteOn/NoteOff: the names have been given by now
+                        break
+                    pos += CHANNEL_EVENT_LENGTH[running >> 4]
+        except IndexError:
+            pass
+        return (names[TrackNameEvent.metacommand],
+                names[InstrumentNameEvent.metacommand])
 
 class FileWriter(object):
     def write(self, midifile, pattern):
         self.write_file_header(midifile, pattern)
-        for track in pattern:
-            self.write_track(midifile, track)
+        if not isinstance(pattern, Pattern):
+            for track in pattern:
+                self.write_track(midifile, track)
+            return
+        # unchanged tracks are copied as they were read, and the tracks
+        # of a LazyPattern that were never accessed are not even decoded
+        for index in range(len(pattern)):
+            raw = pattern.raw_track(index)
+            if raw is None:
+                self.write_track(midifile, pattern[index])
+            else:
+                midifile.write(raw)
 
     def write_file_header(self, midifile, pattern):
         # First four bytes are MIDI header
@@ -111,52 +505,294 @@ class FileWriter(object):
                             pattern.format,
                             len(pattern),
                             pattern.resolution)
-        midifile.write('MThd%s' % packdata)
+        midifile.write(b'MThd' + packdata)
 
     def write_track(self, midifile, track):
-        buf = ''
+        # one write per track, header included
+        midifile.write(self.encode_track(track))
+
+    def encode_track(self, track):
+        # The header is reserved at the front of the buffer and filled in
+        # once the length is known, so the track is never copied.
+        raw = track.raw_chunk() if hasattr(track, 'raw_chunk') else None
+        if raw is not None:
+            return raw
+        buf = bytearray(8)
         self.RunningStatus = None
         for event in track:
-            buf += self.encode_midi_event(event)
-        buf = self.encode_track_header(len(buf)) + buf
-        midifile.write(buf)
+            self.encode_midi_event(event, buf)
+        buf[0:8] = self.encode_track_header(len(buf) - 8)
+        return buf
 
     def encode_track_header(self, trklen):
-        return 'MTrk%s' % pack(">L", trklen)
+        return b'MTrk' + pack(">L", trklen)
 
-    def encode_midi_event(self, event):
-        ret = ''
-        ret += write_varlen(event.tick)
+    def encode_midi_event(self, event, buf=None, tick=None):
+        # Appends the encoded event to buf, or to a new bytearray; tick
+        # overrides event.tick as the delta written
+        ret = bytearray() if buf is None else buf
+        ret += write_varlen(event.tick if tick is None else tick)
         # is the event a MetaEvent?
         if isinstance(event, MetaEvent):
-            ret += chr(event.statusmsg) + chr(event.metacommand)
+            ret.append(event.statusmsg)
+            ret.append(event.metacommand)
             ret += write_varlen(len(event.data))
-            ret += str.join('', list(map(chr, event.data)))
+            ret += bytes(event.data)
+            # meta and sysex events cancel running status
+            self.RunningStatus = None
         # is this event a Sysex Event?
         elif isinstance(event, SysexEvent):
-            ret += chr(0xF0)
-            ret += str.join('', list(map(chr, event.data)))
-            ret += chr(0xF7)
+            ret.append(0xF0)
+            ret += bytes(event.data)
+            ret.append(0xF7)
+            self.RunningStatus = None
         # not a Meta MIDI event or a Sysex event, must be a general message
         elif isinstance(event, Event):
             if not self.RunningStatus or \
                 self.RunningStatus.statusmsg != event.statusmsg or \
                 self.RunningStatus.channel != event.channel:
                     self.RunningStatus = event
-                    ret += chr(event.statusmsg | event.channel)
-            ret += str.join('', list(map(chr, event.data)))
+                    ret.append(event.statusmsg | event.channel)
+            ret += bytes(event.data)
         else:
             raise ValueError("Unknown MIDI Event: " + str(event))
         return ret
 
+class StreamWriter(FileWriter):
+    """
+    Writes a MIDI file one event at a time.
+
+    Events go through a block buffer straight to the file.  On seekable
+    output each MTrk length is patched in when its track ends, and the
+    MThd track count on close().  Unseekable output can't be patched, so
+    the current track is spooled (to disk once it outgrows
+    STREAM_SPOOL_SIZE) and written when it ends; without ntracks the
+    finished tracks are spooled as well until the count is known.
+    Either way memory use does not grow with the track length.
+
+    With tick_relative=False event ticks are absolute and the deltas are
+    worked out here.  A track that doesn't end with an EndOfTrackEvent
+    gets one.
+    """
+
+    def __init__(self, midifile, resolution=220, format=1, ntracks=None, tick_relative=True):
+        self.owned = type(midifile) in (str, str)
+        if self.owned:
+            midifile = open(midifile, 'wb')
+        self.midifile = midifile
+        self.resolution = resolution
+        self.format = format
+        self.ntracks = ntracks
+        self.tick_relative = tick_relative
+        try:
+            self.seekable = midifile.seekable()
+        except AttributeError:
+            self.seekable = False
+        self.tracks = 0
+        self.out = None
+        self.buf = bytearray()
+        self.body = None
+        if self.seekable:
+            self.start = midifile.tell()
+            self.write_header(midifile, ntracks or 0)
+        elif ntracks is not None:
+            self.write_header(midifile, ntracks)
+        else:
+            self.body = SpooledTemporaryFile(STREAM_SPOOL_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_header(self, midifile, ntracks):
+        midifile.write(b'MThd' + pack(">LHHH", 6, self.format, ntracks, self.resolution))
+
+    def begin_track(self):
+        if self.out is not None:
+            self.end_track()
+        self.RunningStatus = None
+        self.last = 0
+        self.ended = False
+        self.length = 0
+        if self.seekable:
+            self.track_start = self.midifile.tell()
+            self.midifile.write(self.encode_track_header(0))
+            self.out = self.midifile
+        else:
+            self.out = SpooledTemporaryFile(STREAM_SPOOL_SIZE)
+
+    def write_event(self, event):
+        if self.out is None:
+            self.begin_track()
+        tick = event.tick
+        if not self.tick_relative:
+            if tick < self.last:
+                raise ValueError("Event at tick %d after tick %d: %s" % (tick, self.last, event))
+            tick, self.last = tick - self.last, tick
+        self.encode_midi_event(event, self.buf, tick)
+        self.ended = isinstance(event, EndOfTrackEvent)
+        if len(self.buf) >= STREAM_BLOCKSIZE:
+            self.flush_events()
+
+    def write_events(self, events):
+        if not self.tick_relative:
+            for event in events:
+                self.write_event(event)
+            return
+        if self.out is None:
+            self.begin_track()
+        encode = self.encode_midi_event
+        buf = self.buf
+        event = None
+        for event in events:
+            encode(event, buf)
+            if len(buf) >= STREAM_BLOCKSIZE:
+                self.flush_events()
+        if event is not None:
+            self.ended = isinstance(event, EndOfTrackEvent)
+
+    def add_track(self, track):
+        # a whole track of events; an unchanged track read with keep_raw
+        # is copied as it is
+        raw = track.raw_chunk() if hasattr(track, 'raw_chunk') else None
+        if raw is not None and self.tick_relative:
+            self.end_track()
+            (self.midifile if self.body is None else self.body).write(raw)
+            self.tracks += 1
+            return
+        self.begin_track()
+        self.write_events(track)
+        self.end_track()
+
+    def flush_events(self):
+        self.out.write(self.buf)
+        self.length += len(self.buf)
+        del self.buf[:]
+
+    def end_track(self):
+        if self.out is None:
+            return
+        if not self.ended:
+            self.encode_midi_event(EndOfTrackEvent(), self.buf, 0)
+        self.flush_events()
+        if self.seekable:
+            pos = self.midifile.tell()
+            self.midifile.seek(self.track_start + 4)
+            self.midifile.write(pack(">L", self.length))
+            self.midifile.seek(pos)
+        else:
+            dest = self.midifile if self.body is None else self.body
+            dest.write(self.encode_track_header(self.length))
+            self.out.seek(0)
+            shutil.copyfileobj(self.out, dest, STREAM_BLOCKSIZE)
+            self.out.close()
+        self.out = None
+        self.tracks += 1
+
+    def close(self):
+        if self.midifile is None:
+            return
+        midifile = self.midifile
+        try:
+            self.end_track()
+            if self.seekable:
+                if self.ntracks != self.tracks:
+                    pos = midifile.tell()
+                    midifile.seek(self.start + 10)
+                    midifile.write(pack(">H", self.tracks))
+                    midifile.seek(pos)
+            elif self.body is not None:
+                self.write_header(midifile, self.tracks)
+                self.body.seek(0)
+                shutil.copyfileobj(self.body, midifile, STREAM_BLOCKSIZE)
+                self.body.close()
+            elif self.ntracks != self.tracks:
+                raise ValueError("Header announced %d tracks, %d written"
+                                 % (self.ntracks, self.tracks))
+            midifile.flush()
+        finally:
+            self.midifile = None
+            if self.owned:
+                midifile.close()
+
 def write_midifile(midifile, pattern):
     if type(midifile) in (str, str):
-        midifile = open(midifile, 'wb')
+        with open(midifile, 'wb') as f:
+            return FileWriter().write(f, pattern)
     writer = FileWriter()
     return writer.write(midifile, pattern)
 
-def read_midifile(midifile):
+def write_midifiles(items):
+    # Write an iterable of (midifile, pattern) pairs, e.g. one file per
+    # part, with a single writer.
+    writer = FileWriter()
+    for midifile, pattern in items:
+        if type(midifile) in (str, str):
+            with open(midifile, 'wb') as f:
+                writer.write(f, pattern)
+        else:
+            writer.write(midifile, pattern)
+
+def read_midifile(midifile, use_mmap=False, lazy=False, parallel=None, workers=None,
+                  keep=None, keep_raw=False):
+    # parallel is None or 'thread'
+    # keep limits decoding to a set of event classes and/or status bytes,
+    # e.g. keep={midi.NoteOnEvent, midi.NoteOffEvent, midi.SetTempoEvent}
+    # keep_raw keeps each track's chunk, so write_midifile copies the
+    # tracks that were not changed instead of encoding them
     if type(midifile) in (str, str):
-        midifile = open(midifile, 'rb')
-    reader = FileReader()
+        from .archive import open_midifile
+        # an mmap keeps a descriptor of its own, so the file is closed
+        # in any case
+        with open_midifile(midifile) as f:
+            return read_midifile(f, use_mmap, lazy, parallel, workers, keep, keep_raw)
+    reader = FileReader(keep, keep_raw)
+    if lazy:
+        # the buffer has to stay open for as long as tracks get decoded
+        return reader.read_index(map_midifile(midifile))
+    if use_mmap or parallel:
+        buf = map_midifile(midifile)
+        try:
+            if parallel:
+                return reader.read_parallel(buf, parallel, workers)
+            return reader.read_buffer(buf)
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
     return reader.read(midifile)
+
+def iter_midifile(midifile, blocksize=STREAM_BLOCKSIZE, keep=None):
+    if type(midifile) in (str, str):
+        from .archive import open_midifile
+        midifile = open_midifile(midifile)
+    return EventStream(midifile, blocksize, keep)
+
+def read_midifile_columnar(midifile):
+    # Decode every track into a ColumnarTrack of NumPy arrays instead of
+    # event objects.  Use ColumnarTrack.to_track() to get a Track back.
+    from .columnar import read_columnar
+    if type(midifile) in (str, str):
+        from .archive import open_midifile
+        with open_midifile(midifile) as f:
+            return read_columnar(f.read())
+    return read_columnar(midifile.read())
+
+def read_midifile_packed(midifile):
+    # Decode every track into a PackedTrack, which makes event objects
+    # only when they are accessed
+    from .columnar import read_packed
+    if type(midifile) in (str, str):
+        from .archive import open_midifile
+        with open_midifile(midifile) as f:
+            return read_packed(f.read())
+    return read_packed(midifile.read())
+
+def map_midifile(midifile):
+    # Memory-map an open MIDI file read-only.  Falls back to reading the
+    # whole stream for objects without a file descriptor (or empty files).
+    try:
+        return mmap.mmap(midifile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        return midifile.read()
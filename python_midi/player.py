@@ -0,0 +1,163 @@
+import abc
+import time
+import asyncio
+from .containers import *
+from .events import *
+from .constants import *
+from .fileio import *
+from .sequencer import *
+
+def iter_batches(pattern, quantum, tempomap=None):
+    # (time, [(tick, track index, event), ...]) for the playable events
+    # of pattern: everything but meta events, which only steer the
+    # timing.  Events less than quantum seconds after the first one of
+    # a batch go into the same batch, played at its time (in seconds).
+    quantum = quantum * 1e6
+    first = None
+    batch = []
+    for us, tick, index, event in iter_timed(pattern, tempomap):
+        if isinstance(event, MetaEvent):
+            continue
+        if batch and us >= first + quantum:
+            yield first / 1e6, batch
+            batch = []
+        if not batch:
+            first = us
+        batch.append((tick, index, event))
+    if batch:
+        yield first / 1e6, batch
+
+class Player(object):
+    """
+    Software sequencer: plays a Pattern into a sink on asyncio, timed
+    against the monotonic clock.
+
+    Every batch is due at a fixed offset from the start, so a late wakeup
+    never delays the batches after it.  Because the event loop wakes up
+    late, the player wakes up early by as much as it has lately been late,
+    learning the amount as it plays.  It then sleeps again for what is
+    left but PLAYER_SPIN seconds, and yields to the loop for those last
+    ones until the batch is due.  Events within quantum seconds of each
+    other are handed to the sink in one write() call.
+    """
+
+    def __init__(self, pattern, sink, quantum=PLAYER_QUANTUM, clock=time.monotonic):
+        self.pattern = pattern
+        self.sink = sink
+        self.quantum = quantum
+        self.clock = clock
+        # how much earlier than due to wake up
+        self.correction = 0.0
+        self.tempomap = TempoMap(pattern)
+        self.stopped = False
+        self.start = None
+
+    def stop(self):
+        self.stopped = True
+
+    async def wait_until(self, due):
+        wake = due - self.correction
+        delay = wake - self.clock()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            woke = self.clock()
+            # follow the worst lateness of sleeping at once and let it
+            # decay slowly, but never plan to wake more than a quantum early
+            late = woke - wake
+            if late > self.correction:
+                self.correction = late
+            else:
+                self.correction += PLAYER_DRIFT_GAIN * (late - self.correction)
+            self.correction = min(max(self.correction, 0.0), self.quantum)
+        woke = self.clock()
+        while due - woke > PLAYER_SPIN:
+            await asyncio.sleep(due - woke - PLAYER_SPIN)
+            woke = self.clock()
+        while woke < due:
+            await asyncio.sleep(0)
+            woke = self.clock()
+
+    async def play(self):
+        # Play the whole pattern; returns the number of batches written
+        self.start = self.clock() + self.quantum
+        batches = 0
+        try:
+            for offset, batch in iter_batches(self.pattern, self.quantum, self.tempomap):
+                if self.stopped:
+                    break
+                due = self.start + offset
+                await self.wait_until(due)
+                self.sink.write(batch, due)
+                batches += 1
+        finally:
+            self.sink.flush()
+        return batches
+
+def play(pattern, sink, quantum=PLAYER_QUANTUM):
+    # Play pattern into sink and return when it is done
+    return asyncio.run(Player(pattern, sink, quantum).play())
+
+class Sink(abc.ABC):
+    # Where a Player sends its batches: write() gets a list of
+    # (tick, track index, event) and the monotonic time they were due
+    @abc.abstractmethod
+    def write(self, batch, due):
+        pass
+
+    def flush(self):
+        # called once when playing ends
+        pass
+
+class LoopbackSink(Sink):
+    """
+    Keeps (due, delivered, tick, event) for every event played, both
+    times on the player's clock, e.g. to check or measure the timing.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.records = []
+
+    def write(self, batch, due):
+        delivered = self.clock()
+        self.records.extend((due, delivered, tick, event) for tick, index, event in batch)
+
+    def events(self):
+        return [event for due, delivered, tick, event in self.records]
+
+class FileSink(Sink):
+    """
+    Records what is played as a format 0 midifile, at the times the
+    events were delivered: one tick is one millisecond.
+    """
+
+    def __init__(self, midifile, clock=time.monotonic):
+        self.clock = clock
+        self.writer = StreamWriter(midifile, resolution=1000, format=0, ntracks=1,
+                                   tick_relative=False)
+        self.writer.begin_track()
+        # 1000 ticks per quarter note of 1000000 microseconds
+        self.writer.write_event(SetTempoEvent(tick=0, mpqn=1000000))
+        self.start = None
+
+    def write(self, batch, due):
+        delivered = self.clock()
+        if self.start is None:
+            self.start = delivered
+        tick = int((delivered - self.start) * 1000)
+        self.writer.write_events(event.with_tick(tick) for _, index, event in batch)
+
+    def flush(self):
+        self.writer.close()
+
+class AlsaSink(Sink):
+    # Sends every batch straight out of an ALSA sequencer (not through
+    # its queue; the player does the timing), with one drain per batch
+    def __init__(self, sequencer):
+        self.sequencer = sequencer
+
+    def write(self, batch, due):
+        self.sequencer.event_write_many((event for tick, index, event in batch), direct=True)
+
+    def flush(self):
+        self.sequencer.drain()
@@ -1,98 +1,176 @@
+from bisect import bisect_right
+from .containers import *
+from .events import *
+from .constants import *
+from .util import *
+
 class TempoMap(list):
-    def __init__(self, stream):
+    """
+    The SetTempoEvents of a stream in tick order, with the time each
+    tempo segment starts at.  tick2us() and us2tick() find the segment
+    with a bisect, so a query is O(log n) in the number of tempo changes;
+    ticks2us() and us2ticks() convert whole arrays of ticks or times at
+    once.  Up to the first tempo change the default of 120 bpm applies.
+    stream is anything with a resolution, e.g. a Pattern.
+    """
+
+    def __init__(self, stream, events=()):
         self.stream = stream
+        # segment starts; the first one is the default tempo at tick 0.
+        # Start times are kept exact, in microseconds times resolution.
+        self.ticks = [0]
+        self.mpqn = [DEFAULT_MPQN]
+        self.starts = [0]
+        # number of segments whose start time is up to date
+        self.valid = 1
+        self.arrays = None
+        for event in events:
+            self.add(event)
+        self.update()
+
+    @classmethod
+    def from_pattern(cls, pattern):
+        # the tempo map of all SetTempoEvents in pattern, in any track
+        tempomap = cls(pattern)
+        for tick, index, event in pattern.iter_merged():
+            if isinstance(event, SetTempoEvent):
+                tempomap.add(event, tick)
+        tempomap.update()
+        return tempomap
 
     def add_and_update(self, event):
         self.add(event)
         self.update()
 
-    def add(self, event):
-        # get tempo in microseconds per beat
-        tempo = event.mpqn
-        # convert into milliseconds per beat
-        tempo = tempo / 1000.0
-        # generate ms per tick
-        event.mpt = tempo / self.stream.resolution
-        self.append(event)
+    def add(self, event, tick=None):
+        # tick is the absolute tick of event, by default event.tick.
+        # Adding in tick order is O(1); times are brought up to date by
+        # update() or the next query.
+        if tick is None:
+            tick = event.tick
+        index = bisect_right(self.ticks, tick)
+        self.ticks.insert(index, tick)
+        self.mpqn.insert(index, event.mpqn)
+        self.starts.insert(index, 0)
+        self.insert(index - 1, event)
+        self.valid = min(self.valid, index)
+        self.arrays = None
 
     def update(self):
-        self.sort()
-        # adjust running time
-        last = None
-        for event in self:
-            if last:
-                event.msdelay = last.msdelay + \
-                    int(last.mpt * (event.tick - last.tick))
-            last = event
+        # Start times of the segments from the first one that changed,
+        # and the mpt (milliseconds per tick) and msdelay of the events
+        resolution = float(self.stream.resolution)
+        ticks, mpqn, starts = self.ticks, self.mpqn, self.starts
+        for index in range(max(self.valid, 1), len(ticks)):
+            starts[index] = starts[index - 1] + \
+                (ticks[index] - ticks[index - 1]) * mpqn[index - 1]
+        for index in range(max(self.valid, 1), len(ticks)):
+            event = self[index - 1]
+            event.mpt = mpqn[index] / 1000.0 / resolution
+            event.msdelay = int(starts[index] / resolution / 1000)
+        self.valid = len(ticks)
+
+    def segment(self, tick):
+        if self.valid < len(self.ticks):
+            self.update()
+        return max(bisect_right(self.ticks, tick) - 1, 0)
 
     def get_tempo(self, offset=0):
-        last = self[0]
-        for tm in self[1:]:
-            if tm.tick > offset:
-                return last
-            last = tm
-        return last
+        # the SetTempoEvent in effect at tick offset (the first one
+        # before any)
+        return self[max(self.segment(offset) - 1, 0)]
+
+    def tick2us(self, tick):
+        index = self.segment(tick)
+        return (self.starts[index] + (tick - self.ticks[index]) * self.mpqn[index]) / \
+            float(self.stream.resolution)
+
+    def us2tick(self, us):
+        if self.valid < len(self.ticks):
+            self.update()
+        scaled = us * self.stream.resolution
+        index = max(bisect_right(self.starts, scaled) - 1, 0)
+        return self.ticks[index] + (scaled - self.starts[index]) / float(self.mpqn[index])
+
+    def segment_arrays(self):
+        if self.valid < len(self.ticks):
+            self.update()
+        if self.arrays is None:
+            np = load_numpy()
+            self.arrays = (np.array(self.ticks, dtype=np.int64),
+                           np.array(self.mpqn, dtype=np.int64),
+                           np.array(self.starts, dtype=np.int64))
+        return self.arrays
+
+    def ticks2us(self, ticks):
+        # tick2us() of every tick, as a NumPy array (a list without NumPy)
+        np = load_numpy()
+        if np is None:
+            return [self.tick2us(tick) for tick in ticks]
+        starts_t, mpqn, starts = self.segment_arrays()
+        ticks = np.asarray(ticks, dtype=np.int64)
+        index = np.maximum(np.searchsorted(starts_t, ticks, side='right') - 1, 0)
+        return (starts[index] + (ticks - starts_t[index]) * mpqn[index]) / float(self.stream.resolution)
+
+    def us2ticks(self, times):
+        # us2tick() of every time in microseconds, as ticks2us()
+        np = load_numpy()
+        if np is None:
+            return [self.us2tick(us) for us in times]
+        starts_t, mpqn, starts = self.segment_arrays()
+        scaled = np.asarray(times, dtype=np.float64) * self.stream.resolution
+        index = np.maximum(np.searchsorted(starts, scaled, side='right') - 1, 0)
+        return starts_t[index] + (scaled - starts[index]) / mpqn[index]
+
+def iter_timed(pattern, tempomap=None):
+    # Generator over (time, tick, track index, event) for the events of
+    # all tracks of pattern in time order, time in microseconds.  The
+    # tracks are merged lazily and times follow the SetTempoEvents as
+    # they come by, so nothing is read ahead and each event costs O(1).
+    # The tempo changes are also added to tempomap, if one is given.
+    resolution = float(pattern.resolution)
+    # start of the current tempo segment, in microseconds times
+    # resolution as in TempoMap
+    segment_tick, segment_start, mpqn = 0, 0, DEFAULT_MPQN
+    for tick, index, event in merge_tracks(pattern, getattr(pattern, 'tick_relative', True)):
+        time = segment_start + (tick - segment_tick) * mpqn
+        yield time / resolution, tick, index, event
+        if isinstance(event, SetTempoEvent):
+            segment_tick, segment_start, mpqn = tick, time, event.mpqn
+            if tempomap is not None:
+                tempomap.add(event, tick)
+
+def iter_windows(pattern, window, tempomap=None):
+    # Generator over the events of all tracks of pattern in windows of
+    # window milliseconds: a list of (tick, track index, event) in time
+    # order for every window, empty ones included, up to the last event.
+    # Each window edge costs O(1).
+    width = window * 1000.0
+    edge = width
+    batch = []
+    for time, tick, index, event in iter_timed(pattern, tempomap):
+        while time >= edge:
+            yield batch
+            batch = []
+            edge += width
+        batch.append((tick, index, event))
+    if batch:
+        yield batch
 
 class EventStreamIterator(object):
+    """
+    Iterator over the windows of a Pattern that iter_windows() makes;
+    tempomap holds the tempo changes seen so far, for timing the events.
+    """
+
     def __init__(self, stream, window):
         self.stream = stream
-        self.trackpool = stream.trackpool
         self.window_length = window
-        self.window_edge = 0
-        self.leftover = None
-        self.events = self.stream.iterevents()
-        # First, need to look ahead to see when the
-        # tempo markers end
-        self.ttpts = []
-        for tempo in stream.tempomap[1:]:
-            self.ttpts.append(tempo.tick)
-        # Finally, add the end of track tick.
-        self.ttpts.append(stream.endoftrack.tick)
-        self.ttpts = iter(self.ttpts)
-        # Setup next tempo timepoint
-        self.ttp = next(self.ttpts)
-        self.tempomap = iter(self.stream.tempomap)
-        self.tempo = next(self.tempomap)
-        self.endoftrack = False
+        self.tempomap = TempoMap(stream)
+        self.windows = iter_windows(stream, window, self.tempomap)
 
     def __iter__(self):
         return self
 
-    def __next_edge(self):
-        if self.endoftrack:
-            raise StopIteration
-        lastedge = self.window_edge
-        self.window_edge += int(self.window_length / self.tempo.mpt)
-        if self.window_edge > self.ttp:
-            # We're past the tempo-marker.
-            oldttp = self.ttp
-            try:
-                self.ttp = next(self.ttpts)
-            except StopIteration:
-                # End of Track!
-                self.window_edge = self.ttp
-                self.endoftrack = True
-                return
-            # Calculate the next window edge, taking into
-            # account the tempo change.
-            msused = (oldttp - lastedge) * self.tempo.mpt
-            msleft = self.window_length - msused
-            self.tempo = next(self.tempomap)
-            ticksleft = msleft / self.tempo.mpt
-            self.window_edge = ticksleft + self.tempo.tick
-
     def __next__(self):
-        ret = []
-        self.__next_edge()
-        if self.leftover:
-            if self.leftover.tick > self.window_edge:
-                return ret
-            ret.append(self.leftover)
-            self.leftover = None
-        for event in self.events:
-            if event.tick > self.window_edge:
-                self.leftover = event
-                return ret
-            ret.append(event)
-        return ret
-
+        return next(self.windows)
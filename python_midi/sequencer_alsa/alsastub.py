@@ -0,0 +1,275 @@
+# Pure Python stand-in for the sequencer_alsa SWIG binding, used instead
+# of it when PYTHON_MIDI_ALSA_STUB is set in the environment.  It covers
+# the calls Sequencer makes and models the output side of an ALSA
+# client: events go into an output buffer of output_buffer_size bytes,
+# draining moves them into a kernel pool of pool_size events, and a
+# receiver takes them out of the pool into received.  In nonblocking
+# mode draining fails with -EAGAIN when the pool is full, as it does with
+# ALSA, and the receiver then takes receive_rate events out of it.
+# Nothing is played.
+
+import errno
+import itertools
+
+SND_SEQ_OPEN_OUTPUT = 1
+SND_SEQ_OPEN_INPUT = 2
+SND_SEQ_OPEN_DUPLEX = SND_SEQ_OPEN_OUTPUT | SND_SEQ_OPEN_INPUT
+SND_SEQ_NONBLOCK = 1
+
+SND_SEQ_PORT_CAP_READ = 1 << 0
+SND_SEQ_PORT_CAP_WRITE = 1 << 1
+SND_SEQ_PORT_CAP_SUBS_READ = 1 << 5
+SND_SEQ_PORT_CAP_SUBS_WRITE = 1 << 6
+SND_SEQ_PORT_TYPE_MIDI_GENERIC = 1 << 1
+
+SND_SEQ_CLIENT_SYSTEM = 0
+SND_SEQ_PORT_SYSTEM_TIMER = 0
+SND_SEQ_ADDRESS_UNKNOWN = 253
+SND_SEQ_ADDRESS_SUBSCRIBERS = 254
+SND_SEQ_QUEUE_DIRECT = 253
+
+SND_SEQ_TIME_STAMP_TICK = 0 << 0
+SND_SEQ_TIME_STAMP_REAL = 1 << 0
+SND_SEQ_TIME_STAMP_MASK = 1 << 0
+SND_SEQ_TIME_MODE_ABS = 0 << 1
+SND_SEQ_TIME_MODE_REL = 1 << 1
+SND_SEQ_TIME_MODE_MASK = 1 << 1
+
+SND_SEQ_EVENT_NOTEON = 6
+SND_SEQ_EVENT_NOTEOFF = 7
+SND_SEQ_EVENT_CONTROLLER = 10
+SND_SEQ_EVENT_PGMCHANGE = 11
+SND_SEQ_EVENT_PITCHBEND = 13
+SND_SEQ_EVENT_START = 30
+SND_SEQ_EVENT_CONTINUE = 31
+SND_SEQ_EVENT_STOP = 32
+SND_SEQ_EVENT_TEMPO = 35
+
+# sizeof(snd_seq_event_t), and the libasound and kernel defaults
+EVENT_SIZE = 28
+OUTPUT_BUFFER_SIZE = 16384
+INPUT_BUFFER_SIZE = 16384
+POOL_SIZE = 500
+
+class Struct(object):
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def __repr__(self):
+        return 'Struct(%s)' % ', '.join('%s=%r' % item for item in sorted(vars(self).items()))
+
+class snd_seq_addr_t(Struct):
+    def __init__(self):
+        super(snd_seq_addr_t, self).__init__(client=0, port=0)
+
+class snd_seq_event_t(Struct):
+    def __init__(self):
+        super(snd_seq_event_t, self).__init__(
+            type=0, flags=0, queue=0,
+            source=snd_seq_addr_t(), dest=snd_seq_addr_t(),
+            time=Struct(tick=0, time=Struct(tv_sec=0, tv_nsec=0)),
+            data=Struct(note=Struct(channel=0, note=0, velocity=0),
+                        control=Struct(channel=0, param=0, value=0),
+                        queue=Struct(queue=0, param=Struct(value=0))))
+
+class Client(object):
+    ids = itertools.count(128)
+
+    def __init__(self, name, type, stream, mode):
+        self.name = name
+        self.id = next(self.ids)
+        self.nonblock = bool(mode & SND_SEQ_NONBLOCK)
+        self.output_buffer_size = OUTPUT_BUFFER_SIZE
+        self.pool_size = POOL_SIZE
+        self.receive_rate = POOL_SIZE // 4
+        self.buffer = []
+        self.pool = []
+        self.received = []
+        self.ports = 0
+        self.queues = 0
+        self.subscriptions = []
+        # binding calls made, to count round trips
+        self.outputs = 0
+        self.drains = 0
+
+    def receive(self, count=None):
+        count = len(self.pool) if count is None else count
+        self.received.extend(self.pool[:count])
+        del self.pool[:count]
+
+    def drain(self):
+        self.drains += 1
+        moved = min(len(self.buffer), self.pool_size - len(self.pool))
+        self.pool.extend(self.buffer[:moved])
+        del self.buffer[:moved]
+        if not self.nonblock:
+            # a blocking drain waits for the receiver
+            while self.buffer:
+                self.receive()
+                moved = min(len(self.buffer), self.pool_size)
+                self.pool.extend(self.buffer[:moved])
+                del self.buffer[:moved]
+        if self.buffer and not moved:
+            # the receiver catches up while the caller waits for room
+            self.receive(self.receive_rate)
+            return -errno.EAGAIN
+        return len(self.buffer) * EVENT_SIZE
+
+def open_client(name, type, stream, mode):
+    return Client(name, type, stream, mode)
+
+def snd_seq_close(client):
+    return 0
+
+def snd_seq_nonblock(client, nonblock):
+    client.nonblock = bool(nonblock)
+    return 0
+
+def snd_strerror(errcode):
+    return 'stand-in error %d' % errcode
+
+def snd_seq_client_id(client):
+    return client.id
+
+def snd_seq_get_output_buffer_size(client):
+    return client.output_buffer_size
+
+def snd_seq_get_input_buffer_size(client):
+    return INPUT_BUFFER_SIZE
+
+def client_poll_descriptors(client):
+    return []
+
+def snd_seq_create_simple_port(client, name, caps, type):
+    client.ports += 1
+    return client.ports - 1
+
+def new_port_subscribe():
+    return Struct(sender=None, dest=None, queue=0, time_update=False, time_real=False)
+
+def snd_seq_port_subscribe_set_sender(subscribe, addr):
+    subscribe.sender = addr
+
+def snd_seq_port_subscribe_set_dest(subscribe, addr):
+    subscribe.dest = addr
+
+def snd_seq_port_subscribe_set_queue(subscribe, queue):
+    subscribe.queue = queue
+
+def snd_seq_port_subscribe_set_time_update(subscribe, value):
+    subscribe.time_update = value
+
+def snd_seq_port_subscribe_set_time_real(subscribe, value):
+    subscribe.time_real = value
+
+def snd_seq_subscribe_port(client, subscribe):
+    client.subscriptions.append(subscribe)
+    return 0
+
+def snd_seq_alloc_named_queue(client, name):
+    client.queues += 1
+    return client.queues - 1
+
+def init_queue_tempo(client, queue, tempo, ppq):
+    return 0
+
+def snd_seq_control_queue(client, queue, type, value, event):
+    seqev = snd_seq_event_t()
+    seqev.type = type
+    seqev.data.queue.queue = queue
+    seqev.data.queue.param.value = value
+    return snd_seq_event_output(client, seqev)
+
+def new_queue_status(client, queue):
+    return Struct(tick_time=0, real_time=Struct(tv_sec=0, tv_nsec=0), events=0)
+
+def snd_seq_get_queue_status(client, queue, status):
+    status.events = len(client.pool)
+    return 0
+
+def snd_seq_queue_status_get_tick_time(status):
+    return status.tick_time
+
+def snd_seq_queue_status_get_real_time(status):
+    return status.real_time
+
+def snd_seq_queue_status_get_events(status):
+    return status.events
+
+def free_queue_status(status):
+    pass
+
+def snd_seq_event_output(client, event):
+    # like ALSA, drains the output buffer when the event does not fit
+    client.outputs += 1
+    if (len(client.buffer) + 1) * EVENT_SIZE > client.output_buffer_size:
+        err = client.drain()
+        if err < 0:
+            return err
+    client.buffer.append(event)
+    return len(client.buffer) * EVENT_SIZE
+
+def snd_seq_event_output_buffer(client, event):
+    client.outputs += 1
+    if (len(client.buffer) + 1) * EVENT_SIZE > client.output_buffer_size:
+        return -errno.EAGAIN
+    client.buffer.append(event)
+    return len(client.buffer) * EVENT_SIZE
+
+def snd_seq_event_output_pending(client):
+    return len(client.buffer) * EVENT_SIZE
+
+def snd_seq_drain_output(client):
+    return client.drain()
+
+def snd_seq_drop_output_buffer(client):
+    del client.buffer[:]
+    return 0
+
+def snd_seq_drop_output(client):
+    del client.buffer[:]
+    del client.pool[:]
+    return 0
+
+def event_input(client):
+    return None
+
+def new_client_info():
+    return Struct(client=-1, name='')
+
+def new_port_info():
+    return Struct(client=-1, port=-1, name='', capability=0)
+
+def snd_seq_client_info_set_client(cinfo, client):
+    cinfo.client = client
+
+def snd_seq_client_info_get_client(cinfo):
+    return cinfo.client
+
+def snd_seq_client_info_get_name(cinfo):
+    return cinfo.name
+
+def snd_seq_query_next_client(client, cinfo):
+    # there are no other clients
+    return -errno.ENOENT
+
+def snd_seq_port_info_set_client(pinfo, client):
+    pinfo.client = client
+
+def snd_seq_port_info_set_port(pinfo, port):
+    pinfo.port = port
+
+def snd_seq_port_info_get_capability(pinfo):
+    return pinfo.capability
+
+def snd_seq_port_info_get_client(pinfo):
+    return pinfo.client
+
+def snd_seq_port_info_get_port(pinfo):
+    return pinfo.port
+
+def snd_seq_port_info_get_name(pinfo):
+    return pinfo.name
+
+def snd_seq_query_next_port(client, pinfo):
+    return -errno.ENOENT
@@ -1,6 +1,16 @@
+import os
+import errno
 import select
-import sequencer_alsa as S
-import midi
+try:
+    import midi
+except ImportError:
+    import python_midi as midi
+if os.environ.get('PYTHON_MIDI_ALSA_STUB'):
+    # the pure Python stand-in, which plays nothing: for tests and
+    # benchmarks without ALSA
+    from . import alsastub as S
+else:
+    import sequencer_alsa as S
 
 __SWIG_NS_SET__ = set(['__class__', '__del__', '__delattr__', '__dict__', '__doc__', '__getattr__', '__getattribute__', '__hash__', '__init__', '__module__', '__new__', '__reduce__', '__reduce_ex__', '__repr__', '__setattr__', '__str__', '__swig_getmethods__', '__swig_setmethods__', '__weakref__', 'this', 'thisown'])
 
@@ -32,6 +42,10 @@ class Sequencer(object):
         'alsa_queue_name':'__queue__',
         'sequencer_tempo':120,
         'sequencer_resolution':1000,
+        # event_write_many() drains the output buffer when this much of it
+        # is used, and polls this long (ms) for room when ALSA is full
+        'alsa_output_high_water':0.5,
+        'alsa_output_timeout':100,
     }
     DefaultArguments = {}
 
@@ -204,10 +218,65 @@ class Sequencer(object):
     ## EVENT HANDLERS
     ##
     def event_write(self, event, direct=False, relative=False, tick=False):
-        #print event.__class__, event
+        seqev = self._new_event(event, direct, relative, tick)
+        if seqev is None:
+            return None
+        err = S.snd_seq_event_output(self.client, seqev)
+        if (err < 0): self._error(err)
+        self.drain()
+        return self.output_buffer_size - err
+
+    def event_write_many(self, events, direct=False, relative=False, tick=False):
+        # Like event_write() for every event, but the events only go into
+        # the output buffer, which is drained once at the end and whenever
+        # more than alsa_output_high_water of it is used.  Returns the
+        # number of events written.
+        high_water = int(self.output_buffer_size * self.alsa_output_high_water)
+        written = 0
+        used = 0
+        for event in events:
+            seqev = self._new_event(event, direct, relative, tick)
+            if seqev is None:
+                continue
+            # returns the bytes used in the output buffer
+            used = S.snd_seq_event_output_buffer(self.client, seqev)
+            if used == -errno.EAGAIN:
+                # the buffer is full
+                self._flush_output()
+                used = S.snd_seq_event_output_buffer(self.client, seqev)
+            if (used < 0): self._error(used)
+            written += 1
+            if used >= high_water:
+                self._flush_output()
+                used = 0
+        if used:
+            self._flush_output()
+        return written
+
+    def _flush_output(self):
+        # drain the output buffer; while ALSA has no room for it (when
+        # nonblocking), wait until the receiver catches up
+        while True:
+            err = S.snd_seq_drain_output(self.client)
+            if err == 0:
+                return
+            if err < 0 and err != -errno.EAGAIN:
+                self._error(err)
+            self._wait_output()
+
+    def _wait_output(self):
+        if not self._poll_descriptors:
+            return
+        poll = select.poll()
+        for fd in self._poll_descriptors:
+            poll.register(fd, select.POLLOUT)
+        poll.poll(self.alsa_output_timeout)
+
+    def _new_event(self, event, direct=False, relative=False, tick=False):
+        # the snd_seq_event_t of event, or None for events not sent
         ## Event Filter
         if isinstance(event, midi.EndOfTrackEvent):
-            return
+            return None
         seqev = S.snd_seq_event_t()
         ## common
         seqev.dest.client = self.write_dest.client
@@ -271,11 +340,7 @@ class Sequencer(object):
         else:
             print("Warning :: Unknown event type: %s" % event)
             return None
-            
-        err = S.snd_seq_event_output(self.client, seqev)
-        if (err < 0): self._error(err)
-        self.drain()
-        return self.output_buffer_size - err
+        return seqev
 
     def event_read(self):
         ev = S.event_input(self.client)
@@ -293,7 +358,7 @@ class Sequencer(object):
                 mev.velocity = ev.data.note.velocity
             if ev.time.time.tv_nsec:
                 # convert to ms
-                mev.msdeay = \
+                mev.msdelay = \
                     (ev.time.time.tv_nsec / 1e6) + (ev.time.time.tv_sec * 1e3)
             else:
                 mev.tick = ev.time.tick
@@ -1,3 +1,19 @@
+from warnings import warn
+
+_numpy = False
+
+def load_numpy():
+    # NumPy, imported on first use so that importing python_midi does not
+    # pay for it; None when it is not installed
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
 
 def read_varlen(data):
     NEXTBYTE = 1
@@ -16,23 +32,25 @@ def read_varlen(data):
         value += chr
     return value
 
+def read_varlen_at(data, pos):
+    # Same as read_varlen, but works on an indexable buffer (bytes,
+    # memoryview, mmap) with an integer cursor.  Returns (value, pos).
+    value = 0
+    while True:
+        chr = data[pos]
+        pos += 1
+        value = (value << 7) | (chr & 0x7F)
+        if not (chr & 0x80):
+            return value, pos
+
 def write_varlen(value):
-    chr1 = chr(value & 0x7F)
+    # Encode value as a MIDI variable length quantity (bytes)
+    res = bytearray((value & 0x7F,))
     value >>= 7
-    if value:
-        chr2 = chr((value & 0x7F) | 0x80)
+    while value:
+        res.insert(0, (value & 0x7F) | 0x80)
         value >>= 7
-        if value:
-            chr3 = chr((value & 0x7F) | 0x80)
-            value >>= 7
-            if value:
-                chr4 = chr((value & 0x7F) | 0x80)
-                res = chr4 + chr3 + chr2 + chr1
-            else:
-                res = chr3 + chr2 + chr1
-        else:
-            res = chr2 + chr1
-    else:
-        res = chr1
-    return res
+    return bytes(res)
 
+def warn_truncated(msg):
+    warn("Truncated MIDI track: " + msg, Warning)
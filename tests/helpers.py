@@ -0,0 +1,43 @@
+import io
+import python_midi as midi
+
+def make_pattern(notes=50, resolution=220):
+    # A format 1 song: a conductor track with tempo changes and a time
+    # signature, a note track with running status, controllers, pitch
+    # wheel and a program change, and a track with lyrics and sysex
+    conductor = midi.Track([
+        midi.TrackNameEvent(tick=0, text='conductor'),
+        midi.TimeSignatureEvent(tick=0, data=(4, 2, 24, 8)),
+        midi.SetTempoEvent(tick=0, bpm=120),
+        midi.SetTempoEvent(tick=resolution * 4, bpm=90),
+        midi.SetTempoEvent(tick=resolution * 2, bpm=150),
+        midi.EndOfTrackEvent(tick=resolution),
+    ])
+    piano = midi.Track([
+        midi.TrackNameEvent(tick=0, text='piano'),
+        midi.ProgramChangeEvent(tick=0, channel=1, value=5),
+    ])
+    for i in range(notes):
+        pitch = 40 + i % 40
+        piano.append(midi.NoteOnEvent(tick=0 if i == 0 else resolution // 4, channel=1,
+                                      pitch=pitch, velocity=30 + i % 90))
+        piano.append(midi.ControlChangeEvent(tick=3, channel=1, control=7, value=i % 128))
+        piano.append(midi.PitchWheelEvent(tick=1, channel=1, pitch=(i * 97) % 8192 - 4096))
+        piano.append(midi.NoteOffEvent(tick=resolution // 8, channel=1, pitch=pitch))
+    piano.append(midi.EndOfTrackEvent(tick=0))
+    words = midi.Track([
+        midi.LyricsEvent(tick=resolution, text='la'),
+        midi.SysexEvent(tick=5, data=(0x7e, 0x7f, 0x09, 0x01)),
+        midi.LyricsEvent(tick=resolution, text='di da'),
+        midi.EndOfTrackEvent(tick=0),
+    ])
+    return midi.Pattern([conductor, piano, words], resolution=resolution)
+
+def midifile_bytes(pattern):
+    f = io.BytesIO()
+    midi.write_midifile(f, pattern)
+    return f.getvalue()
+
+def event_list(pattern):
+    # the pattern as comparable values, track by track
+    return [[(type(event).__name__,) + event.state() for event in track] for track in pattern]
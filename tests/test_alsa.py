@@ -0,0 +1,100 @@
+import os
+import errno
+import unittest
+import python_midi as midi
+
+# the batching is tested against the stand-in binding, without ALSA
+os.environ['PYTHON_MIDI_ALSA_STUB'] = '1'
+from python_midi.sequencer_alsa import alsastub
+from python_midi.sequencer_alsa.sequencer import SequencerWrite
+
+def make_events(count):
+    events = []
+    for i in range(count):
+        events.append(midi.NoteOnEvent(pitch=i % 128, velocity=64, channel=i % 16))
+        events.append(midi.ControlChangeEvent(control=7, value=i % 128, channel=i % 16))
+    events.append(midi.EndOfTrackEvent())
+    return events
+
+class TestEventWriteMany(unittest.TestCase):
+    def setUp(self):
+        self.seq = SequencerWrite()
+        self.seq.subscribe_port(20, 0)
+        self.client = self.seq.client
+
+    def delivered(self):
+        return self.client.received + self.client.pool
+
+    def test_order_and_content(self):
+        events = make_events(100)
+        self.assertEqual(self.seq.event_write_many(events, direct=True), 200)
+        got = self.delivered()
+        self.assertEqual([e.type for e in got[:2]],
+                         [alsastub.SND_SEQ_EVENT_NOTEON, alsastub.SND_SEQ_EVENT_CONTROLLER])
+        self.assertEqual([e.data.note.note for e in got[::2]], [i % 128 for i in range(100)])
+        self.assertEqual([e.data.control.value for e in got[1::2]], [i % 128 for i in range(100)])
+        self.assertTrue(all(e.queue == alsastub.SND_SEQ_QUEUE_DIRECT for e in got))
+        self.assertEqual(self.seq.output_pending(), 0)
+
+    def test_one_drain_per_batch(self):
+        self.seq.event_write_many(make_events(100), direct=True)
+        self.assertEqual(self.client.drains, 1)
+        # one output call per event, and no other round trips
+        self.assertEqual(self.client.outputs, 200)
+
+    def test_event_write_drains_every_event(self):
+        for event in make_events(10):
+            self.seq.event_write(event, direct=True)
+        self.assertEqual(self.client.drains, 20)
+
+    def test_event_write_returns_free_bytes(self):
+        free = self.seq.event_write(make_events(1)[0], direct=True)
+        self.assertEqual(free, self.client.output_buffer_size - alsastub.EVENT_SIZE)
+
+    def test_high_water(self):
+        per_drain = int(self.client.output_buffer_size * self.seq.alsa_output_high_water) \
+                    // alsastub.EVENT_SIZE + 1
+        self.client.nonblock = False
+        self.seq.event_write_many(make_events(1000), direct=True)
+        self.assertEqual(self.client.drains, -(-2000 // per_drain))
+        self.assertEqual(len(self.delivered()), 2000)
+
+    def test_full_buffer(self):
+        self.seq.alsa_output_high_water = 2
+        self.client.nonblock = False
+        self.seq.event_write_many(make_events(1000), direct=True)
+        self.assertEqual(len(self.delivered()), 2000)
+        self.assertEqual([e.data.note.note for e in self.delivered()[::2]],
+                         [i % 128 for i in range(1000)])
+
+    def test_backpressure(self):
+        # the pool fills up faster than the receiver empties it, so
+        # draining fails with -EAGAIN until it catches up
+        self.client.pool_size = 50
+        self.client.receive_rate = 10
+        results = []
+        drain = self.client.drain
+        def recorded():
+            results.append(drain())
+            return results[-1]
+        self.client.drain = recorded
+        self.seq.event_write_many(make_events(500), direct=True)
+        self.assertIn(-errno.EAGAIN, results)
+        self.assertEqual(results[-1], 0)
+        self.assertEqual([e.data.note.note for e in self.delivered()[::2]],
+                         [i % 128 for i in range(500)])
+
+    def test_empty(self):
+        self.assertEqual(self.seq.event_write_many([]), 0)
+        self.assertEqual(self.seq.event_write_many([midi.EndOfTrackEvent()]), 0)
+        self.assertEqual(self.client.drains, 0)
+
+    def test_alsa_sink(self):
+        sink = midi.AlsaSink(self.seq)
+        events = make_events(5)
+        sink.write([(0, 0, event) for event in events], 0.0)
+        self.assertEqual(len(self.delivered()), 10)
+        self.assertEqual(self.client.drains, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import io
+import os
+import gzip
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+import python_midi as midi
+from helpers import make_pattern, midifile_bytes, event_list
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.songs = {'a.mid': midifile_bytes(make_pattern(notes=10)),
+                      'dir/b.mid': midifile_bytes(make_pattern(notes=20)),
+                      'c.midi': midifile_bytes(make_pattern(notes=30))}
+        self.zip = os.path.join(self.tmp, 'songs.zip')
+        with zipfile.ZipFile(self.zip, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in self.songs.items():
+                archive.writestr(name, data)
+            archive.writestr('readme.txt', b'not a song')
+        self.tar = os.path.join(self.tmp, 'songs.tar.gz')
+        with tarfile.open(self.tar, 'w:gz') as archive:
+            for name, data in self.songs.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        self.gz = os.path.join(self.tmp, 'song.mid.gz')
+        with gzip.open(self.gz, 'wb') as f:
+            f.write(self.songs['a.mid'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def expected(self, name):
+        return event_list(midi.read_midifile(io.BytesIO(self.songs[name])))
+
+    def test_iterate(self):
+        for path in (self.zip, self.tar):
+            self.assertTrue(midi.is_archive(path))
+            with midi.MidiArchive(path, readahead=1) as archive:
+                self.assertEqual(sorted(archive.names()), sorted(self.songs))
+                self.assertEqual(dict(archive), self.songs)
+
+    def test_members(self):
+        for path in (self.zip, self.tar):
+            member = path + '/dir/b.mid'
+            self.assertEqual(midi.split_member(member), (path, 'dir/b.mid'))
+            self.assertEqual(event_list(midi.read_midifile(member)), self.expected('dir/b.mid'))
+            names = [path + '/' + name for name in sorted(self.songs)]
+            read = [(name, midifile.read()) for name, midifile in midi.iter_midifiles(names)]
+            self.assertEqual(read, [(path + '/' + name, self.songs[name]) for name in sorted(self.songs)])
+
+    def test_gzip(self):
+        self.assertFalse(midi.is_archive(self.gz))
+        self.assertEqual(event_list(midi.read_midifile(self.gz)), self.expected('a.mid'))
+
+    def test_not_an_archive(self):
+        with self.assertRaises(TypeError):
+            midi.MidiArchive(self.gz)
+
+if __name__ == '__main__':
+    unittest.main()
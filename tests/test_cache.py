@@ -0,0 +1,67 @@
+import io
+import os
+import tempfile
+import unittest
+import python_midi as midi
+from helpers import make_pattern, midifile_bytes, event_list
+
+class TestPatternCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = midi.PatternCache(self.tmp.name)
+        self.data = midifile_bytes(make_pattern())
+        self.expected = event_list(midi.read_midifile(io.BytesIO(self.data)))
+        self.entry = self.cache.path(self.cache.key(self.data))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self):
+        return self.cache.read_midifile(io.BytesIO(self.data))
+
+    def test_cold_and_warm(self):
+        self.assertEqual(event_list(self.read()), self.expected)
+        self.assertTrue(os.path.exists(self.entry))
+        self.assertEqual(event_list(self.read()), self.expected)
+
+    def test_damaged_entry_is_rebuilt(self):
+        self.read()
+        with open(self.entry, 'rb') as f:
+            good = f.read()
+        for damaged in (b'', good[:len(good) // 2], good[:-10], b'PK\x03\x04' + b'\0' * 100, b'x' * 1000):
+            with open(self.entry, 'wb') as f:
+                f.write(damaged)
+            self.assertIsNone(self.cache.load(self.cache.key(self.data)))
+            self.assertFalse(os.path.exists(self.entry))
+            self.assertEqual(event_list(self.read()), self.expected)
+            self.assertIsNotNone(self.cache.load(self.cache.key(self.data)))
+
+    def test_eviction(self):
+        self.read()
+        cache = midi.PatternCache(self.tmp.name, max_size=0)
+        cache.evict()
+        self.assertEqual(cache.entries(), [])
+
+    def test_store_keeps_a_running_total(self):
+        # the directory is listed on the first store, and again only when
+        # the entries outgrow max_size
+        listed = []
+        entries = self.cache.entries
+        self.cache.entries = lambda: listed.append(1) or entries()
+        pattern = midi.read_midifile_columnar(io.BytesIO(self.data))
+        for i in range(20):
+            self.cache.store('%02d' % i, pattern)
+        self.cache.store('00', pattern)
+        self.assertEqual(len(listed), 1)
+        self.assertEqual(self.cache.total, self.cache.size())
+        self.cache.discard('00')
+        self.assertEqual(self.cache.total, self.cache.size())
+        self.cache.max_size = self.cache.total // 2
+        del listed[:]
+        self.cache.store('20', pattern)
+        self.assertEqual(len(listed), 1)
+        self.assertLessEqual(self.cache.size(), self.cache.max_size)
+        self.assertEqual(self.cache.total, self.cache.size())
+
+if __name__ == '__main__':
+    unittest.main()
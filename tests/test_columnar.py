@@ -0,0 +1,70 @@
+import io
+import struct
+import unittest
+import warnings
+import python_midi as midi
+from helpers import make_pattern, midifile_bytes, event_list
+
+def track_file(body):
+    # a format 0 midifile of one track chunk holding body
+    return (b'MThd' + struct.pack(">LHHH", 6, 0, 1, 220) +
+            b'MTrk' + struct.pack(">L", len(body)) + body)
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.data = midifile_bytes(make_pattern())
+        self.expected = event_list(midi.read_midifile(io.BytesIO(self.data)))
+
+    def test_columnar_matches_read_midifile(self):
+        pattern = midi.read_midifile_columnar(io.BytesIO(self.data))
+        self.assertEqual(event_list(pattern.to_pattern()), self.expected)
+
+    def test_packed_matches_read_midifile(self):
+        pattern = midi.read_midifile_packed(io.BytesIO(self.data))
+        self.assertEqual(event_list(pattern), self.expected)
+
+    def readers(self):
+        yield midi.read_midifile
+        yield midi.read_midifile_columnar
+        yield midi.read_midifile_packed
+
+    def test_running_status_without_status(self):
+        data = track_file(b'\x00\x40\x40\x00\xff\x2f\x00')
+        for read in self.readers():
+            with self.assertRaises(TypeError) as raised:
+                read(io.BytesIO(data))
+            self.assertIn("without running status", str(raised.exception))
+
+    def test_system_common_status(self):
+        for status in (0xF1, 0xF4, 0xF7, 0xFE):
+            data = track_file(b'\x00' + bytes((status,)) + b'\x00\x00\xff\x2f\x00')
+            for read in self.readers():
+                with self.assertRaises(TypeError) as raised:
+                    read(io.BytesIO(data))
+                self.assertIn("Unknown MIDI Event", str(raised.exception))
+
+    def test_truncated_track(self):
+        # the chunk ends in the middle of the second note on
+        data = track_file(b'\x00\x90\x40\x40\x10\x90\x41')
+        for read in self.readers():
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                pattern = read(io.BytesIO(data))
+            if read is midi.read_midifile_columnar:
+                pattern = pattern.to_pattern()
+            self.assertEqual(len(pattern[0]), 1)
+            self.assertEqual(pattern[0][0].pitch, 0x40)
+            self.assertTrue(any("Truncated" in str(w.message) for w in caught))
+
+    def test_unterminated_sysex(self):
+        data = track_file(b'\x00\x90\x40\x40\x00\xf0\x7e\x7f')
+        for read in self.readers():
+            with warnings.catch_warnings(record=True):
+                warnings.simplefilter('always')
+                pattern = read(io.BytesIO(data))
+            if read is midi.read_midifile_columnar:
+                pattern = pattern.to_pattern()
+            self.assertEqual(len(pattern[0]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
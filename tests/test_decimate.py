@@ -0,0 +1,112 @@
+import io
+import random
+import unittest
+import python_midi as midi
+
+def abs_ticks(track):
+    tick = 0
+    for event in track:
+        tick += event.tick
+        yield tick, event
+
+def curve(track, kind):
+    return [(tick, event) for tick, event in abs_ticks(track) if type(event) is kind]
+
+class TestDecimate(unittest.TestCase):
+    def ramp(self):
+        # a volume ramp with a note every 16 controller events
+        track = midi.Track()
+        for i in range(128):
+            if i % 16 == 0:
+                track.append(midi.NoteOnEvent(tick=1, channel=0, pitch=60 + i // 16, velocity=80))
+            track.append(midi.ControlChangeEvent(tick=1, channel=0, control=7, value=i))
+        track.append(midi.EndOfTrackEvent(tick=0))
+        return track
+
+    def test_ramp(self):
+        track = self.ramp()
+        thinned = midi.decimate_track(track)
+        values = [event.value for tick, event in curve(thinned, midi.ControlChangeEvent)]
+        self.assertEqual(values, [0, 127])
+        # everything else stays at its tick
+        notes = [[(tick, event.pitch) for tick, event in curve(t, midi.NoteOnEvent)]
+                 for t in (thinned, track)]
+        self.assertEqual(notes[0], notes[1])
+        self.assertEqual(list(abs_ticks(thinned))[-1][0], list(abs_ticks(track))[-1][0])
+
+    def test_within_tolerance(self):
+        rng = random.Random(7)
+        for points in (40, 500):
+            track = midi.Track()
+            value = 8192
+            for i in range(points):
+                value = min(max(value + rng.randrange(-300, 301), 0), 16383)
+                track.append(midi.PitchWheelEvent(tick=rng.randrange(0, 5), channel=3, pitch=value - 8192))
+            thinned = midi.decimate_track(track, tolerance=2)
+            kept = curve(thinned, midi.PitchWheelEvent)
+            self.assertLess(len(kept), points)
+            limit = 2 * midi.PITCH_TOLERANCE_SCALE
+            for tick, event in curve(track, midi.PitchWheelEvent):
+                before = [k for k in kept if k[0] <= tick][-1]
+                after = [k for k in kept if k[0] >= tick][0]
+                if before[0] == after[0]:
+                    continue
+                line = before[1].pitch + (after[1].pitch - before[1].pitch) * \
+                    (tick - before[0]) / float(after[0] - before[0])
+                self.assertLessEqual(abs(event.pitch - line), limit + 1e-9)
+
+    def test_absolute_ticks(self):
+        track = self.ramp()
+        track.make_ticks_abs()
+        thinned = midi.decimate_track(track)
+        self.assertFalse(thinned.tick_relative)
+        thinned.make_ticks_rel()
+        self.assertEqual([(type(e), e.state()) for e in thinned],
+                         [(type(e), e.state()) for e in midi.decimate_track(self.ramp())])
+
+    def test_other_controls_kept(self):
+        track = midi.Track(midi.ControlChangeEvent(tick=1, control=64, value=i % 2 * 127)
+                           for i in range(20))
+        self.assertEqual(len(midi.decimate_track(track)), 20)
+
+    def test_window(self):
+        # a long ramp keeps a value at least every window values
+        track = midi.Track(midi.ControlChangeEvent(tick=1, control=7, value=i % 128)
+                           for i in range(128 * 8))
+        ticks = [tick for tick, event in curve(midi.decimate_track(track), midi.ControlChangeEvent)]
+        kept = [tick for tick, event in curve(
+            midi.Track(midi.iter_decimated(track, window=50)), midi.ControlChangeEvent)]
+        self.assertEqual(len(ticks), 16)
+        self.assertLessEqual(max(b - a for a, b in zip(kept, kept[1:])), 50)
+
+    def test_single_pass(self):
+        # events come out while the rest is still to be read, even behind
+        # a controller value that stays undecided
+        read = []
+        def events():
+            yield midi.ControlChangeEvent(tick=0, control=7, value=0)
+            yield midi.ControlChangeEvent(tick=1, control=7, value=1)
+            for i in range(10000):
+                read.append(i)
+                yield midi.NoteOnEvent(tick=1, pitch=60, velocity=80)
+        stream = midi.iter_decimated(events(), window=64)
+        for i in range(3):
+            next(stream)
+        self.assertLessEqual(len(read), 64)
+        self.assertEqual(sum(1 for event in stream) + 3, 10002)
+
+    def test_stream_to_writer(self):
+        pattern = midi.Pattern([self.ramp(), self.ramp()])
+        f = io.BytesIO()
+        midi.write_midifile(f, pattern)
+        out = io.BytesIO()
+        with midi.StreamWriter(out, resolution=pattern.resolution) as writer:
+            for index, events in midi.iter_midifile(io.BytesIO(f.getvalue())).tracks():
+                writer.add_track(midi.iter_decimated(events))
+        expected = midi.decimate_pattern(pattern)
+        self.assertEqual([[(type(e), e.state()) for e in track]
+                          for track in midi.read_midifile(io.BytesIO(out.getvalue()))],
+                         [[(type(e), e.state()) for e in track] for track in expected])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import subprocess
+import unittest
+import python_midi as midi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestLazyImports(unittest.TestCase):
+    def imported(self, code):
+        # modules in sys.modules after running code in a fresh interpreter
+        result = subprocess.run([sys.executable, '-c', code + '\nimport sys; print(sorted(sys.modules))'],
+                                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return set(eval(result.stdout))
+
+    def test_import_is_cheap(self):
+        modules = self.imported('import python_midi')
+        for name in ('numpy', 'asyncio', 'zipfile', 'tarfile', 'concurrent.futures',
+                     'python_midi.player', 'python_midi.cache', 'python_midi.columnar',
+                     'python_midi.archive'):
+            self.assertNotIn(name, modules)
+
+    def test_names_on_use(self):
+        modules = self.imported('import python_midi; python_midi.Player')
+        self.assertIn('python_midi.player', modules)
+        self.assertNotIn('numpy', modules)
+
+    def test_lazy_names(self):
+        import python_midi.player
+        import python_midi.cache
+        import python_midi.columnar
+        import python_midi.archive
+        self.assertIs(midi.Player, python_midi.player.Player)
+        self.assertIs(midi.PatternCache, python_midi.cache.PatternCache)
+        self.assertIs(midi.read_columnar, python_midi.columnar.read_columnar)
+        self.assertIs(midi.MidiArchive, python_midi.archive.MidiArchive)
+        from python_midi import LoopbackSink, is_archive
+        self.assertIs(LoopbackSink, python_midi.player.LoopbackSink)
+        with self.assertRaises(AttributeError):
+            midi.NoSuchThing
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import unittest
+import python_midi as midi
+from lib.latency import synthetic_pattern, summary, percentile, benchmark, SUMMARY_KEYS
+
+class TestSyntheticPattern(unittest.TestCase):
+    def test_density(self):
+        pattern = synthetic_pattern(200, seconds=5.0, tracks=2)
+        for track in pattern:
+            notes = [e for e in track if isinstance(e, midi.NoteEvent)]
+            self.assertGreater(len(notes), 800)
+            self.assertLess(len(notes), 1200)
+
+    def test_tempo_changes(self):
+        pattern = synthetic_pattern(10, tempo_changes=4, seconds=5.0)
+        tempos = [e for e in pattern[0] if isinstance(e, midi.SetTempoEvent)]
+        self.assertGreater(len(tempos), 10)
+        # the notes stay within the length at any tempo
+        tempomap = midi.TempoMap.from_pattern(pattern)
+        last = max(e.tick for e in pattern[0] if isinstance(e, midi.NoteOnEvent))
+        self.assertLess(tempomap.tick2us(last), 5.0e6)
+
+    def test_reproducible(self):
+        a = synthetic_pattern(50, 1, 2.0, seed=3)
+        b = synthetic_pattern(50, 1, 2.0, seed=3)
+        self.assertEqual([[e.state() for e in t] for t in a], [[e.state() for e in t] for t in b])
+
+    def test_empty(self):
+        pattern = synthetic_pattern(0, seconds=0.0)
+        self.assertEqual([len(track) for track in pattern], [2])
+
+class TestSummary(unittest.TestCase):
+    def test_values(self):
+        report = summary([i / 1e6 for i in range(1, 101)])
+        self.assertEqual(report['count'], 100)
+        self.assertAlmostEqual(report['p50'], 50)
+        self.assertAlmostEqual(report['p99'], 99)
+        self.assertAlmostEqual(report['max'], 100)
+        self.assertAlmostEqual(report['min'], 1)
+
+    def test_percentile(self):
+        self.assertEqual(percentile([5], 0.99), 5)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_empty(self):
+        report = summary([])
+        self.assertEqual(sorted(report), sorted(SUMMARY_KEYS))
+        self.assertEqual(report['count'], 0)
+        self.assertIsNone(report['p50'])
+
+class TestBenchmark(unittest.TestCase):
+    def test_run(self):
+        report = benchmark(400, tempo_changes=5, seconds=0.3)
+        self.assertGreater(report['latency']['count'], 50)
+        self.assertEqual(report['jitter']['count'], report['batches'] - 1)
+        json.dumps(report)
+
+    def test_no_events(self):
+        report = benchmark(0, seconds=0.2)
+        self.assertEqual(report['batches'], 0)
+        self.assertEqual(report['latency']['count'], 0)
+        self.assertIsNone(report['latency']['p99'])
+        json.dumps(report)
+
+if __name__ == '__main__':
+    unittest.main()
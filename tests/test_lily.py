@@ -0,0 +1,43 @@
+import io
+import contextlib
+import unittest
+from lib.miditrack import MidiTrack, MidiNote
+
+class TestBarLilyNotes(unittest.TestCase):
+    def setUp(self):
+        self.saved = MidiTrack.resolution, MidiTrack.bars
+        MidiTrack.resolution = 96
+        MidiTrack.bars = [(0, 383), (384, 767)]
+
+    def tearDown(self):
+        MidiTrack.resolution, MidiTrack.bars = self.saved
+
+    def bars(self, name, notes, drums=False):
+        mt = MidiTrack.instance_for(name, None, False)
+        mt.output_drums = drums
+        mt.set_note_state(notes)
+        # select_duration prints what it chose
+        with contextlib.redirect_stdout(io.StringIO()):
+            mt.create_bar_lily_notes()
+        return mt.bar_lily_notes
+
+    def test_notes_rests_and_chords(self):
+        notes = [(60, 90, 0, 96, False), (64, 90, 192, 192, False), (67, 90, 192, 192, False)]
+        self.assertEqual(self.bars('lily notes', notes), ["c'4 r4 <e' g'>2", 'r1'])
+
+    def test_durations_and_ties(self):
+        # a note split at the bar is tied over into the next bar, and
+        # a length without a single note value is written as tied notes
+        notes = [(48, 90, 288, 96, True), (48, 90, 384, 48, False), (50, 90, 432, 60, False)]
+        self.assertEqual(self.bars('lily ties', notes), ['r2 r4 c4~', 'c8 d8~ d32 r2 r8 r16.'])
+
+    def test_overlap_is_cut(self):
+        notes = [(62, 90, 0, 384, False), (64, 90, 192, 96, False)]
+        self.assertEqual(self.bars('lily overlap', notes), ["d'2 e'4 r4", 'r1'])
+
+    def test_drums(self):
+        notes = [(36, 90, 0, 192, False), (42, 90, 192, 192, False), (41, 90, 384, 384, False)]
+        self.assertEqual(self.bars('lily drums', notes, drums=True), ['bd2 hh2', 'sn1'])
+
+if __name__ == '__main__':
+    unittest.main()
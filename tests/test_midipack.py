@@ -0,0 +1,52 @@
+import io
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+import python_midi as midi
+from lib.midipiece import MidiPiece
+from lib.midipack import MidiPack
+from helpers import make_pattern, midifile_bytes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestMidipack(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.song = os.path.join(self.tmp, 'song.mid')
+        midi.write_midifile(self.song, make_pattern())
+        self.text = os.path.join(self.tmp, 'notes.mid')
+        with open(self.text, 'w') as f:
+            f.write('no midifile at all')
+        self.pack = os.path.join(self.tmp, 'corpus.pack')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_piece_raises_type_error(self):
+        with self.assertRaises(TypeError):
+            MidiPiece(self.text, False)
+
+    def test_stuck_notes_raise_type_error(self):
+        pattern = make_pattern()
+        del pattern[1][-2]
+        with self.assertRaises(TypeError):
+            MidiPiece(io.BytesIO(midifile_bytes(pattern)), False)
+
+    def test_bad_file_is_skipped(self):
+        result = subprocess.run([sys.executable, 'midipack.py', self.pack, self.song, self.text],
+                                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(result.returncode, 0, result.stderr.decode())
+        self.assertIn(b'Skipping', result.stdout)
+        self.assertIn(b'1 songs packed', result.stdout)
+        self.assertIn(b'1 skipped', result.stdout)
+        with MidiPack(self.pack) as pack:
+            self.assertEqual(len(pack), 1)
+            packed = pack.piece(0).note_table()
+            for name, column in MidiPiece(self.song, False).note_table().items():
+                self.assertEqual(list(packed[name]), column)
+
+if __name__ == '__main__':
+    unittest.main()
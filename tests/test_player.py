@@ -0,0 +1,121 @@
+import io
+import asyncio
+import unittest
+import python_midi as midi
+
+def make_song(notes=40, gap=24):
+    track = midi.Track([midi.SetTempoEvent(tick=0, bpm=240)])
+    for i in range(notes):
+        track.append(midi.NoteOnEvent(tick=0 if i == 0 else gap, pitch=60 + i % 12, velocity=90))
+        track.append(midi.NoteOffEvent(tick=0, pitch=60 + i % 12))
+        if i == notes // 2:
+            track.append(midi.SetTempoEvent(tick=0, bpm=480))
+    track.append(midi.EndOfTrackEvent(tick=0))
+    return midi.Pattern([track], resolution=480)
+
+class TestIterBatches(unittest.TestCase):
+    def test_batches(self):
+        pattern = make_song()
+        batches = list(midi.iter_batches(pattern, 0.002))
+        self.assertEqual(len(batches), 40)
+        self.assertTrue(all(len(batch) == 2 for offset, batch in batches))
+        # 20 gaps at 240 bpm and 19 at 480
+        self.assertAlmostEqual(batches[-1][0], 20 * 0.0125 + 19 * 0.00625)
+
+    def test_quantum(self):
+        pattern = make_song()
+        batches = list(midi.iter_batches(pattern, 0.02))
+        self.assertLess(len(batches), 40)
+        events = [event for offset, batch in batches for tick, index, event in batch]
+        self.assertEqual(len(events), 80)
+
+    def test_meta_only(self):
+        pattern = midi.Pattern([midi.Track([midi.SetTempoEvent(tick=0, bpm=100),
+                                            midi.EndOfTrackEvent(tick=10)])])
+        self.assertEqual(list(midi.iter_batches(pattern, 0.002)), [])
+
+class TestPlayer(unittest.TestCase):
+    def test_order_and_timing(self):
+        pattern = make_song()
+        sink = midi.LoopbackSink()
+        self.assertEqual(midi.play(pattern, sink), 40)
+        expected = [event for tick, index, event in pattern.iter_merged()
+                    if not isinstance(event, midi.MetaEvent)]
+        self.assertEqual([id(e) for e in sink.events()], [id(e) for e in expected])
+        for due, delivered, tick, event in sink.records:
+            self.assertGreaterEqual(delivered, due)
+
+    def test_correction_within_quantum(self):
+        player = midi.Player(make_song(), midi.LoopbackSink())
+        asyncio.run(player.play())
+        self.assertGreaterEqual(player.correction, 0.0)
+        self.assertLessEqual(player.correction, player.quantum)
+
+    def test_spin_is_bounded(self):
+        # on a clock where every sleep wakes up 0.3 ms late and a yield
+        # takes 10 us, the player only yields for the last PLAYER_SPIN
+        # seconds
+        now = [0.0]
+        yields = []
+        async def sleep(delay):
+            if delay == 0:
+                yields.append(now[0])
+                now[0] += 1e-5
+            else:
+                now[0] += delay + 0.0003
+        player = midi.Player(make_song(), midi.LoopbackSink(), clock=lambda: now[0])
+        player.correction = player.quantum
+        sleeping = asyncio.sleep
+        asyncio.sleep = sleep
+        try:
+            player.wait_until(0.01).send(None)
+        except StopIteration:
+            pass
+        finally:
+            asyncio.sleep = sleeping
+        self.assertGreaterEqual(now[0], 0.01)
+        self.assertGreater(yields[0], 0.01 - midi.PLAYER_SPIN)
+
+    def test_empty(self):
+        sink = midi.LoopbackSink()
+        self.assertEqual(midi.play(midi.Pattern(), sink), 0)
+        self.assertEqual(midi.play(midi.Pattern([midi.Track()]), sink), 0)
+        self.assertEqual(sink.records, [])
+
+    def test_stop(self):
+        player = midi.Player(make_song(), midi.LoopbackSink())
+        async def run():
+            task = asyncio.ensure_future(player.play())
+            await asyncio.sleep(0.05)
+            player.stop()
+            return await task
+        self.assertLess(asyncio.run(run()), 40)
+
+    def test_file_sink(self):
+        f = io.BytesIO()
+        midi.play(make_song(10), midi.FileSink(f))
+        pattern = midi.read_midifile(io.BytesIO(f.getvalue()))
+        notes = [e for e in pattern[0] if isinstance(e, midi.NoteEvent)]
+        self.assertEqual(len(notes), 20)
+        pattern.make_ticks_abs()
+        # one tick is a millisecond: 5 gaps of 12.5 ms and 4 of 6.25 ms
+        self.assertAlmostEqual(pattern[0][-2].tick, 87, delta=5)
+
+    def test_file_sink_empty(self):
+        f = io.BytesIO()
+        midi.play(midi.Pattern(), midi.FileSink(f))
+        pattern = midi.read_midifile(io.BytesIO(f.getvalue()))
+        self.assertEqual(len(pattern), 1)
+
+class TestSink(unittest.TestCase):
+    def test_write_is_abstract(self):
+        with self.assertRaises(TypeError):
+            midi.Sink()
+        class Quiet(midi.Sink):
+            def flush(self):
+                pass
+        with self.assertRaises(TypeError):
+            Quiet()
+
+if __name__ == '__main__':
+    unittest.main()
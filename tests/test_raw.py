@@ -0,0 +1,91 @@
+import io
+import unittest
+import python_midi as midi
+from helpers import make_pattern, midifile_bytes, event_list
+
+def write(pattern):
+    f = io.BytesIO()
+    midi.write_midifile(f, pattern)
+    return f.getvalue()
+
+def read(data, **kw):
+    return midi.read_midifile(io.BytesIO(data), **kw)
+
+class TestRawPassthrough(unittest.TestCase):
+    def setUp(self):
+        self.data = midifile_bytes(make_pattern())
+
+    def readers(self):
+        yield read(self.data, keep_raw=True)
+        yield read(self.data, lazy=True, keep_raw=True)
+
+    def test_unchanged_is_identical(self):
+        for pattern in self.readers():
+            self.assertEqual(write(pattern), self.data)
+
+    def test_raw_is_kept(self):
+        pattern = read(self.data, keep_raw=True)
+        for index in range(len(pattern)):
+            self.assertIsNotNone(pattern.raw_track(index))
+
+    def test_tempo_changed_in_place(self):
+        for pattern in self.readers():
+            pattern[0][2].bpm = 60
+            pattern = read(write(pattern))
+            self.assertEqual(pattern[0][2].mpqn, 1000000)
+
+    def test_tick_changed_in_place(self):
+        for pattern in self.readers():
+            pattern[1][3].tick += 7
+            expected = event_list(pattern)
+            self.assertEqual(event_list(read(write(pattern))), expected)
+
+    def test_channel_and_datum_changed_in_place(self):
+        for pattern in self.readers():
+            pattern[1][2].channel = 9
+            pattern[1][5].velocity = 1
+            pattern[2][0].text = 'lo'
+            expected = event_list(pattern)
+            self.assertEqual(event_list(read(write(pattern))), expected)
+
+    def test_list_change(self):
+        for pattern in self.readers():
+            del pattern[1][2:6]
+            pattern[2].insert(0, midi.TextMetaEvent(tick=0, text='x'))
+            expected = event_list(pattern)
+            self.assertEqual(event_list(read(write(pattern))), expected)
+
+    def test_only_changed_track_is_encoded(self):
+        pattern = read(self.data, lazy=True, keep_raw=True)
+        pattern[0][2].bpm = 60
+        out = write(pattern)
+        self.assertFalse(pattern.is_decoded(1))
+        self.assertEqual(out[-len(pattern.chunk(2)):], pattern.chunk(2))
+
+    def test_structural_edits(self):
+        # raw chunks follow their tracks when tracks move
+        extra = midi.Track([midi.TextMetaEvent(tick=0, text='x'), midi.EndOfTrackEvent(tick=0)])
+        for pattern in self.readers():
+            tracks = list(read(self.data))
+            del pattern[0]
+            pattern.insert(0, extra)
+            pattern.reverse()
+            pattern[0][0].text = 'lo'
+            expected = event_list([tracks[2], tracks[1], extra])
+            expected[0][0] = ('LyricsEvent',) + pattern[0][0].state()
+            out = write(pattern)
+            self.assertEqual(event_list(read(out)), expected)
+            self.assertIsNone(pattern.raw_track(0))
+            self.assertEqual(pattern.raw_track(1), read(self.data, lazy=True).chunk(1))
+
+    def test_stream_writer(self):
+        pattern = read(self.data, keep_raw=True)
+        pattern[1][5].velocity = 1
+        f = io.BytesIO()
+        with midi.StreamWriter(f, resolution=pattern.resolution) as writer:
+            for track in pattern:
+                writer.add_track(track)
+        self.assertEqual(event_list(read(f.getvalue())), event_list(pattern))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import gc
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+import python_midi as midi
+from helpers import make_pattern, midifile_bytes, event_list
+
+def abs_events(events):
+    # (absolute tick, type name, state without the tick) of relative events
+    tick = 0
+    result = []
+    for event in events:
+        tick += event.tick
+        result.append((tick, type(event).__name__) + event.state()[1:])
+    return result
+
+class TestReaders(unittest.TestCase):
+    # every reader decodes the same events as read_midifile
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data = midifile_bytes(make_pattern())
+        self.path = os.path.join(self.tmp, 'song.mid')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+        self.pattern = midi.read_midifile(io.BytesIO(self.data))
+        self.expected = event_list(self.pattern)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_mmap(self):
+        self.assertEqual(event_list(midi.read_midifile(self.path, use_mmap=True)), self.expected)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(event_list(midi.read_midifile(f, use_mmap=True)), self.expected)
+        # no file descriptor to map
+        pattern = midi.read_midifile(io.BytesIO(self.data), use_mmap=True)
+        self.assertEqual(event_list(pattern), self.expected)
+        self.assertEqual(pattern.resolution, self.pattern.resolution)
+
+    def test_path_is_closed(self):
+        for kw in ({}, {'use_mmap': True}, {'parallel': 'thread'}, {'lazy': True}):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                pattern = midi.read_midifile(self.path, **kw)
+                gc.collect()
+            self.assertEqual([w for w in caught if w.category is ResourceWarning], [], kw)
+            self.assertEqual(event_list(pattern), self.expected)
+
+    def test_lazy(self):
+        pattern = midi.read_midifile(self.path, lazy=True)
+        self.assertEqual(len(pattern), len(self.pattern))
+        self.assertEqual(pattern.track_names(1), ('piano', None))
+        self.assertFalse(any(pattern.is_decoded(i) for i in range(len(pattern))))
+        self.assertEqual(event_list([pattern[2]]), self.expected[2:])
+        self.assertFalse(pattern.is_decoded(1))
+        self.assertEqual(event_list(pattern), self.expected)
+
+    def test_lazy_structural_edits(self):
+        extra = midi.Track([midi.TrackNameEvent(tick=0, text='extra'),
+                            midi.EndOfTrackEvent(tick=0)])
+        pattern = midi.read_midifile(self.path, lazy=True)
+        del pattern[0]
+        pattern.insert(1, extra)
+        pattern.reverse()
+        pattern.append(pattern.pop(0))
+        # words, extra, piano became extra, piano, words
+        self.assertEqual([pattern.track_names(i)[0] for i in range(3)], ['extra', 'piano', None])
+        self.assertFalse(pattern.is_decoded(1))
+        expected = [event_list([extra])[0]] + self.expected[1:]
+        self.assertEqual(event_list(pattern), expected)
+        f = io.BytesIO()
+        midi.write_midifile(f, pattern)
+        self.assertEqual(event_list(midi.read_midifile(io.BytesIO(f.getvalue()))), expected)
+
+    def test_streaming(self):
+        # small blocks put events across block boundaries
+        for blocksize in (1, 7, 64, midi.STREAM_BLOCKSIZE):
+            stream = midi.iter_midifile(io.BytesIO(self.data), blocksize)
+            self.assertEqual((stream.format, stream.resolution, stream.ntracks),
+                             (self.pattern.format, self.pattern.resolution, len(self.pattern)))
+            tracks = [list(events) for index, events in stream.tracks()]
+            self.assertEqual(event_list(tracks), self.expected)
+        with open(self.path, 'rb') as f:
+            pairs = list(midi.iter_midifile(f))
+        self.assertEqual([index for index, event in pairs],
+                         [index for index, track in enumerate(self.pattern) for event in track])
+
+    def test_parallel(self):
+        pattern = midi.read_midifile(self.path, parallel='thread', workers=2)
+        self.assertEqual(event_list(pattern), self.expected)
+        self.assertEqual((pattern.format, pattern.resolution),
+                         (self.pattern.format, self.pattern.resolution))
+        for parallel in ('process', 'fibre'):
+            with self.assertRaises(ValueError):
+                midi.read_midifile(self.path, parallel=parallel)
+
+    def test_keep(self):
+        # skipped events hand their ticks on, so the kept ones stay where
+        # they were; the end of track is always kept
+        keep = {midi.NoteOnEvent, midi.SetTempoEvent, 0xF0}
+        names = {'NoteOnEvent', 'SetTempoEvent', 'SysexEvent', 'EndOfTrackEvent'}
+        expected = [[event for event in abs_events(track) if event[1] in names]
+                    for track in self.pattern]
+        patterns = [midi.read_midifile(self.path, keep=keep),
+                    midi.read_midifile(self.path, use_mmap=True, keep=keep),
+                    midi.read_midifile(self.path, lazy=True, keep=keep),
+                    midi.read_midifile(self.path, parallel='thread', keep=keep),
+                    midi.read_midifile_columnar(self.path).to_pattern(keep)]
+        with open(self.path, 'rb') as f:
+            patterns.append([list(events) for index, events in
+                             midi.iter_midifile(f, 16, keep=keep).tracks()])
+        for pattern in patterns:
+            self.assertEqual([abs_events(track) for track in pattern], expected)
+
+class Pipe(io.BytesIO):
+    # a stream that cannot seek back, like a pipe or a socket
+    def seekable(self):
+        return False
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pattern = make_pattern()
+        self.data = midifile_bytes(self.pattern)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self, data):
+        return midi.read_midifile(io.BytesIO(data))
+
+    def test_round_trip(self):
+        self.assertEqual(event_list(self.read(self.data)), event_list(self.pattern))
+        self.assertEqual(midifile_bytes(self.read(self.data)), self.data)
+
+    def test_ticks_made_relative_again(self):
+        pattern = self.read(self.data)
+        pattern.make_ticks_abs()
+        pattern.make_ticks_rel()
+        self.assertEqual(midifile_bytes(pattern), self.data)
+
+    def test_write_midifiles(self):
+        parts = [midi.Pattern([track], resolution=self.pattern.resolution) for track in self.pattern]
+        files = [io.BytesIO(), os.path.join(self.tmp, 'part1.mid'), io.BytesIO()]
+        midi.write_midifiles(zip(files, parts))
+        with open(files[1], 'rb') as f:
+            written = [files[0].getvalue(), f.read(), files[2].getvalue()]
+        self.assertEqual(written, [midifile_bytes(part) for part in parts])
+
+    def stream(self, midifile, **kw):
+        with midi.StreamWriter(midifile, resolution=self.pattern.resolution, **kw) as writer:
+            for track in self.pattern:
+                writer.add_track(track)
+        return midifile
+
+    def test_stream_writer(self):
+        self.assertEqual(self.stream(io.BytesIO()).getvalue(), self.data)
+        self.assertEqual(self.stream(Pipe()).getvalue(), self.data)
+        self.assertEqual(self.stream(Pipe(), ntracks=len(self.pattern)).getvalue(), self.data)
+        path = os.path.join(self.tmp, 'streamed.mid')
+        self.stream(path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_stream_writer_events(self):
+        # event by event with absolute ticks, without end of track events
+        f = io.BytesIO()
+        with midi.StreamWriter(f, resolution=self.pattern.resolution, tick_relative=False) as writer:
+            for track in self.pattern:
+                writer.begin_track()
+                tick = 0
+                for event in track[:-1]:
+                    tick += event.tick
+                    writer.write_event(event.with_tick(tick))
+        self.assertEqual([abs_events(track)[:-1] for track in self.read(f.getvalue())],
+                         [abs_events(track)[:-1] for track in self.pattern])
+        with self.assertRaises(ValueError):
+            with midi.StreamWriter(io.BytesIO(), tick_relative=False) as writer:
+                writer.write_event(midi.NoteOnEvent(tick=10))
+                writer.write_event(midi.NoteOnEvent(tick=5))
+
+    def test_stream_writer_track_count(self):
+        with self.assertRaises(ValueError):
+            self.stream(Pipe(), ntracks=len(self.pattern) + 1)
+
+if __name__ == '__main__':
+    unittest.main()
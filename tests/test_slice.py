@@ -0,0 +1,57 @@
+import random
+from itertools import accumulate
+import unittest
+import python_midi as midi
+
+def make_track(ticks, tick_relative=True):
+    return midi.Track([midi.NoteOnEvent(tick=tick, pitch=60, velocity=1) for tick in ticks],
+                      tick_relative=tick_relative)
+
+class TestSliceTicks(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.deltas = [rng.choice((0, 0, 5, 120, 480)) for i in range(500)]
+        self.ticks = list(accumulate(self.deltas))
+
+    def brute_force(self, start, end):
+        return [i for i, tick in enumerate(self.ticks) if start <= tick < end]
+
+    def test_relative(self):
+        track = make_track(self.deltas)
+        for start, end in ((0, 1), (100, 5000), (5000, 100), (0, 10 ** 9), (481, 482)):
+            part = track.slice_ticks(start, end)
+            self.assertEqual([id(e) for e in part],
+                             [id(track[i]) for i in self.brute_force(start, end)])
+            self.assertTrue(part.tick_relative)
+
+    def test_absolute(self):
+        track = make_track(self.ticks, tick_relative=False)
+        part = track.slice_ticks(1000, 20000)
+        self.assertFalse(part.tick_relative)
+        self.assertEqual(list(part.abs_ticks()),
+                         [self.ticks[i] for i in self.brute_force(1000, 20000)])
+
+    def test_slices_keep_tick_relative(self):
+        track = make_track([20005, 20010, 40010], tick_relative=False)
+        self.assertEqual(list(track[1:].abs_ticks()), [20010, 40010])
+        pattern = midi.Pattern([track], tick_relative=False)
+        self.assertFalse(pattern[:1].tick_relative)
+
+    def test_changes(self):
+        track = make_track(self.ticks, tick_relative=False)
+        track.slice_ticks(0, 100)
+        track.append(midi.NoteOnEvent(tick=10 ** 8, pitch=60, velocity=1))
+        self.assertEqual(len(track.slice_ticks(10 ** 8, 10 ** 8 + 1)), 1)
+
+class TestMidiTrackSliceTicks(unittest.TestCase):
+    def test_notes(self):
+        from lib.miditrack import MidiTrack, MidiNote
+        mt = MidiTrack.instance_for('slice test', None, False)
+        mt.add_notes([MidiNote(mt, 60, 90, tick, 10) for tick in range(0, 1000, 7)], {})
+        self.assertEqual([n.at_tick for n in mt.slice_ticks(100, 200)],
+                         list(range(105, 200, 7)))
+        mt.set_note_state([(60, 90, 3, 10, False)])
+        self.assertEqual(len(mt.slice_ticks(0, 5)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
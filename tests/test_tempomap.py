@@ -0,0 +1,86 @@
+import io
+import random
+import unittest
+import python_midi as midi
+from lib.midipiece import MidiPiece
+from helpers import midifile_bytes
+
+def brute_tick2us(tempos, resolution, tick):
+    # sum the length of every tick up to tick, under the tempo in force
+    changes = dict(tempos)
+    mpqn = midi.DEFAULT_MPQN
+    us = 0.0
+    for t in range(tick):
+        mpqn = changes.get(t, mpqn)
+        us += mpqn / float(resolution)
+    return us
+
+class TestTempoMap(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.resolution = 96
+        self.tempos = sorted({rng.randrange(1, 2000): rng.randrange(200000, 1500000)
+                              for i in range(12)}.items())
+        self.tempomap = midi.TempoMap(midi.Pattern(resolution=self.resolution),
+                                      [midi.SetTempoEvent(tick=tick, mpqn=mpqn)
+                                       for tick, mpqn in self.tempos])
+        self.ticks = [0, 1, 95, 96] + [tick for tick, mpqn in self.tempos] + \
+            [rng.randrange(0, 2500) for i in range(200)]
+
+    def test_tick2us(self):
+        for tick in self.ticks:
+            self.assertAlmostEqual(self.tempomap.tick2us(tick),
+                                   brute_tick2us(self.tempos, self.resolution, tick), places=3)
+
+    def test_ticks2us(self):
+        times = self.tempomap.ticks2us(self.ticks)
+        for tick, us in zip(self.ticks, times):
+            self.assertAlmostEqual(float(us), self.tempomap.tick2us(tick), places=6)
+
+    def test_us2tick_round_trip(self):
+        times = [self.tempomap.tick2us(tick) for tick in self.ticks]
+        for tick, us in zip(self.ticks, times):
+            self.assertAlmostEqual(self.tempomap.us2tick(us), tick, places=6)
+        for tick, back in zip(self.ticks, self.tempomap.us2ticks(times)):
+            self.assertAlmostEqual(float(back), tick, places=6)
+
+    def test_added_out_of_order(self):
+        tempomap = midi.TempoMap(midi.Pattern(resolution=self.resolution))
+        for tick, mpqn in reversed(self.tempos):
+            tempomap.add(midi.SetTempoEvent(tick=tick, mpqn=mpqn))
+        for tick in self.ticks:
+            self.assertEqual(tempomap.tick2us(tick), self.tempomap.tick2us(tick))
+
+    def test_from_pattern(self):
+        pattern = midi.Pattern(resolution=self.resolution, tick_relative=False)
+        pattern.append(midi.Track([midi.SetTempoEvent(tick=tick, mpqn=mpqn)
+                                   for tick, mpqn in self.tempos], tick_relative=False))
+        tempomap = midi.TempoMap.from_pattern(pattern)
+        for tick in self.ticks:
+            self.assertEqual(tempomap.tick2us(tick), self.tempomap.tick2us(tick))
+
+class TestNoteTimes(unittest.TestCase):
+    def test_duration_across_tempo_change(self):
+        # a whole note from the second beat at 120 bpm, which changes
+        # to 60 bpm after its first beat
+        conductor = midi.Track([
+            midi.SetTempoEvent(tick=0, bpm=120),
+            midi.SetTempoEvent(tick=200, bpm=60),
+            midi.EndOfTrackEvent(tick=0),
+        ])
+        track = midi.Track([
+            midi.NoteOnEvent(tick=100, pitch=60, velocity=90),
+            midi.NoteOffEvent(tick=400, pitch=60),
+            midi.EndOfTrackEvent(tick=0),
+        ])
+        pattern = midi.Pattern([conductor, track], resolution=100)
+        piece = MidiPiece(io.BytesIO(midifile_bytes(pattern)), False)
+        table = piece.note_table()
+        self.assertEqual(table['us'], [500000.0])
+        self.assertEqual(table['duration_us'], [3500000.0])
+        note = piece.tracks[list(piece.tracks)[0]].notes[0]
+        note.set_us(piece.tick2us)
+        self.assertEqual(note.duration_us, 3500000.0)
+
+if __name__ == '__main__':
+    unittest.main()
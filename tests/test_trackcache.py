@@ -0,0 +1,91 @@
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+import python_midi as midi
+import python_midi.cache
+from lib.trackcache import TrackCache
+from helpers import make_pattern
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestMidi2lyCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmp, 'cache')
+        self.song = os.path.join(self.tmp, 'song.mid')
+        self.pattern = make_pattern(notes=120, resolution=96)
+        # notes off the 1/32 grid, so trimming has work to do
+        self.pattern[1][5].tick += 1
+        midi.write_midifile(self.song, self.pattern)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def midi2ly(self, *args):
+        result = subprocess.run([sys.executable, 'midi2ly.py'] + list(args) + [self.song],
+                                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(result.returncode, 0, result.stderr.decode())
+        return result.stdout
+
+    def entries(self):
+        return set(os.listdir(os.path.join(self.cache, 'tracks')))
+
+    def test_miss_and_hit(self):
+        plain = self.midi2ly()
+        self.assertIn(b'% trim note', plain)
+        self.assertEqual(self.midi2ly('-C', self.cache), plain)
+        cold = self.entries()
+        # per track: the paired notes, then the trim and bars steps
+        self.assertEqual(len(cold), 3 * 3)
+        self.assertEqual(self.midi2ly('-C', self.cache), plain)
+        self.assertEqual(self.entries(), cold)
+
+    def test_changed_track(self):
+        self.midi2ly('-C', self.cache)
+        cold = self.entries()
+        self.pattern[1][9].velocity = 3
+        midi.write_midifile(self.song, self.pattern)
+        self.assertEqual(self.midi2ly('-C', self.cache), self.midi2ly())
+        # only the changed track is paired, trimmed and split at the
+        # bars again
+        added = self.entries() - cold
+        self.assertEqual(len(added), 3)
+
+    def test_selected_tracks(self):
+        args = ('-t', 'Song', '-P', '2', '-D', '3', '--')
+        plain = self.midi2ly(*args)
+        self.assertIn(b"TrackB = {\n  \\numericTimeSignature\\time 4/4  e,32 r16 f,32 r16.", plain)
+        self.assertIn(b"TrackC = \\drummode{\n \\numericTimeSignature\\time 4/4  r1  |", plain)
+        self.assertEqual(self.midi2ly('-C', self.cache, *args), plain)
+        cold = self.entries()
+        # the bars of the two selected tracks are rendered once
+        self.assertEqual(len(cold), 3 * 3 + 2)
+        self.assertEqual(self.midi2ly('-C', self.cache, *args), plain)
+        self.assertEqual(self.entries(), cold)
+        # drum names instead of pitches are a different result
+        self.midi2ly('-C', self.cache, '-t', 'Song', '-P', '2', '-V', '3', '--')
+        self.assertEqual(len(self.entries() - cold), 1)
+
+class TestTrackCache(unittest.TestCase):
+    def test_without_numpy(self):
+        tmp = tempfile.mkdtemp()
+        np = python_midi.cache.np
+        try:
+            python_midi.cache.np = None
+            with self.assertRaises(ImportError):
+                midi.PatternCache(tmp)
+            cache = TrackCache(tmp)
+            cache.store('a', {'log': '', 'notes': []})
+            self.assertEqual(cache.load('a'), {'log': '', 'notes': []})
+            # a track cache holds JSON, not decoded MIDI files
+            self.assertNotIsInstance(cache, midi.PatternCache)
+            self.assertFalse(hasattr(cache, 'read_midifile'))
+        finally:
+            python_midi.cache.np = np
+            shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    unittest.main()